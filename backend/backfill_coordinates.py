@@ -0,0 +1,118 @@
+"""
+Backfill users.latitude / users.longitude from users.location
+
+Walks users whose location has not been geocoded yet (see the
+"Precomputed coordinates" section of database/schema.sql) in batches,
+geocodes each distinct location once, and writes the coordinates back with
+one update per location. Upstream geocoding calls are rate limited so the
+job stays well inside Open-Meteo's free-tier limits.
+
+Usage:
+    cd backend
+    python backfill_coordinates.py --batch-size 200 --rate 2 [--dry-run]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+import main
+
+
+class RateLimiter:
+    """Allow at most `rate` calls per second (simple fixed spacing)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_at = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        if self._next_at > now:
+            await asyncio.sleep(self._next_at - now)
+        self._next_at = max(now, self._next_at) + self.interval
+
+
+async def fetch_pending_batch(after_id: str, batch_size: int) -> List[Dict]:
+    """Next page of users with an un-geocoded location (keyset paged by id)"""
+    query = (
+        main.supabase.table("users")
+        .select("id, location")
+        .not_.is_("location", "null")
+        .is_("location_geocoded", "null")
+        .order("id")
+        .limit(batch_size)
+    )
+    if after_id:
+        query = query.gt("id", after_id)
+    result = await main.run_db(query)
+    return result.data or []
+
+
+async def backfill(batch_size: int, rate: float, dry_run: bool):
+    if not main.supabase:
+        print("❌ Supabase is not configured (SUPABASE_URL / SUPABASE_KEY)")
+        return
+
+    limiter = RateLimiter(rate)
+    totals = {"users": 0, "resolved": 0, "unknown": 0, "failed": 0, "geocoder_calls": 0}
+    after_id = ""
+
+    while True:
+        users = await fetch_pending_batch(after_id, batch_size)
+        if not users:
+            break
+        after_id = users[-1]["id"]
+
+        # Group by location so shared village names are geocoded once
+        by_location: Dict[str, List[str]] = {}
+        for user in users:
+            by_location.setdefault(user["location"], []).append(user["id"])
+
+        for location, user_ids in by_location.items():
+            key = location.strip().lower()
+            if key not in main.geocode_cache:
+                await limiter.wait()
+                totals["geocoder_calls"] += 1
+
+            try:
+                coords = await main.geocode_location(location)
+            except Exception as e:
+                # Transient failure: leave the rows for the next run
+                print(f"⚠️  Geocoding failed for '{location}': {e}")
+                totals["failed"] += len(user_ids)
+                continue
+
+            totals["users"] += len(user_ids)
+            totals["resolved" if coords else "unknown"] += len(user_ids)
+
+            if dry_run:
+                continue
+
+            await main.run_db(
+                main.supabase.table("users").update({
+                    "latitude": coords[0] if coords else None,
+                    "longitude": coords[1] if coords else None,
+                    "location_geocoded": location
+                }).in_("id", user_ids)
+            )
+
+        print(
+            f"Processed {totals['users']} users "
+            f"({totals['resolved']} resolved, {totals['unknown']} unknown, "
+            f"{totals['geocoder_calls']} geocoder calls)"
+        )
+
+    print(f"✅ Backfill complete{' (dry run)' if dry_run else ''}: {totals}")
+    await main.http_clients.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocode users.location into latitude/longitude")
+    parser.add_argument("--batch-size", type=int, default=200, help="Users fetched per page")
+    parser.add_argument("--rate", type=float, default=2.0, help="Max geocoder requests per second")
+    parser.add_argument("--dry-run", action="store_true", help="Geocode but don't write to the database")
+    args = parser.parse_args()
+
+    asyncio.run(backfill(args.batch_size, args.rate, args.dry_run))
@@ -0,0 +1,148 @@
+"""
+Concurrency benchmark for the Supabase data layer
+
+Simulates N farmers messaging at once against a fake Supabase client whose
+`.execute()` blocks for DB_LATENCY seconds (like a real network round trip),
+and reports webhook latency percentiles for:
+
+- blocking: queries executed directly on the event loop (old behaviour)
+- pooled:   queries executed through run_db() on the DB thread pool
+
+Both modes do the same queries per message: the user cache and sessions
+are cleared before every run, and diagnoses are inserted directly rather
+than through the write-behind buffer.
+
+Usage:
+    cd backend && python benchmarks/bench_db_concurrency.py
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+
+DB_LATENCY = float(os.getenv("BENCH_DB_LATENCY", "0.05"))
+CONCURRENCY_LEVELS = [1, 5, 10, 25, 50]
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Chainable stand-in for a PostgREST request builder"""
+
+    def __init__(self, table: str):
+        self.table = table
+        self.filters = {}
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def insert(self, row):
+        return self
+
+    def update(self, values):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def execute(self):
+        time.sleep(DB_LATENCY)
+        if self.table == "users" and "phone" in self.filters:
+            phone = self.filters["phone"]
+            return FakeResponse([{"id": f"user-{phone}", "phone": phone, "primary_crop": "tomato"}])
+        return FakeResponse([{"id": "row"}], count=1)
+
+
+class FakeSupabase:
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(name)
+
+
+async def run_blocking(query):
+    """Old behaviour: the blocking call runs on the event loop"""
+    return query.execute()
+
+
+def make_webhook(phone: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {"messages": [{
+            "id": f"wamid.{uuid.uuid4().hex}",
+            "from": phone,
+            "type": "text",
+            "text": {"body": "tomato leaves are yellow"}
+        }]}}]}]
+    }
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def save_diagnosis_directly(user_id: str, diagnosis: dict) -> str:
+    """save_diagnosis without the write-behind buffer: one insert per diagnosis"""
+    diagnosis_id = str(uuid.uuid4())
+    await main.run_db(main.supabase.table("diagnoses").insert({"id": diagnosis_id, "user_id": user_id}))
+    return diagnosis_id
+
+
+async def measure(concurrency: int) -> list:
+    async def one(i: int) -> float:
+        start = time.perf_counter()
+        await main.process_whatsapp_webhook(make_webhook(f"+2547000{i:05d}"))
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*(one(i) for i in range(concurrency)))
+
+
+async def run_mode(name: str, runner) -> None:
+    main.run_db = runner
+    print(f"\n[{name}]")
+    print(f"{'concurrent':>10} | {'p50 (ms)':>9} | {'p99 (ms)':>9}")
+    for concurrency in CONCURRENCY_LEVELS:
+        # Every run starts cold, so no mode reuses users cached by another
+        main.user_cache.clear()
+        main.session_store.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies = await measure(concurrency)
+        print(
+            f"{concurrency:>10} | {percentile(latencies, 50) * 1000:>9.1f} | "
+            f"{percentile(latencies, 99) * 1000:>9.1f}"
+        )
+
+
+async def bench():
+    main.logger.setLevel("CRITICAL")
+    main.supabase = FakeSupabase()
+    main.save_diagnosis = save_diagnosis_directly
+    pooled = main.run_db
+
+    print(f"Fake DB latency: {DB_LATENCY * 1000:.0f} ms per query, "
+          f"DB_MAX_WORKERS={main.DB_MAX_WORKERS}")
+    await run_mode("blocking (event loop)", run_blocking)
+    await run_mode("pooled (run_db)", pooled)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
@@ -0,0 +1,77 @@
+"""
+Token cost of the compact Groq prompt vs the previous single-message prompt
+
+For a set of sample observations, estimates the tokens each call reserves
+against the free-tier tokens-per-minute limit (prompt + max_tokens) and how
+many diagnoses per minute that allows.
+
+Usage:
+    cd backend && python benchmarks/bench_prompt_tokens.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from prompt_builder import PromptBuilder, estimate_tokens  # noqa: E402
+
+TOKENS_PER_MINUTE = 6000
+LEGACY_MAX_TOKENS = 500
+
+WEATHER = {
+    "current_weather": {"temperature": 27.5, "windspeed": 12.0},
+    "daily": {"precipitation_sum": [3.2]},
+}
+
+SAMPLES = [
+    ("tomato", "Leaves are turning yellow"),
+    ("maize", "I see small holes in the leaves and some caterpillars inside the funnel"),
+    ("beans", "Brown spots on leaves and the plants are wilting after the rains"),
+    ("cassava", "My cassava is not growing well. " * 40 + "What should I do?"),
+]
+
+
+def legacy_prompt(crop: str, observations: str, location: str, weather) -> str:
+    cw = weather["current_weather"]
+    weather_info = f"\nCurrent weather: {cw.get('temperature', 'N/A')}°C, Wind: {cw.get('windspeed', 'N/A')} km/h"
+    return f"""You are an expert agricultural advisor. Analyze this farmer's situation and provide actionable advice.
+
+Crop: {crop}
+Location: {location}
+Farmer's observation: {observations}{weather_info}
+
+Provide a diagnosis in this exact JSON format:
+{{
+    "crop": "{crop}",
+    "issue": "brief description of the problem",
+    "confidence": 75,
+    "recommendation": "specific action to take",
+    "risk": "low/medium/high",
+    "method": "ai"
+}}
+
+Be specific and practical. Focus on low-cost solutions."""
+
+
+def main():
+    builder = PromptBuilder()
+    print(f"{'crop':>8} | {'legacy reserve':>14} | {'new reserve':>11} | {'new prompt':>10}")
+
+    legacy_total = new_total = 0
+    for crop, observations in SAMPLES:
+        legacy = estimate_tokens(legacy_prompt(crop, observations, "Nakuru", WEATHER)) + LEGACY_MAX_TOKENS
+        _, prompt_tokens = builder.build(crop, observations, "Nakuru", WEATHER)
+        new = prompt_tokens + builder.max_tokens(crop, "unknown")
+        legacy_total += legacy
+        new_total += new
+        print(f"{crop:>8} | {legacy:>14} | {new:>11} | {prompt_tokens:>10}")
+
+    legacy_avg = legacy_total / len(SAMPLES)
+    new_avg = new_total / len(SAMPLES)
+    print(f"\nDiagnoses/minute at {TOKENS_PER_MINUTE} TPM (reserved tokens): "
+          f"legacy {TOKENS_PER_MINUTE / legacy_avg:.1f}, new {TOKENS_PER_MINUTE / new_avg:.1f}")
+
+
+if __name__ == "__main__":
+    main()
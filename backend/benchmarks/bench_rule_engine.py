@@ -0,0 +1,83 @@
+"""
+Micro-benchmark for the compiled rule engine
+
+Builds synthetic rule sets of increasing size and compares the compiled
+word-trie matcher (rule_engine.RuleEngine) against the previous approach of
+scanning the text once per rule with `any(word in text ...)`.
+
+Usage:
+    cd backend && python benchmarks/bench_rule_engine.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rule_engine import Rule, RuleEngine  # noqa: E402
+
+RULE_COUNTS = [5, 100, 1000, 5000]
+TEXTS_PER_RUN = 2000
+random.seed(42)
+
+VOCABULARY = [f"symptom{i}" for i in range(20000)]
+FILLER = "my tomato plants in the field have been looking bad since the rains started".split()
+
+
+def make_rules(count: int):
+    rules = []
+    for i in range(count):
+        groups = [random.sample(VOCABULARY, 3) for _ in range(random.choice([1, 2]))]
+        rules.append(Rule(
+            id=f"rule{i}", issue=f"Issue {i}", confidence=random.randint(40, 90),
+            recommendation="Do something", risk="medium", require=groups,
+        ))
+    return rules
+
+
+def make_texts(rules, count: int):
+    texts = []
+    for _ in range(count):
+        words = list(FILLER)
+        for rule in random.sample(rules, min(2, len(rules))):
+            words.extend(random.choice(group) for group in rule.require)
+        random.shuffle(words)
+        texts.append(" ".join(words))
+    return texts
+
+
+def naive_match(rules, text: str):
+    """The old approach: rescan the text for every keyword group of every rule"""
+    lowered = text.lower()
+    return [
+        rule for rule in rules
+        if all(any(word in lowered for word in group) for group in rule.require)
+    ]
+
+
+def timed(func, texts):
+    start = time.perf_counter()
+    for text in texts:
+        func(text)
+    return (time.perf_counter() - start) / len(texts) * 1e6
+
+
+def main():
+    print(f"{'rules':>6} | {'compile (ms)':>12} | {'compiled (us/text)':>18} | {'naive (us/text)':>15}")
+    for count in RULE_COUNTS:
+        rules = make_rules(count)
+        texts = make_texts(rules, TEXTS_PER_RUN)
+
+        start = time.perf_counter()
+        engine = RuleEngine(rules)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        compiled_us = timed(engine.match, texts)
+        naive_us = timed(lambda text: naive_match(rules, text), texts[:200])
+        print(f"{count:>6} | {compile_ms:>12.1f} | {compiled_us:>18.1f} | {naive_us:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Database round trips per message with and without the user cache
+
+Replays a stream of WhatsApp messages (returning farmers plus some new
+numbers going through onboarding) through handle_whatsapp_message against
+a fake Supabase client that counts queries per table. Sessions are made to
+expire immediately so only the user cache is measured.
+
+Usage:
+    cd backend && python benchmarks/bench_user_cache.py
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from sessions import SessionStore  # noqa: E402
+
+MESSAGES = 1000
+FARMERS = 150
+NEW_NUMBERS = 30
+random.seed(7)
+
+queries: Counter = Counter()
+registered = {f"+2547{i:08d}" for i in range(FARMERS)}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, table: str):
+        self.table = table
+        self.filters = {}
+        self.row = None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def insert(self, row, **kwargs):
+        self.row = row
+        return self
+
+    def upsert(self, rows, **kwargs):
+        return self
+
+    def update(self, values):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def execute(self):
+        queries[self.table] += 1
+        if self.table == "users" and self.row is not None:
+            registered.add(self.row["phone"])
+            return FakeResponse([{"id": f"user-{self.row['phone']}", **self.row}])
+        if self.table == "users" and "phone" in self.filters:
+            phone = self.filters["phone"]
+            if phone not in registered:
+                return FakeResponse([])
+            return FakeResponse([{"id": f"user-{phone}", "phone": phone, "primary_crop": "tomato"}])
+        return FakeResponse([])
+
+
+class FakeSupabase:
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(name)
+
+
+def message_stream():
+    phones = [f"+2547{i:08d}" for i in range(FARMERS)]
+    stream = [random.choice(phones) for _ in range(MESSAGES - 2 * NEW_NUMBERS)]
+    # New numbers: onboarding message, then their first question
+    for i in range(NEW_NUMBERS):
+        phone = f"+2548{i:08d}"
+        position = random.randrange(len(stream) + 1)
+        stream[position:position] = [phone, phone]
+    return stream
+
+
+async def replay(name: str, cache_size: int):
+    main.user_cache = TTLCache(max_size=cache_size, ttl=main.USER_CACHE_TTL_SECONDS)
+    main.session_store = SessionStore(ttl=0)
+    queries.clear()
+    registered.difference_update({phone for phone in registered if phone.startswith("+2548")})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for phone in message_stream():
+            await main.handle_whatsapp_message(
+                {"from": phone, "type": "text", "text": {"body": "tomato leaves are yellow"}}
+            )
+
+    total = sum(queries.values())
+    print(f"{name:<12} {total / MESSAGES:5.2f} queries/message | "
+          f"users: {queries['users']:4d} | user cache hit rate {main.user_cache.hit_rate:.0%}")
+
+
+async def bench():
+    main.logger.setLevel("CRITICAL")
+    main.supabase = FakeSupabase()
+
+    async def no_op_send(to, message):
+        return True
+
+    main.send_whatsapp_message = no_op_send
+    print(f"{MESSAGES} messages, {FARMERS} farmers, {NEW_NUMBERS} new numbers")
+    await replay("no cache:", 0)
+    await replay("user cache:", main.USER_CACHE_SIZE)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
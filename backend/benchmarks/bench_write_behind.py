@@ -0,0 +1,96 @@
+"""
+Insert throughput: one round trip per row vs the write-behind buffer
+
+Simulates farmers' messages each saving one diagnosis against a fake
+database whose inserts cost DB_LATENCY per round trip plus ROW_COST per
+row, and reports message throughput, how long the handler waits on the
+save, and database round trips:
+
+- direct:       await one single-row insert per message (old behaviour)
+- write-behind: WriteBehindBuffer.add() + bulk inserts in the background
+
+Usage:
+    cd backend && python benchmarks/bench_write_behind.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from write_behind import WriteBehindBuffer  # noqa: E402
+
+DB_LATENCY = float(os.getenv("BENCH_DB_LATENCY", "0.02"))
+ROW_COST = 0.00005
+# Time each simulated message spends on everything else (AI, sending the reply)
+OTHER_WORK = 0.005
+MESSAGES = 2000
+CONCURRENCY = 8
+
+db = {"round_trips": 0, "busy": 0.0}
+
+
+async def fake_insert(table, rows):
+    cost = DB_LATENCY + ROW_COST * len(rows)
+    db["round_trips"] += 1
+    db["busy"] += cost
+    await asyncio.sleep(cost)
+
+
+def row():
+    return {"id": str(uuid.uuid4()), "issue": "Nitrogen deficiency", "confidence": 70}
+
+
+async def run(save) -> list:
+    waits = []
+    queue = asyncio.Queue()
+    for _ in range(MESSAGES):
+        queue.put_nowait(row())
+
+    async def worker():
+        while not queue.empty():
+            item = queue.get_nowait()
+            await asyncio.sleep(OTHER_WORK)
+            start = time.perf_counter()
+            await save(item)
+            waits.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return waits
+
+
+def report(name: str, elapsed: float, waits: list):
+    print(f"{name:<13} {MESSAGES / elapsed:7.0f} msgs/s | "
+          f"save wait {sum(waits) / len(waits) * 1000:6.2f} ms | "
+          f"{db['round_trips']:5d} round trips | "
+          f"{MESSAGES / db['busy']:7.0f} rows per DB-second")
+    db["round_trips"], db["busy"] = 0, 0.0
+
+
+async def main():
+    start = time.perf_counter()
+    waits = await run(lambda item: fake_insert("diagnoses", [item]))
+    report("direct:", time.perf_counter() - start, waits)
+
+    buffer = WriteBehindBuffer(
+        fake_insert, ["diagnoses"], Path(tempfile.mkdtemp()) / "spill.jsonl",
+        batch_size=100, flush_interval=0.25,
+    )
+    await buffer.start()
+
+    async def add(item):
+        buffer.add("diagnoses", item)
+
+    start = time.perf_counter()
+    waits = await run(add)
+    await buffer.stop()
+    report("write-behind:", time.perf_counter() - start, waits)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Concurrency check for referral counting against a real Supabase database
+
+Creates a throwaway referrer, redeems its code N times concurrently (through
+the DB thread pool, so the requests really overlap) and checks the stored
+count is exactly N. With --legacy the old select-then-update sequence is run
+the same way for comparison; it usually loses updates.
+
+Needs SUPABASE_URL / SUPABASE_KEY and the redeem_referral function from
+database/schema.sql. The test user is deleted afterwards. The automated
+version against a local Postgres is tests/test_referral_concurrency.py.
+
+Usage:
+    cd backend && python benchmarks/check_referral_concurrency.py --redemptions 50 [--legacy]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+
+
+async def redeem_atomic(code: str, i: int):
+    await main.run_db(main.supabase.rpc("redeem_referral", {
+        "code": code,
+        "referred_phone": f"+999{i:07d}"
+    }))
+
+
+async def redeem_legacy(code: str, i: int):
+    """The previous read-modify-write version of handle_referral"""
+    result = await main.run_db(
+        main.supabase.table("users").select("id, referrals").eq("referral_code", code)
+    )
+    referrer = result.data[0]
+    await main.run_db(main.supabase.table("users").update({
+        "referrals": referrer.get("referrals", 0) + 1
+    }).eq("id", referrer["id"]))
+
+
+async def check(redemptions: int, legacy: bool) -> bool:
+    code = f"T{uuid.uuid4().hex[:7].upper()}"
+    created = await main.run_db(main.supabase.table("users").insert({
+        "phone": f"+test-{uuid.uuid4().hex[:12]}",
+        "name": "Referral check",
+        "referral_code": code,
+        "referrals": 0
+    }))
+    user_id = created.data[0]["id"]
+
+    try:
+        redeem = redeem_legacy if legacy else redeem_atomic
+        await asyncio.gather(*(redeem(code, i) for i in range(redemptions)))
+
+        result = await main.run_db(
+            main.supabase.table("users").select("referrals").eq("id", user_id)
+        )
+        count = result.data[0]["referrals"]
+    finally:
+        await main.run_db(main.supabase.table("users").delete().eq("id", user_id))
+
+    name = "read-modify-write" if legacy else "redeem_referral"
+    ok = count == redemptions
+    print(f"{name}: {redemptions} concurrent redemptions -> referrals = {count} "
+          f"({'exact' if ok else f'{redemptions - count} lost'})")
+    return ok
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--redemptions", type=int, default=50)
+    parser.add_argument("--legacy", action="store_true", help="also run the old read-modify-write version")
+    args = parser.parse_args()
+
+    if not main.supabase:
+        print("❌ Supabase is not configured (SUPABASE_URL / SUPABASE_KEY)")
+        sys.exit(2)
+
+    ok = asyncio.run(check(args.redemptions, legacy=False))
+    if args.legacy:
+        asyncio.run(check(args.redemptions, legacy=True))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
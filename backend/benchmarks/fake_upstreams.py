@@ -0,0 +1,365 @@
+"""
+Local stand-ins for every upstream the backend talks to
+
+One HTTP server that mimics just enough of each API for main.py to run
+end to end without network access or credentials:
+
+- Groq chat completions   POST /groq/openai/v1/chat/completions (JSON or SSE)
+- WhatsApp Graph API      POST /graph/v18.0/{phone_id}/messages
+- Open-Meteo geocoding    GET  /geocoding/v1/search
+- Open-Meteo forecast     GET  /forecast/v1/forecast
+- Supabase PostgREST      GET/POST/PATCH /rest/v1/{table}, POST /rest/v1/rpc/{fn}
+                          (in-memory tables, eq filters, order, limit)
+
+Each upstream has its own latency distribution (log-normal around a median)
+and error rate, e.g. --profile groq=800:0.5:0.02 for an 800 ms median,
+sigma 0.5 and 2% HTTP 500s. Calls and errors are counted per upstream.
+
+Used in-process by load_test.py; can also run on its own:
+    cd backend && python benchmarks/fake_upstreams.py --port 8900
+and prints the environment to point the backend at it.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Any string shaped like a JWT passes the Supabase client's key check
+FAKE_SUPABASE_KEY = "eyJhbGciOiJub25lIn0.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.fake"
+
+PHONE_ID = "100000000000001"
+
+ISSUES = [
+    ("Early blight (fungal leaf spots)", "medium", "Remove infected lower leaves and spray copper fungicide."),
+    ("Nitrogen deficiency", "low", "Side-dress with compost or 20 kg/acre urea."),
+    ("Aphid infestation", "medium", "Spray neem oil solution every 5 days."),
+    ("Fall armyworm", "high", "Hand-pick larvae and apply Bt at dusk."),
+    ("Water stress", "low", "Mulch and water deeply early in the morning."),
+]
+
+
+@dataclass
+class UpstreamProfile:
+    """Latency (log-normal around median_ms) and error injection for one upstream"""
+    median_ms: float
+    sigma: float = 0.4
+    error_rate: float = 0.0
+    error_status: int = 500
+
+    def latency(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median_ms / 1000), self.sigma)
+
+    @classmethod
+    def parse(cls, spec: str) -> "UpstreamProfile":
+        """"median_ms[:sigma[:error_rate[:status]]]", e.g. "800:0.5:0.02" """
+        parts = spec.split(":")
+        return cls(
+            median_ms=float(parts[0]),
+            sigma=float(parts[1]) if len(parts) > 1 else 0.4,
+            error_rate=float(parts[2]) if len(parts) > 2 else 0.0,
+            error_status=int(parts[3]) if len(parts) > 3 else 500,
+        )
+
+
+DEFAULT_PROFILES = {
+    "groq": UpstreamProfile(median_ms=700, sigma=0.5),
+    "whatsapp": UpstreamProfile(median_ms=150, sigma=0.3),
+    "geocoding": UpstreamProfile(median_ms=80, sigma=0.3),
+    "forecast": UpstreamProfile(median_ms=120, sigma=0.3),
+    "postgrest": UpstreamProfile(median_ms=15, sigma=0.5),
+}
+
+
+def parse_profiles(specs: List[str]) -> Dict[str, UpstreamProfile]:
+    """DEFAULT_PROFILES overridden by "name=median_ms:sigma:error_rate" specs"""
+    profiles = dict(DEFAULT_PROFILES)
+    for spec in specs or []:
+        name, _, value = spec.partition("=")
+        if name not in profiles:
+            raise ValueError(f"Unknown upstream '{name}' (one of {', '.join(profiles)})")
+        profiles[name] = UpstreamProfile.parse(value)
+    return profiles
+
+
+def _matches(row: Dict, filters: Dict[str, str]) -> bool:
+    for column, condition in filters.items():
+        op, _, value = condition.partition(".")
+        if op == "eq" and str(row.get(column)) != value:
+            return False
+        if op == "is" and value == "null" and row.get(column) is not None:
+            return False
+    return True
+
+
+class FakeUpstreams:
+    """The fake APIs plus their in-memory state and counters"""
+
+    def __init__(self, profiles: Optional[Dict[str, UpstreamProfile]] = None, seed: Optional[int] = None):
+        self.profiles = profiles or dict(DEFAULT_PROFILES)
+        self.rng = random.Random(seed)
+        self.calls: Dict[str, int] = {name: 0 for name in self.profiles}
+        self.errors: Dict[str, int] = {name: 0 for name in self.profiles}
+        self.tables: Dict[str, List[Dict]] = {"users": [], "diagnoses": [], "feedback": []}
+        # on_reply(to, text, received_at) for every message "sent" via the Graph API
+        self.on_reply: Optional[Callable[[str, str, float], None]] = None
+        self.app = self._build_app()
+
+    def seed_users(self, phones: List[str], crops: List[str], locations: List[str], geocoded_share: float = 0.8):
+        """Pre-register farmers so their messages go straight to diagnosis"""
+        for index, phone in enumerate(phones):
+            geocoded = self.rng.random() < geocoded_share
+            location = locations[index % len(locations)]
+            self.tables["users"].append({
+                "id": str(uuid.uuid4()),
+                "phone": phone,
+                "name": f"Farmer {index}",
+                "location": location,
+                "primary_crop": crops[index % len(crops)],
+                "referral_code": f"AG{index:06d}",
+                "referrals": 0,
+                "latitude": -1.0 - index % 50 * 0.1 if geocoded else None,
+                "longitude": 36.0 + index % 50 * 0.1 if geocoded else None,
+                "location_geocoded": location if geocoded else None,
+            })
+
+    async def _simulate(self, upstream: str) -> Optional[Response]:
+        """Wait out the upstream's latency; an error response if one is injected"""
+        profile = self.profiles[upstream]
+        self.calls[upstream] += 1
+        await asyncio.sleep(profile.latency(self.rng))
+        if self.rng.random() < profile.error_rate:
+            self.errors[upstream] += 1
+            return JSONResponse(
+                {"message": f"injected {upstream} error", "code": str(profile.error_status),
+                 "hint": None, "details": None},
+                status_code=profile.error_status,
+            )
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            name: {"calls": self.calls[name], "errors": self.errors[name]}
+            for name in self.profiles
+        }
+
+    # ------------------------------------------------------------------
+    # Upstream behaviour
+    # ------------------------------------------------------------------
+
+    def _completion(self, messages: List[Dict]) -> str:
+        user_prompt = messages[-1].get("content", "") if messages else ""
+        crop = "crop"
+        for line in user_prompt.splitlines():
+            if line.startswith("Crop:"):
+                crop = line.split(":", 1)[1].strip()
+        issue, risk, recommendation = self.rng.choice(ISSUES)
+        return json.dumps({
+            "crop": crop,
+            "issue": issue,
+            "risk": risk,
+            "confidence": self.rng.randint(55, 95),
+            "recommendation": recommendation,
+            "method": "ai",
+        })
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake upstreams")
+
+        @app.post("/groq/openai/v1/chat/completions")
+        async def groq_chat(request: Request):
+            body = await request.json()
+            error = await self._simulate("groq")
+            if error is not None:
+                return error
+
+            content = self._completion(body.get("messages", []))
+            prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4,
+            }
+            if not body.get("stream"):
+                return {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                }
+
+            async def events():
+                # A few tokens at a time, like the real stream
+                for start in range(0, len(content), 12):
+                    chunk = {"choices": [{"index": 0, "delta": {"content": content[start:start + 12]}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(0.002)
+                final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                         "x_groq": {"usage": usage}}
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        @app.post("/graph/v18.0/{phone_id}/messages")
+        async def graph_messages(phone_id: str, request: Request):
+            body = await request.json()
+            error = await self._simulate("whatsapp")
+            if error is not None:
+                return error
+            if self.on_reply is not None:
+                self.on_reply(body.get("to", ""), (body.get("text") or {}).get("body", ""), time.perf_counter())
+            return {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+                "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+            }
+
+        @app.get("/geocoding/v1/search")
+        async def geocoding(name: str = "", count: int = 1):
+            error = await self._simulate("geocoding")
+            if error is not None:
+                return error
+            digest = sum(map(ord, name))
+            return {"results": [{
+                "name": name,
+                "latitude": round(-5 + digest % 100 * 0.1, 4),
+                "longitude": round(30 + digest % 70 * 0.1, 4),
+            }]}
+
+        @app.get("/forecast/v1/forecast")
+        async def forecast(latitude: float = 0.0, longitude: float = 0.0):
+            error = await self._simulate("forecast")
+            if error is not None:
+                return error
+            return {
+                "latitude": latitude,
+                "longitude": longitude,
+                "current_weather": {"temperature": round(self.rng.uniform(18, 32), 1),
+                                    "windspeed": round(self.rng.uniform(0, 20), 1)},
+                "daily": {
+                    "temperature_2m_max": [30.0],
+                    "temperature_2m_min": [17.0],
+                    "precipitation_sum": [round(self.rng.uniform(0, 12), 1)],
+                },
+            }
+
+        @app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH"])
+        async def postgrest_table(table: str, request: Request):
+            error = await self._simulate("postgrest")
+            if error is not None:
+                return error
+            return self._postgrest(table, request.method, dict(request.query_params),
+                                   await request.body(), request.headers.get("prefer", ""))
+
+        @app.post("/rest/v1/rpc/{function}")
+        async def postgrest_rpc(function: str, request: Request):
+            error = await self._simulate("postgrest")
+            if error is not None:
+                return error
+            params = await request.json()
+            if function == "get_platform_stats":
+                return [{
+                    "total_users": len(self.tables["users"]),
+                    "total_diagnoses": len(self.tables["diagnoses"]),
+                    "diagnoses_today": len(self.tables["diagnoses"]),
+                }]
+            if function == "redeem_referral":
+                for user in self.tables["users"]:
+                    if user.get("referral_code") == params.get("code") and user["phone"] != params.get("referred_phone"):
+                        user["referrals"] = user.get("referrals", 0) + 1
+                        return [{"referrer_id": user["id"], "referrer_phone": user["phone"],
+                                 "referrer_name": user["name"], "referrals": user["referrals"]}]
+                return []
+            return JSONResponse({"message": f"function {function} not found", "code": "PGRST202",
+                                 "hint": None, "details": None}, status_code=404)
+
+        return app
+
+    def _postgrest(self, table: str, method: str, params: Dict[str, str], body: bytes, prefer: str):
+        rows = self.tables.setdefault(table, [])
+        reserved = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+        filters = {key: value for key, value in params.items() if key not in reserved}
+
+        if method == "GET":
+            result = [row for row in rows if _matches(row, filters)]
+            if "order" in params:
+                column, _, direction = params["order"].partition(".")
+                result.sort(key=lambda row: str(row.get(column) or ""), reverse=direction.startswith("desc"))
+            if "limit" in params:
+                result = result[:int(params["limit"])]
+            if params.get("select", "*") != "*":
+                columns = [column.strip() for column in params["select"].split(",")]
+                result = [{column: row.get(column) for column in columns} for row in result]
+            return result
+
+        payload = json.loads(body or b"null")
+        if method == "PATCH":
+            changed = [row for row in rows if _matches(row, filters)]
+            for row in changed:
+                row.update(payload)
+            return changed
+
+        # POST: insert, or upsert with ignore-duplicates
+        new_rows = payload if isinstance(payload, list) else [payload]
+        existing = {row.get("id") for row in rows}
+        inserted = []
+        for row in new_rows:
+            row = dict(row)
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%S"))
+            if row["id"] in existing:
+                continue
+            rows.append(row)
+            existing.add(row["id"])
+            inserted.append(row)
+        if "return=minimal" in prefer:
+            return Response(status_code=201)
+        return JSONResponse(inserted, status_code=201)
+
+
+def backend_env(base_url: str) -> Dict[str, str]:
+    """Environment that points main.py at fakes served on base_url"""
+    return {
+        "SUPABASE_URL": base_url,
+        "SUPABASE_KEY": FAKE_SUPABASE_KEY,
+        "GROQ_API_KEY": "fake-groq-key",
+        "GROQ_API_BASE": f"{base_url}/groq/openai/v1",
+        "WHATSAPP_ACCESS_TOKEN": "fake-whatsapp-token",
+        "WHATSAPP_PHONE_ID": PHONE_ID,
+        "WHATSAPP_API_BASE": f"{base_url}/graph/v18.0",
+        "OPEN_METEO_GEOCODING_URL": f"{base_url}/geocoding/v1/search",
+        "OPEN_METEO_FORECAST_URL": f"{base_url}/forecast/v1/forecast",
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve fake Groq / Graph / Open-Meteo / PostgREST APIs")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--profile", action="append", default=[],
+                        help="name=median_ms:sigma:error_rate[:status] (groq, whatsapp, geocoding, forecast, postgrest)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    fakes = FakeUpstreams(parse_profiles(args.profile), seed=args.seed)
+    print("Point the backend at the fakes with:")
+    for key, value in backend_env(f"http://127.0.0.1:{args.port}").items():
+        print(f"  export {key}={value}")
+    uvicorn.run(fakes.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+End-to-end load test against local fake upstreams
+
+Starts the fakes from fake_upstreams.py in this process, launches the
+backend (uvicorn main:app) in a subprocess pointed at them, then posts
+realistic whatsapp_business_account webhooks from seeded farmers at a fixed
+rate (open loop, so a slow backend can't slow the offered load down).
+
+Reply latency is measured from posting the webhook to the fake Graph API
+receiving the farmer's final reply (acks and streamed previews are
+reported separately as "first reply"). Messages from one farmer are
+answered in order, so replies are matched to messages per phone number.
+
+Reports messages/sec, p50/p95/p99 latencies and upstream calls per message.
+Save a run with --output and compare a later run against it with
+--baseline.
+
+The run fails (exit status 1) if the backend isn't really wired to the
+fakes: /health must report the database as connected before anything is
+posted, and afterwards there must be diagnosis replies, Groq calls and
+PostgREST calls - otherwise every farmer may just have been answered with
+the onboarding text.
+
+Usage:
+    cd backend && python benchmarks/load_test.py --messages 500 --rate 25
+    cd backend && python benchmarks/load_test.py --profile groq=1500:0.6:0.05 --output before.json
+    cd backend && python benchmarks/load_test.py --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import PHONE_ID, FakeUpstreams, backend_env, parse_profiles  # noqa: E402
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CROPS = ["tomato", "maize", "beans", "cassava", "potato"]
+LOCATIONS = ["Nairobi", "Kisumu", "Eldoret", "Nakuru", "Arusha", "Kampala", "Mbale"]
+OBSERVATIONS = [
+    "The lower leaves are turning yellow and the plants look weak",
+    "Brown spots with rings on the leaves, spreading upwards",
+    "Small green insects under the leaves and the leaves are curling",
+    "Holes in the leaves and sawdust-like droppings in the whorl",
+    "Plants are wilting in the afternoon even though I watered",
+    "White powder on the leaves after the rains",
+    "Fruits have dark sunken patches near the bottom",
+    "Seedlings are falling over at the soil line",
+]
+FEEDBACK = ["YES", "NO", "yes", "👍"]
+
+# Backend replies that are not the answer to the message
+PROGRESS_PREFIXES = ("🔬", "🔍")
+# Present in every diagnosis reply (AI or rule-based)
+DIAGNOSIS_MARKER = "*Diagnosis for "
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def webhook_payload(phone: str, text: str) -> Dict:
+    """One inbound text message as the Cloud API delivers it"""
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "100000000000000",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": PHONE_ID},
+                    "contacts": [{"profile": {"name": "Farmer"}, "wa_id": phone}],
+                    "messages": [{
+                        "from": phone,
+                        "id": f"wamid.{uuid.uuid4().hex}",
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+class ReplyTracker:
+    """Matches replies seen by the fake Graph API to the messages that caused them"""
+
+    def __init__(self):
+        # phone -> [sent at, first reply seen] for messages awaiting their answer
+        self.pending: Dict[str, Deque[list]] = defaultdict(deque)
+        self.latencies: List[float] = []
+        self.diagnoses = 0
+        self.first_reply_latencies: List[float] = []
+        self.unexpected = 0
+        self.last_reply_at = 0.0
+        self.expected = 0
+        self.done = asyncio.Event()
+
+    def sent(self, phone: str, at: float):
+        self.pending[phone].append([at, False])
+
+    def rejected(self, phone: str):
+        self.pending[phone].pop()
+        self.expected -= 1
+        self._check_done()
+
+    def on_reply(self, phone: str, text: str, at: float):
+        if not self.pending[phone]:
+            self.unexpected += 1
+            return
+        # Replies for one farmer arrive in message order
+        message = self.pending[phone][0]
+        if not message[1]:
+            message[1] = True
+            self.first_reply_latencies.append(at - message[0])
+        if text.startswith(PROGRESS_PREFIXES):
+            return
+        self.pending[phone].popleft()
+        self.latencies.append(at - message[0])
+        if DIAGNOSIS_MARKER in text:
+            self.diagnoses += 1
+        self.last_reply_at = at
+        self._check_done()
+
+    def _check_done(self):
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+
+async def wait_until_ready(client: httpx.AsyncClient, url: str, process, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.returncode is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Backend did not become ready")
+
+
+async def check_wiring(client: httpx.AsyncClient, log_path: Path):
+    """Refuse to run unless the backend reached the fake PostgREST"""
+    health = (await client.get("/health")).json()
+    if health.get("database") != "connected":
+        raise RuntimeError(
+            f"Backend database is {health.get('database')!r}, not connected to the fake "
+            f"PostgREST (see {log_path})"
+        )
+
+
+@asynccontextmanager
+async def backend_against_fakes(
+    fakes: FakeUpstreams,
+    env_overrides: Sequence[str] = (),
+    backend_dir: Path = BACKEND_DIR,
+) -> AsyncIterator[Tuple[httpx.AsyncClient, Path]]:
+    """
+    Serve the fakes, run uvicorn main:app from backend_dir against them
+
+    Yields a client for the backend and the path of its log file.
+    `env_overrides` are "KEY=VALUE" strings applied last.
+    """
+    fake_port, app_port = free_port(), free_port()
+    fake_server = uvicorn.Server(uvicorn.Config(
+        fakes.app, host="127.0.0.1", port=fake_port, log_level="warning", lifespan="off"
+    ))
+    fake_task = asyncio.create_task(fake_server.serve())
+
+    workdir = Path(tempfile.mkdtemp(prefix="agriai-load-"))
+    env = dict(os.environ)
+    env.update(backend_env(f"http://127.0.0.1:{fake_port}"))
+    env.update({
+        "WEBHOOK_QUEUE_PATH": str(workdir / "webhook_queue.sqlite3"),
+        "WRITE_BEHIND_SPILL_PATH": str(workdir / "write_behind_spill.jsonl"),
+        # The fakes have no quota; --env can put the real free-tier limits back
+        "GROQ_REQUESTS_PER_MINUTE": "1000000",
+        "GROQ_TOKENS_PER_MINUTE": "1000000000",
+        "LOG_LEVEL": "WARNING",
+    })
+    for override in env_overrides:
+        key, _, value = override.partition("=")
+        env[key] = value
+
+    log_path = workdir / "backend.log"
+    with open(log_path, "w") as log_file:
+        backend = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning",
+            cwd=str(backend_dir), env=env, stdout=log_file, stderr=log_file,
+        )
+
+    try:
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=30) as client:
+            await wait_until_ready(client, "/health", backend)
+            await check_wiring(client, log_path)
+            yield client, log_path
+    finally:
+        if backend.returncode is None:
+            backend.terminate()
+            await backend.wait()
+        fake_server.should_exit = True
+        await fake_task
+
+
+def summarize(tracker: ReplyTracker, webhook_acks: List[float], elapsed: float, fakes: FakeUpstreams) -> Dict:
+    """Throughput, latency percentiles and upstream calls for one run"""
+    completed = len(tracker.latencies)
+    upstreams = fakes.stats()
+    ms = lambda value: round(value * 1000, 1) if value is not None else None  # noqa: E731
+    return {
+        "profiles": {name: vars(profile) for name, profile in fakes.profiles.items()},
+        "completed": completed,
+        "diagnosis_replies": tracker.diagnoses,
+        "missing_replies": tracker.expected - completed,
+        "messages_per_second": round(completed / elapsed, 2) if elapsed > 0 else 0,
+        "reply_ms": {
+            "p50": ms(percentile(tracker.latencies, 0.50)),
+            "p95": ms(percentile(tracker.latencies, 0.95)),
+            "p99": ms(percentile(tracker.latencies, 0.99)),
+        },
+        "first_reply_ms": {
+            "p50": ms(percentile(tracker.first_reply_latencies, 0.50)),
+            "p95": ms(percentile(tracker.first_reply_latencies, 0.95)),
+        },
+        "webhook_ack_ms": {
+            "p50": ms(percentile(webhook_acks, 0.50)),
+            "p99": ms(percentile(webhook_acks, 0.99)),
+        },
+        "upstream_calls": upstreams,
+        "upstream_calls_per_message": {
+            name: round(counts["calls"] / completed, 2) if completed else None
+            for name, counts in upstreams.items()
+        },
+    }
+
+
+async def run(args) -> Dict:
+    rng = random.Random(args.seed)
+    fakes = FakeUpstreams(parse_profiles(args.profile), seed=args.seed)
+    phones = [f"2547{index:08d}" for index in range(args.farmers)]
+    fakes.seed_users(phones, CROPS, LOCATIONS)
+    tracker = ReplyTracker()
+    fakes.on_reply = tracker.on_reply
+
+    webhook_acks: List[float] = []
+    rejected = 0
+    failed = 0
+    async with backend_against_fakes(fakes, args.env) as (client, log_path):
+
+        async def post(phone: str, text: str):
+            nonlocal rejected, failed
+            started = time.perf_counter()
+            tracker.sent(phone, started)
+            try:
+                response = await client.post("/webhook/whatsapp", json=webhook_payload(phone, text))
+                webhook_acks.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    rejected += 1
+                    tracker.rejected(phone)
+            except httpx.HTTPError:
+                failed += 1
+                tracker.rejected(phone)
+
+        tracker.expected = args.messages
+        interval = 1.0 / args.rate
+        started = time.perf_counter()
+        posts = []
+        for index in range(args.messages):
+            delay = started + index * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            phone = rng.choice(phones)
+            if rng.random() < args.feedback_share:
+                text = rng.choice(FEEDBACK)
+            else:
+                text = rng.choice(OBSERVATIONS)
+            posts.append(asyncio.create_task(post(phone, text)))
+        await asyncio.gather(*posts)
+
+        if tracker.expected > 0:
+            try:
+                await asyncio.wait_for(tracker.done.wait(), timeout=args.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+        elapsed = (tracker.last_reply_at or time.perf_counter()) - started
+
+    result = {
+        "messages": args.messages,
+        "rate": args.rate,
+        "rejected_webhooks": rejected,
+        "failed_webhooks": failed,
+    }
+    result.update(summarize(tracker, webhook_acks, elapsed, fakes))
+    result["backend_log"] = str(log_path)
+    return result
+
+
+def wiring_problems(result: Dict) -> List[str]:
+    """Signs that the replies didn't come from the real pipeline"""
+    problems = []
+    if result["completed"] and not result["diagnosis_replies"]:
+        problems.append("no diagnosis replies (only onboarding/other texts)")
+    for name in ("groq", "postgrest"):
+        if not result["upstream_calls"].get(name, {}).get("calls"):
+            problems.append(f"no {name} calls")
+    return problems
+
+
+def report(result: Dict, baseline: Optional[Dict] = None):
+    def delta(value, old):
+        if baseline is None or value is None or old is None:
+            return ""
+        return f"  ({value - old:+.1f})"
+
+    old = baseline or {}
+    print(f"{result['completed']}/{result['messages']} messages answered at {result['rate']} msg/s offered "
+          f"({result['diagnosis_replies']} diagnoses, {result['rejected_webhooks']} rejected, "
+          f"{result['missing_replies']} without reply)")
+    print(f"throughput      {result['messages_per_second']:8.2f} msg/s"
+          f"{delta(result['messages_per_second'], old.get('messages_per_second'))}")
+    for name in ("reply_ms", "first_reply_ms", "webhook_ack_ms"):
+        for key, value in result[name].items():
+            previous = old.get(name, {}).get(key)
+            print(f"{name + ' ' + key:<15} {value if value is not None else '-':>8} ms{delta(value, previous)}")
+    print(f"{'upstream':<10} | {'calls':>6} | {'errors':>6} | {'per msg':>7}")
+    for name, counts in result["upstream_calls"].items():
+        per_message = result["upstream_calls_per_message"][name]
+        print(f"{name:<10} | {counts['calls']:>6} | {counts['errors']:>6} | "
+              f"{per_message if per_message is not None else '-':>7}")
+    print(f"backend log: {result['backend_log']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend against fake upstreams")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=20.0, help="webhooks posted per second")
+    parser.add_argument("--farmers", type=int, default=200)
+    parser.add_argument("--feedback-share", type=float, default=0.1, help="share of YES/NO replies")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="upstream latency/errors: name=median_ms:sigma:error_rate[:status]")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the backend")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    try:
+        result = asyncio.run(run(args))
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    report(result, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+    problems = wiring_problems(result)
+    if problems:
+        print(f"❌ Run is not representative: {'; '.join(problems)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Replay captured webhooks with their original timing
+
+Reads the gzip JSON-lines files written by webhook_capture.py
+(WEBHOOK_CAPTURE_DIR) and re-posts each payload to /webhook/whatsapp,
+keeping the recorded inter-arrival times scaled by --speed (1 = real time,
+10 = ten times faster, max = as fast as --concurrency allows). Message ids
+get a per-run suffix so the target's duplicate filter doesn't drop a
+second replay (--keep-ids to disable).
+
+Two modes:
+
+- --target URL: replay against a running backend and report webhook
+  acknowledgement latency and the achieved posting rate.
+- --build DIR (repeatable): for each backend directory (e.g. two
+  checkouts), start it against the fake upstreams from load_test.py,
+  replay the same capture and report throughput and reply latency, then
+  print the builds side by side.
+
+Usage:
+    cd backend && python benchmarks/replay_webhooks.py data/captures --target http://127.0.0.1:8000 --speed 10
+    cd backend && python benchmarks/replay_webhooks.py data/captures --speed max \\
+        --build /tmp/agri-ai-main/backend --build .
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import FakeUpstreams, parse_profiles  # noqa: E402
+from load_test import (  # noqa: E402
+    CROPS,
+    LOCATIONS,
+    ReplyTracker,
+    backend_against_fakes,
+    percentile,
+    summarize,
+    wiring_problems,
+)
+
+Entry = Tuple[float, Dict]
+
+
+def capture_files(paths: List[str]) -> List[Path]:
+    files: List[Path] = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob("webhooks-*.jsonl.gz"), key=lambda file: file.stat().st_mtime))
+        else:
+            files.append(path)
+    return files
+
+
+def load_capture(paths: List[str]) -> List[Entry]:
+    """(arrival time, payload) for every captured webhook, oldest first"""
+    entries: List[Entry] = []
+    for path in capture_files(paths):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries.append((entry["ts"], entry["payload"]))
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            # The file still being written (or cut short by a crash)
+            print(f"⚠️  {path} is truncated; replaying what could be read")
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def messages_of(payload: Dict) -> List[Dict]:
+    return [
+        message
+        for entry in payload.get("entry", []) or []
+        for change in entry.get("changes", []) or []
+        for message in (change.get("value") or {}).get("messages", []) or []
+    ]
+
+
+def with_fresh_ids(payload: Dict, suffix: str) -> Dict:
+    payload = json.loads(json.dumps(payload))
+    for message in messages_of(payload):
+        if message.get("id"):
+            message["id"] = f"{message['id']}.{suffix}"
+    return payload
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    entries: List[Entry],
+    speed: Optional[float],
+    concurrency: int,
+    tracker: Optional[ReplyTracker] = None,
+    fresh_ids: bool = True,
+) -> Dict:
+    """Post every entry on its (scaled) schedule; speed None means as fast as possible"""
+    suffix = f"r{uuid.uuid4().hex[:8]}"
+    semaphore = asyncio.Semaphore(concurrency)
+    acks: List[float] = []
+    lags: List[float] = []
+    counts = {"posted": 0, "rejected": 0, "failed": 0}
+
+    async def post(payload: Dict):
+        senders = [message.get("from", "") for message in messages_of(payload)]
+        async with semaphore:
+            started = time.perf_counter()
+            if tracker is not None:
+                for sender in senders:
+                    tracker.sent(sender, started)
+            try:
+                response = await client.post("/webhook/whatsapp", json=payload)
+                acks.append(time.perf_counter() - started)
+                counts["posted"] += 1
+                ok = response.status_code == 200
+                if not ok:
+                    counts["rejected"] += 1
+            except httpx.HTTPError:
+                counts["failed"] += 1
+                ok = False
+            if not ok and tracker is not None:
+                for sender in senders:
+                    tracker.rejected(sender)
+
+    first_ts = entries[0][0] if entries else 0.0
+    started = time.perf_counter()
+    tasks = []
+    for ts, payload in entries:
+        if fresh_ids:
+            payload = with_fresh_ids(payload, suffix)
+        if speed is not None:
+            due = started + (ts - first_ts) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, time.perf_counter() - due))
+        tasks.append(asyncio.create_task(post(payload)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    ms = lambda value: round(value * 1000, 1) if value is not None else None  # noqa: E731
+    return {
+        "webhooks": len(entries),
+        "speed": speed or "max",
+        "capture_seconds": round(entries[-1][0] - first_ts, 1) if entries else 0,
+        "replay_seconds": round(elapsed, 1),
+        "webhooks_per_second": round(counts["posted"] / elapsed, 2) if elapsed > 0 else 0,
+        **counts,
+        "webhook_ack_ms": {
+            "p50": ms(percentile(acks, 0.50)),
+            "p95": ms(percentile(acks, 0.95)),
+            "p99": ms(percentile(acks, 0.99)),
+        },
+        "schedule_lag_ms_p99": ms(percentile(lags, 0.99)),
+        "_acks": acks,
+    }
+
+
+async def replay_build(build: Path, entries: List[Entry], args) -> Dict:
+    """Replay against one backend directory running on the fake upstreams"""
+    fakes = FakeUpstreams(parse_profiles(args.profile), seed=args.seed)
+    senders = sorted({
+        message["from"] for _, payload in entries for message in messages_of(payload) if message.get("from")
+    })
+    fakes.seed_users(senders, CROPS, LOCATIONS)
+    tracker = ReplyTracker()
+    tracker.expected = sum(len(messages_of(payload)) for _, payload in entries)
+    fakes.on_reply = tracker.on_reply
+
+    async with backend_against_fakes(fakes, args.env, backend_dir=build) as (client, log_path):
+        started = time.perf_counter()
+        posted = await replay(client, entries, args.speed, args.concurrency, tracker, not args.keep_ids)
+        if tracker.expected > 0:
+            try:
+                await asyncio.wait_for(tracker.done.wait(), timeout=args.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+        elapsed = (tracker.last_reply_at or time.perf_counter()) - started
+
+    result = {"build": str(build)}
+    result.update(summarize(tracker, posted.pop("_acks"), elapsed, fakes))
+    result.update({key: value for key, value in posted.items() if key != "webhook_ack_ms"})
+    result["backend_log"] = str(log_path)
+    return result
+
+
+COMPARED = [
+    ("messages/sec", ("messages_per_second",)),
+    ("reply p50 ms", ("reply_ms", "p50")),
+    ("reply p95 ms", ("reply_ms", "p95")),
+    ("reply p99 ms", ("reply_ms", "p99")),
+    ("first reply p50 ms", ("first_reply_ms", "p50")),
+    ("webhook ack p99 ms", ("webhook_ack_ms", "p99")),
+    ("diagnosis replies", ("diagnosis_replies",)),
+    ("missing replies", ("missing_replies",)),
+    ("rejected webhooks", ("rejected",)),
+]
+
+
+def _lookup(result: Dict, path: Tuple[str, ...]):
+    for key in path:
+        result = (result or {}).get(key)
+    return result
+
+
+def report_builds(results: List[Dict]):
+    names = [Path(result["build"]).resolve().as_posix()[-28:] for result in results]
+    print(f"{'':<20} | " + " | ".join(f"{name:>28}" for name in names))
+    for label, path in COMPARED:
+        values = [_lookup(result, path) for result in results]
+        cells = [f"{value if value is not None else '-':>28}" for value in values]
+        line = f"{label:<20} | " + " | ".join(cells)
+        if len(values) > 1 and None not in values[:2]:
+            line += f" | {values[1] - values[0]:+.1f}"
+        print(line)
+    for result in results:
+        print(f"{result['build']}: log {result['backend_log']}")
+        problems = wiring_problems(result)
+        if problems:
+            print(f"❌ {result['build']} is not representative: {'; '.join(problems)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured WhatsApp webhooks")
+    parser.add_argument("capture", nargs="+", help="capture directory or .jsonl.gz files")
+    parser.add_argument("--speed", default="1", help="time scale: 1, 10, ... or max")
+    parser.add_argument("--concurrency", type=int, default=50, help="max webhooks in flight")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N webhooks")
+    parser.add_argument("--keep-ids", action="store_true", help="don't make message ids unique per run")
+    parser.add_argument("--target", help="URL of a running backend")
+    parser.add_argument("--build", action="append", default=[], help="backend directory to start and compare")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="fake upstream latency/errors: name=median_ms:sigma:error_rate[:status]")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the backends")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+    args.speed = None if args.speed == "max" else float(args.speed)
+
+    if not args.target and not args.build:
+        parser.error("give --target URL or at least one --build DIR")
+
+    entries = load_capture(args.capture)[:args.limit]
+    if not entries:
+        parser.error("no captured webhooks found")
+    print(f"Replaying {len(entries)} webhooks "
+          f"({sum(len(messages_of(payload)) for _, payload in entries)} messages) "
+          f"at {'max' if args.speed is None else f'{args.speed:g}x'} speed")
+
+    async def run_all() -> List[Dict]:
+        results = []
+        if args.target:
+            async with httpx.AsyncClient(base_url=args.target, timeout=30) as client:
+                result = await replay(client, entries, args.speed, args.concurrency, None, not args.keep_ids)
+            result.pop("_acks")
+            result["target"] = args.target
+            results.append(result)
+        for build in args.build:
+            results.append(await replay_build(Path(build), entries, args))
+        return results
+
+    results = asyncio.run(run_all())
+    for result in results:
+        if "target" in result:
+            print(json.dumps(result, indent=2))
+    builds = [result for result in results if "build" in result]
+    if builds:
+        report_builds(builds)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+In-process caching primitives
+
+TTLCache is a bounded LRU map whose entries also expire after a TTL.
+SingleFlight makes concurrent misses for the same key share one upstream
+call. Both are meant to be used from the event loop thread only (no locking).
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        # Called with (key, value) whenever an entry leaves the cache
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (refreshing its LRU position) or `default`"""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            self._evicted(key, value)
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live value without touching counters or LRU order"""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING or entry[0] <= self.clock():
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Insert or replace a value; `ttl` overrides the cache default"""
+        expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+        previous = self._data.get(key, _MISSING)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        if previous is not _MISSING and previous[1] is not value:
+            self._evicted(key, previous[1])
+
+        while len(self._data) > self.max_size:
+            old_key, (_, old_value) = self._data.popitem(last=False)
+            self.evictions += 1
+            self._evicted(old_key, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key, returning its value (expired or not) or `default`"""
+        entry = self._data.pop(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        self._evicted(key, entry[1])
+        return entry[1]
+
+    def clear(self):
+        if self.on_evict:
+            for key, (_, value) in self._data.items():
+                self.on_evict(key, value)
+        self._data.clear()
+
+    def _evicted(self, key: Hashable, value: Any):
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Membership test without touching counters or LRU order
+        entry = self._data.get(key, _MISSING)
+        return entry is not _MISSING and entry[0] > self.clock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one in-flight task
+
+    The first caller starts `func` as its own task; callers arriving while it
+    runs await the same task. Each caller waits through asyncio.shield, so a
+    caller that times out or is cancelled does not cancel the shared call
+    for everyone else.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every waiter gave up
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight,
+        }
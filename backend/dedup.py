@@ -0,0 +1,136 @@
+"""
+Webhook message-id deduplication
+
+Meta redelivers webhooks it considers unanswered, so the same message id can
+arrive more than once. MessageDeduplicator keeps a bounded, TTL-evicting set
+of seen ids in memory; a duplicate costs one dict lookup and triggers no
+downstream I/O.
+
+Ids are claimed in memory as soon as a message is accepted, and written to
+the optional SQLite store only after the message has been handled. On
+restart the in-memory set is warmed from the store, while messages that were
+journaled but never finished (see work_queue.py) are still processed.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from cache import TTLCache
+
+logger = logging.getLogger("AgriAI.dedup")
+
+
+class SQLiteSeenStore:
+    """Persistent backend for processed message ids"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._db: Optional[sqlite3.Connection] = None
+        self._io: Optional[ThreadPoolExecutor] = None
+
+    def _open(self, ttl: float) -> List[tuple]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen_messages ("
+            "message_id TEXT PRIMARY KEY, "
+            "seen_at REAL NOT NULL)"
+        )
+        cutoff = time.time() - ttl
+        self._db.execute("DELETE FROM seen_messages WHERE seen_at < ?", (cutoff,))
+        self._db.commit()
+        return self._db.execute(
+            "SELECT message_id, seen_at FROM seen_messages ORDER BY seen_at"
+        ).fetchall()
+
+    def _add(self, message_id: str, seen_at: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO seen_messages (message_id, seen_at) VALUES (?, ?)",
+            (message_id, seen_at),
+        )
+        self._db.commit()
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, func, *args)
+
+    async def open(self, ttl: float) -> List[tuple]:
+        """Open the store, prune expired ids and return the rest"""
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup-store")
+        return await self._run(self._open, ttl)
+
+    async def add(self, message_id: str):
+        await self._run(self._add, message_id, time.time())
+
+    async def close(self):
+        if self._io is not None:
+            await self._run(self._close)
+            self._io.shutdown(wait=True)
+            self._io = None
+
+
+class MessageDeduplicator:
+    """Bounded TTL set of WhatsApp message ids with hit/miss counters"""
+
+    def __init__(
+        self,
+        max_size: int = 50000,
+        ttl: float = 86400.0,
+        store: Optional[SQLiteSeenStore] = None,
+    ):
+        self.ttl = ttl
+        self.store = store
+        self._seen = TTLCache(max_size=max_size, ttl=ttl)
+
+    async def start(self):
+        """Warm the in-memory set from the persistent store (if configured)"""
+        if not self.store:
+            return
+        rows = await self.store.open(self.ttl)
+        now = time.time()
+        for message_id, seen_at in rows:
+            self._seen.set(message_id, True, ttl=self.ttl - (now - seen_at))
+        logger.info("Loaded %s recently processed message id(s)", len(rows))
+
+    async def stop(self):
+        if self.store:
+            await self.store.close()
+
+    def is_duplicate(self, message_id: str) -> bool:
+        """
+        Check a message id and claim it if new
+
+        Returns True when the id was already seen (the caller should skip
+        the message). Counted as a hit on the underlying cache.
+        """
+        if self._seen.get(message_id) is not None:
+            return True
+        self._seen.set(message_id, True)
+        return False
+
+    async def mark_processed(self, message_id: str):
+        """Persist a handled message id so it stays deduplicated across restarts"""
+        if not self.store:
+            return
+        try:
+            await self.store.add(message_id)
+        except Exception as e:
+            logger.warning("Failed to persist message id %s: %s", message_id, e)
+
+    def stats(self) -> Dict:
+        # hits are duplicate deliveries, misses are first-seen messages
+        stats = self._seen.stats()
+        stats["persistent"] = self.store is not None
+        return stats
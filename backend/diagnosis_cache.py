@@ -0,0 +1,179 @@
+"""
+Response cache for AI crop diagnoses
+
+Farmers in the same area often describe the same problem in almost the same
+words ("tomato leaves yellow"). DiagnosisCache reuses an earlier Groq answer
+when the context matches:
+
+- context: crop, location region and a coarse weather bucket must be equal
+- exact layer: normalised observation text (LRU + TTL)
+- similarity layer (optional): token-set Jaccard similarity against cached
+  observations in the same context, via an inverted token index, so close
+  paraphrases reuse an answer above a configurable threshold
+
+Only AI answers are cached; the rule-based fallback is already free.
+"""
+
+import re
+from collections import Counter
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+from cache import TTLCache
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Words that carry no diagnostic signal
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "at", "be", "been", "but", "can", "do", "does",
+    "for", "from", "has", "have", "help", "how", "i", "in", "is", "it", "its",
+    "me", "my", "of", "on", "or", "our", "please", "so", "some", "the", "their",
+    "them", "there", "they", "this", "to", "very", "was", "we", "what", "why",
+    "with",
+})
+
+ContextKey = Tuple[str, str, str]
+CacheKey = Tuple[str, str, str, str]
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    """Set of meaningful words in a normalised observation"""
+    return frozenset(word for word in text.split() if word not in STOPWORDS)
+
+
+def weather_bucket(weather: Optional[Dict]) -> str:
+    """Coarse weather class: 5 degree temperature band plus wet/dry"""
+    if not weather:
+        return "none"
+
+    temperature = (weather.get("current_weather") or {}).get("temperature")
+    band = f"t{int(temperature // 5) * 5}" if isinstance(temperature, (int, float)) else "t?"
+
+    precipitation = ((weather.get("daily") or {}).get("precipitation_sum") or [None])[0]
+    wet = "wet" if isinstance(precipitation, (int, float)) and precipitation >= 1.0 else "dry"
+    return f"{band}-{wet}"
+
+
+def location_region(location: Optional[str]) -> str:
+    """Normalised location name used as the region part of the key"""
+    return normalize_text(location or "") or "unknown"
+
+
+class DiagnosisCache:
+    """Exact + similarity cache of AI diagnoses with hit and token-savings counters"""
+
+    def __init__(
+        self,
+        max_size: int = 2000,
+        ttl: float = 6 * 3600,
+        similarity_threshold: float = 0.8,
+    ):
+        # 0 disables the similarity layer
+        self.similarity_threshold = similarity_threshold
+        self._entries = TTLCache(max_size=max_size, ttl=ttl, on_evict=self._unindex)
+        # (crop, region, weather bucket, token) -> cache keys containing it
+        self._postings: Dict[Tuple[ContextKey, str], Set[CacheKey]] = {}
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def _context(crop: str, location: str, weather: Optional[Dict]) -> ContextKey:
+        return (normalize_text(crop) or "unknown", location_region(location), weather_bucket(weather))
+
+    def key(self, crop: str, observations: str, location: str, weather: Optional[Dict]) -> CacheKey:
+        """Normalised request key (also used to coalesce in-flight requests)"""
+        return self._context(crop, location, weather) + (normalize_text(observations),)
+
+    def get(self, crop: str, observations: str, location: str, weather: Optional[Dict]) -> Optional[Dict]:
+        """Return a copy of a cached diagnosis for this request, or None"""
+        key = self.key(crop, observations, location, weather)
+        context, text = key[:3], key[3]
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.exact_hits += 1
+        elif self.similarity_threshold > 0:
+            similar_key = self._find_similar(context, tokenize(text))
+            if similar_key is not None:
+                # Only the entry actually served counts as used
+                entry = self._entries.get(similar_key)
+                if entry is not None:
+                    self.similar_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        diagnosis, tokens, _ = entry
+        self.tokens_saved += tokens
+        return dict(diagnosis)
+
+    def set(
+        self,
+        crop: str,
+        observations: str,
+        location: str,
+        weather: Optional[Dict],
+        diagnosis: Dict,
+        tokens: int = 0,
+    ):
+        """Cache an AI diagnosis; `tokens` is what the Groq call cost"""
+        key = self.key(crop, observations, location, weather)
+        context = key[:3]
+        words = tokenize(key[3])
+
+        self._entries.set(key, (dict(diagnosis), tokens or 0, words))
+        if self.similarity_threshold > 0:
+            for word in words:
+                self._postings.setdefault((context, word), set()).add(key)
+
+    def _find_similar(self, context: ContextKey, words: FrozenSet[str]):
+        """Key of the best cached entry in the same context by token-set Jaccard similarity"""
+        if not words:
+            return None
+
+        overlaps: Counter = Counter()
+        for word in words:
+            overlaps.update(self._postings.get((context, word), ()))
+
+        best_key, best_score = None, 0.0
+        for key, shared in overlaps.most_common():
+            # Candidates are only compared: no LRU refresh, no hit counted
+            entry = self._entries.peek(key)
+            if entry is None:
+                continue
+            cached_words = entry[2]
+            score = shared / (len(words) + len(cached_words) - shared)
+            if score > best_score:
+                best_key, best_score = key, score
+
+        return best_key if best_score >= self.similarity_threshold else None
+
+    def _unindex(self, key: CacheKey, entry):
+        context = key[:3]
+        for word in entry[2]:
+            postings = self._postings.get((context, word))
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._postings[(context, word)]
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        hits = self.exact_hits + self.similar_hits
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "groq_tokens_saved": self.tokens_saved,
+            "similarity_threshold": self.similarity_threshold,
+        }
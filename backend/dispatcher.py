@@ -0,0 +1,66 @@
+"""
+Per-sender ordered message dispatcher
+
+Messages from different farmers are handled concurrently (up to a global
+cap), while messages from the same phone number run strictly one after
+another in arrival order - JOIN codes and follow-up texts depend on it.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class OrderedDispatcher:
+    """Run coroutines concurrently across keys but sequentially within a key"""
+
+    def __init__(self, max_concurrency: int = 10):
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, int] = {}
+        self.active = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, key: str, func: Callable[..., Awaitable], *args, **kwargs):
+        """
+        Run `func(*args, **kwargs)` once all earlier calls for `key` finished
+
+        The per-key lock is taken before the global semaphore, so a sender
+        waiting behind its own earlier message never occupies a global slot.
+        asyncio.Lock wakes waiters in FIFO order, which preserves arrival order.
+        """
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._pending[key] = self._pending.get(key, 0) + 1
+
+        try:
+            async with lock:
+                async with self.semaphore:
+                    self.active += 1
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.active -= 1
+        finally:
+            self._pending[key] -= 1
+            if self._pending[key] == 0:
+                # Drop idle senders so memory stays bounded
+                del self._pending[key]
+                del self._locks[key]
+
+    def stats(self) -> Dict:
+        """Current dispatcher load"""
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "utilisation": round(self.active / self.max_concurrency, 3) if self.max_concurrency else 0.0,
+            "senders_pending": len(self._pending),
+            "messages_pending": sum(self._pending.values()),
+        }
@@ -0,0 +1,326 @@
+"""
+Client-side rate limiting for the Groq API (free tier)
+
+GroqRateLimiter sits in front of every chat-completions call and combines:
+
+- token buckets for requests/minute and tokens/minute, re-synced from
+  Groq's x-ratelimit-* response headers (and Retry-After on 429)
+- FIFO admission, so callers are served in arrival order
+- AIMD concurrency: +1 slot per window of successes, halved on 429/5xx
+- a circuit breaker that opens after repeated failures, so callers fail over
+  to the rule-based engine instantly instead of waiting on timeouts
+
+Callers that would have to wait longer than `max_wait` are rejected with
+GroqUnavailableError rather than queued.
+
+Usage:
+    try:
+        async with groq_limiter.request(estimated_tokens) as call:
+            response = await client.post(...)
+            call.record_response(response.status_code, response.headers, used_tokens)
+    except GroqUnavailableError:
+        ...  # fall back
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger("AgriAI.groq")
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+class GroqUnavailableError(Exception):
+    """Groq can't take this request right now; use the fallback"""
+
+
+class CircuitOpenError(GroqUnavailableError):
+    """Raised while the circuit breaker is open"""
+
+
+class RateLimitedError(GroqUnavailableError):
+    """Raised when the rate limits would make the caller wait too long"""
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse Groq reset durations like '7.66s', '2m59.56s' or '120ms' into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """Per-minute budget that refills continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.capacity / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if available now)"""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        amount = min(amount, self.capacity)
+        if self.level < amount:
+            wait = max(wait, (amount - self.level) * 60.0 / self.capacity)
+        return wait
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def refund(self, amount: float, now: float):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset: Optional[float], now: float):
+        """Adopt the server's view of this budget"""
+        self._refill(now)
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+            if remaining <= 0 and reset:
+                self.blocked_until = max(self.blocked_until, now + reset)
+
+
+class GroqRateLimiter:
+    """Token buckets + AIMD concurrency + circuit breaker for Groq calls"""
+
+    def __init__(
+        self,
+        requests_per_minute: int = 30,
+        tokens_per_minute: int = 6000,
+        max_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_wait: float = 5.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.max_wait = max_wait
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.in_flight = 0
+        self._admission: Optional[asyncio.Lock] = None
+        self._slot_freed: Optional[asyncio.Event] = None
+
+        self.circuit_state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.counters = {
+            "admitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "throttled_429": 0,
+            "rejected_circuit_open": 0,
+            "rejected_rate_limited": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Admission
+    # ------------------------------------------------------------------
+
+    def _check_circuit(self, now: float):
+        if self.circuit_state == "open":
+            if now - self._opened_at < self.reset_timeout:
+                self.counters["rejected_circuit_open"] += 1
+                raise CircuitOpenError("Groq circuit breaker is open")
+            self.circuit_state = "half-open"
+            logger.info("Groq circuit breaker half-open, sending a probe request")
+
+        if self.circuit_state == "half-open" and self._probe_in_flight:
+            self.counters["rejected_circuit_open"] += 1
+            raise CircuitOpenError("Groq circuit breaker is half-open (probe in flight)")
+
+    async def _acquire(self, estimated_tokens: int) -> bool:
+        """Wait for admission; True if this call is the half-open probe"""
+        if self._admission is None:
+            self._admission = asyncio.Lock()
+            self._slot_freed = asyncio.Event()
+
+        deadline = time.monotonic() + self.max_wait
+        # One caller at a time goes through admission: FIFO fairness
+        async with self._admission:
+            while True:
+                now = time.monotonic()
+                self._check_circuit(now)
+
+                wait = max(
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(estimated_tokens, now),
+                )
+                if now + wait > deadline:
+                    self.counters["rejected_rate_limited"] += 1
+                    raise RateLimitedError(f"Groq rate limit: would wait {wait:.1f}s")
+
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                if self.in_flight >= int(self.concurrency_limit):
+                    self._slot_freed.clear()
+                    try:
+                        await asyncio.wait_for(self._slot_freed.wait(), timeout=deadline - now)
+                    except asyncio.TimeoutError:
+                        self.counters["rejected_rate_limited"] += 1
+                        raise RateLimitedError("Groq concurrency limit: no free slot")
+                    continue
+
+                self.requests.take(1, now)
+                self.tokens.take(estimated_tokens, now)
+                self.in_flight += 1
+                self.counters["admitted"] += 1
+                if self.circuit_state == "half-open":
+                    self._probe_in_flight = True
+                    return True
+                return False
+
+    def _release(self, is_probe: bool = False):
+        self.in_flight -= 1
+        # Calls admitted before the breaker opened may finish mid-probe
+        if is_probe:
+            self._probe_in_flight = False
+        if self._slot_freed is not None:
+            self._slot_freed.set()
+
+    def request(self, estimated_tokens: int) -> "_GroqCall":
+        """Async context manager that admits one Groq call"""
+        return _GroqCall(self, estimated_tokens)
+
+    # ------------------------------------------------------------------
+    # Feedback
+    # ------------------------------------------------------------------
+
+    def _on_success(self):
+        self.counters["succeeded"] += 1
+        self.consecutive_failures = 0
+        if self.circuit_state != "closed":
+            logger.info("Groq circuit breaker closed")
+        self.circuit_state = "closed"
+        # Additive increase: about +1 slot per window of successful calls
+        self.concurrency_limit = min(
+            float(self.max_concurrency),
+            self.concurrency_limit + 1.0 / max(self.concurrency_limit, 1.0),
+        )
+
+    def _on_failure(self, reason: str):
+        self.counters["failed"] += 1
+        self.consecutive_failures += 1
+        # Multiplicative decrease
+        self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+
+        if self.circuit_state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+            if self.circuit_state != "open":
+                logger.warning(
+                    "Groq circuit breaker opened after %s failure(s) (last: %s); "
+                    "using rule-based fallback for %.0fs",
+                    self.consecutive_failures, reason, self.reset_timeout
+                )
+            self.circuit_state = "open"
+            self._opened_at = time.monotonic()
+
+    def _sync_headers(self, headers: Mapping[str, str], now: float):
+        def number(name: str) -> Optional[float]:
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        self.requests.sync(
+            number("x-ratelimit-limit-requests"),
+            number("x-ratelimit-remaining-requests"),
+            parse_duration(headers.get("x-ratelimit-reset-requests")),
+            now,
+        )
+        self.tokens.sync(
+            number("x-ratelimit-limit-tokens"),
+            number("x-ratelimit-remaining-tokens"),
+            parse_duration(headers.get("x-ratelimit-reset-tokens")),
+            now,
+        )
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        self.requests._refill(now)
+        self.tokens._refill(now)
+        return {
+            "circuit_state": self.circuit_state,
+            "consecutive_failures": self.consecutive_failures,
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "requests_available": round(self.requests.level, 1),
+            "requests_per_minute": self.requests.capacity,
+            "tokens_available": round(self.tokens.level),
+            "tokens_per_minute": self.tokens.capacity,
+            **self.counters,
+        }
+
+
+class _GroqCall:
+    """One admitted Groq request; reports its outcome back to the limiter"""
+
+    def __init__(self, limiter: GroqRateLimiter, estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self._recorded = False
+        self._is_probe = False
+
+    async def __aenter__(self) -> "_GroqCall":
+        self._is_probe = await self.limiter._acquire(self.estimated_tokens)
+        return self
+
+    def record_response(self, status_code: int, headers: Mapping[str, str], used_tokens: Optional[int] = None):
+        """Feed the response status, rate-limit headers and actual usage back"""
+        limiter = self.limiter
+        now = time.monotonic()
+        self._recorded = True
+
+        if used_tokens is not None:
+            limiter.tokens.refund(self.estimated_tokens - used_tokens, now)
+        limiter._sync_headers(headers, now)
+
+        if status_code == 429:
+            limiter.counters["throttled_429"] += 1
+            retry_after = parse_duration(headers.get("retry-after"))
+            if retry_after:
+                limiter.requests.blocked_until = max(limiter.requests.blocked_until, now + retry_after)
+            limiter._on_failure("HTTP 429")
+        elif status_code >= 500:
+            limiter._on_failure(f"HTTP {status_code}")
+        elif status_code < 400:
+            limiter._on_success()
+        # Other 4xx (bad request, auth) say nothing about Groq's capacity
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is not None and not self._recorded and issubclass(exc_type, Exception):
+                # Timeouts and connection errors count against the breaker
+                self.limiter._on_failure(exc_type.__name__)
+        finally:
+            self.limiter._release(self._is_probe)
+        return False
@@ -0,0 +1,140 @@
+"""
+Shared HTTP clients for upstream APIs
+
+One long-lived httpx.AsyncClient per upstream (Groq, Open-Meteo, WhatsApp
+Graph API) so connections are kept alive and reused across messages instead
+of paying a new TCP+TLS handshake on every call.
+
+Usage:
+    client = http_clients.get("groq")
+    response = await client.post(url, json=payload)
+"""
+
+import importlib.util
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger("AgriAI.http")
+
+# HTTP/2 needs the optional `h2` package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    """Connection and timeout settings for one upstream"""
+    timeout: float
+    connect_timeout: float = 5.0
+    max_connections: int = 10
+    max_keepalive_connections: int = 5
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+
+
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    # LLM calls are slow; a handful of connections covers the free-tier limits
+    "groq": UpstreamConfig(timeout=30.0, max_connections=10, max_keepalive_connections=5),
+    # Geocoding and forecast hosts share one pool
+    "weather": UpstreamConfig(timeout=10.0, max_connections=10, max_keepalive_connections=4),
+    # Every reply goes through the Graph API, so it gets the largest pool
+    "whatsapp": UpstreamConfig(timeout=10.0, max_connections=20, max_keepalive_connections=10),
+}
+
+
+class HTTPClientRegistry:
+    """Application-lifetime registry of pooled AsyncClients, one per upstream"""
+
+    def __init__(self, upstreams: Dict[str, UpstreamConfig]):
+        self.upstreams = upstreams
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._request_counts: Dict[str, int] = {name: 0 for name in upstreams}
+        # func(upstream, status_code) called for every response (e.g. metrics)
+        self._response_hooks: List[Callable[[str, int], None]] = []
+
+    def add_response_hook(self, func: Callable[[str, int], None]):
+        """Call func(upstream, status_code) for every upstream response"""
+        self._response_hooks.append(func)
+
+    def _create_client(self, name: str) -> httpx.AsyncClient:
+        config = self.upstreams[name]
+
+        async def count_request(request: httpx.Request):
+            self._request_counts[name] += 1
+
+        async def report_response(response: httpx.Response):
+            for hook in self._response_hooks:
+                hook(name, response.status_code)
+
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            http2=config.http2 and HTTP2_AVAILABLE,
+            event_hooks={"request": [count_request], "response": [report_response]},
+        )
+
+    async def start(self):
+        """Create all clients (called from the app startup hook)"""
+        for name in self.upstreams:
+            self.get(name)
+        logger.info(
+            "HTTP clients ready: %s (HTTP/2 %s)",
+            ", ".join(self.upstreams), "enabled" if HTTP2_AVAILABLE else "unavailable"
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        Get the shared client for an upstream
+
+        Clients are created lazily, so scripts that never run the startup
+        hook still get a pooled client.
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create_client(name)
+            self._clients[name] = client
+        return client
+
+    async def close(self):
+        """Close all clients and their connection pools (called on shutdown)"""
+        for name, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning("Failed to close HTTP client '%s': %s", name, e)
+        self._clients.clear()
+
+    def pool_stats(self) -> Dict[str, Dict]:
+        """Report per-upstream pool usage (open/idle connections, requests sent)"""
+        stats = {}
+        for name, config in self.upstreams.items():
+            client = self._clients.get(name)
+            connections = self._pool_connections(client)
+            stats[name] = {
+                "requests": self._request_counts[name],
+                "max_connections": config.max_connections,
+                "open_connections": len(connections) if connections is not None else None,
+                "idle_connections": (
+                    sum(1 for conn in connections if conn.is_idle())
+                    if connections is not None else None
+                ),
+                "http2": config.http2 and HTTP2_AVAILABLE,
+            }
+        return stats
+
+    @staticmethod
+    def _pool_connections(client: Optional[httpx.AsyncClient]):
+        """Best-effort access to httpcore's pool (not part of httpx's public API)"""
+        if client is None or client.is_closed:
+            return []
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        return getattr(pool, "connections", None)
+
+
+http_clients = HTTPClientRegistry(UPSTREAMS)
@@ -0,0 +1,212 @@
+"""
+Non-blocking, structured logging
+
+Log calls on the event loop only put the record on a bounded queue
+(logging.handlers.QueueHandler); a QueueListener thread formats it and
+writes it to stdout. One JSON object is written per line.
+
+- Lazy formatting: messages are passed as `logger.warning("... %s", value)`
+  and only interpolated on the listener thread. Tracebacks are rendered
+  once, and only for records that are actually emitted.
+- Rate limiting: repeated WARNING/ERROR records with the same source
+  (logger, level, message template and `context` extra, digits ignored so
+  ids and phone numbers don't make every line unique) are limited to `burst` per `window`
+  seconds. The next record let through carries a "suppressed" count.
+- If the queue is full (stdout can't keep up) records are dropped and
+  counted rather than blocking the caller.
+
+Usage:
+    listener = setup_logging(level="INFO", json_lines=True)
+    logger.error("Groq API error (%s): %s", model, e, exc_info=e)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+_DIGITS_RE = re.compile(r"\d+")
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Arguments that are safe to format later on another thread
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None), bytes)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most `burst` repeats of a warning/error per `window` seconds"""
+
+    def __init__(self, burst: int = 5, window: float = 60.0, max_keys: int = 1000, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [window start, records let through, records suppressed]
+        self._windows: Dict[Tuple, list] = {}
+        self.suppressed = 0
+
+    def _key(self, record: logging.LogRecord) -> Tuple:
+        # An explicit `extra={"context": ...}` separates records sharing a template
+        context = getattr(record, "context", "")
+        return (record.name, record.levelno, _DIGITS_RE.sub("#", f"{record.msg}|{context}"))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+
+        now = self.clock()
+        key = self._key(record)
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.window:
+            if window is None and len(self._windows) >= self.max_keys:
+                # Forget the oldest source rather than growing without bound
+                self._windows.pop(next(iter(self._windows)))
+            suppressed = window[2] if window is not None else 0
+            window = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+
+        if window[1] >= self.burst:
+            window[2] += 1
+            self.suppressed += 1
+            return False
+        window[1] += 1
+        return True
+
+
+def _args(args):
+    return args.values() if isinstance(args, dict) else args
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread
+
+    The stock QueueHandler formats every record on the calling thread. Here
+    only tracebacks (which reference live frames) and mutable arguments
+    are rendered before the record is queued.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        if record.args and not all(isinstance(arg, _IMMUTABLE_TYPES) for arg in _args(record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    """The previous human-readable format, plus the suppressed count"""
+
+    def __init__(self):
+        super().__init__(
+            "%(asctime)s | %(levelname)-8s | %(name)s | %(funcName)s:%(lineno)d | %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (+{suppressed} similar suppressed)"
+        return text
+
+
+_state: Dict[str, object] = {}
+
+
+def setup_logging(
+    level: str = "INFO",
+    json_lines: bool = True,
+    queue_size: int = 10000,
+    rate_limit_burst: int = 5,
+    rate_limit_window: float = 60.0,
+) -> logging.handlers.QueueListener:
+    """Route the root logger through a queue and a stdout listener thread"""
+    if "listener" in _state:
+        return _state["listener"]
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter() if json_lines else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = LazyQueueHandler(log_queue)
+    rate_limiter = RateLimitFilter(burst=rate_limit_burst, window=rate_limit_window)
+    queue_handler.addFilter(rate_limiter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    _state.update(listener=listener, queue_handler=queue_handler, rate_limiter=rate_limiter)
+    return listener
+
+
+def add_record_filter(record_filter: logging.Filter):
+    """
+    Add a filter that runs on the calling thread, before a record is queued
+
+    That is where contextvars (e.g. the current trace) are still visible.
+    """
+    _state["queue_handler"].addFilter(record_filter)
+
+
+def logging_stats() -> Optional[Dict]:
+    """Queue depth and dropped / suppressed counts, for /health"""
+    if "listener" not in _state:
+        return None
+    queue_handler: LazyQueueHandler = _state["queue_handler"]
+    rate_limiter: RateLimitFilter = _state["rate_limiter"]
+    return {
+        "queued": queue_handler.queue.qsize(),
+        "dropped": queue_handler.dropped,
+        "suppressed": rate_limiter.suppressed,
+    }
@@ -10,9 +10,9 @@ Stack:
 - Railway (hosting)
 """
 
-from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 import os
 import httpx
 import json
@@ -24,12 +24,33 @@ import hashlib
 from dotenv import load_dotenv
 import secrets
 import logging
-import traceback
-import sys
-from contextlib import asynccontextmanager
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 from pathlib import Path
 
+from cache import SingleFlight, TTLCache
+from dedup import MessageDeduplicator, SQLiteSeenStore
+from diagnosis_cache import DiagnosisCache
+from dispatcher import OrderedDispatcher
+from groq_limiter import GroqRateLimiter, GroqUnavailableError
+from metrics import registry as metrics_registry
+from model_cascade import ModelCascade
+from outbound import OutboundDispatcher
+from prompt_builder import PromptBuilder
+from sessions import Session, SessionStore, parse_feedback
+from rule_engine import RulePackRegistry
+from streaming_json import JSONFieldStream
+from tracing import OTLPFileExporter, TraceLogFilter, Tracer
+from webhook_capture import WebhookCapture
+from http_clients import http_clients
+from log_pipeline import add_record_filter, logging_stats, setup_logging
+from work_queue import DurableWorkQueue, QueueFullError
+from write_behind import WriteBehindBuffer
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
 # Load environment variables
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
@@ -38,19 +59,20 @@ load_dotenv(dotenv_path=env_path)
 # LOGGING CONFIGURATION
 # ============================================================================
 
-# Configure logging with detailed format
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)-8s | %(name)s | %(funcName)s:%(lineno)d | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
+# Log records are queued and written as JSON lines by a background thread,
+# so logging never blocks the event loop (see log_pipeline.py).
+# LOG_FORMAT=text keeps the old human-readable lines for local development.
+setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    json_lines=os.getenv("LOG_FORMAT", "json").lower() != "text",
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    # Repeats of the same warning/error beyond this many per window are dropped
+    rate_limit_burst=int(os.getenv("LOG_RATE_LIMIT_BURST", "5")),
+    rate_limit_window=float(os.getenv("LOG_RATE_LIMIT_WINDOW_SECONDS", "60"))
 )
 
-# Create logger
+# Create logger (its level follows LOG_LEVEL on the root logger)
 logger = logging.getLogger("AgriAI")
-logger.setLevel(logging.INFO)
 
 # Suppress noisy third-party loggers
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -91,14 +113,15 @@ def log_error(error: Exception, context: str = "Unknown", user_id: str = "unknow
         "context": context,
         "user_id": user_id,
         "error_type": type(error).__name__,
-        "error_message": str(error),
-        "traceback": traceback.format_exc()
+        "error_message": str(error)
     }
     
+    # Formatted (traceback included) on the logging thread, if not rate limited
     logger.error(
-        f"ERROR in {context} | User: {user_id} | "
-        f"{type(error).__name__}: {str(error)}\n"
-        f"Traceback:\n{traceback.format_exc()}"
+        "ERROR in %s | User: %s | %s: %s",
+        context, user_id, error_details["error_type"], error_details["error_message"],
+        exc_info=error,
+        extra={"context": context, "user_id": user_id}
     )
     
     return error_details
@@ -224,16 +247,205 @@ WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID", "")
 WEBHOOK_VERIFY_TOKEN = os.getenv("WEBHOOK_VERIFY_TOKEN", "your_verify_token_123")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 
+# Upstream API endpoints; override to point at local stand-ins for load tests
+# (see benchmarks/fake_upstreams.py)
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
+WHATSAPP_API_BASE = os.getenv("WHATSAPP_API_BASE", "https://graph.facebook.com/v18.0")
+OPEN_METEO_GEOCODING_URL = os.getenv(
+    "OPEN_METEO_GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search"
+)
+OPEN_METEO_FORECAST_URL = os.getenv("OPEN_METEO_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+
+# Supabase's Python client is synchronous, so every query runs on a bounded
+# thread pool instead of the event loop
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "8"))
+
+# Max WhatsApp messages handled at once (different senders run in parallel,
+# messages from the same sender always run in order)
+MESSAGE_CONCURRENCY = int(os.getenv("MESSAGE_CONCURRENCY", "10"))
+
+# Webhook work queue: journaled to local SQLite so unprocessed webhooks
+# survive a restart; when full, Meta gets a 503 and redelivers later.
+# Jobs start immediately - MESSAGE_CONCURRENCY is what bounds the work.
+WEBHOOK_QUEUE_PATH = os.getenv(
+    "WEBHOOK_QUEUE_PATH",
+    str(Path(__file__).resolve().parent / "data" / "webhook_queue.sqlite3")
+)
+WEBHOOK_QUEUE_MAX_SIZE = int(os.getenv("WEBHOOK_QUEUE_MAX_SIZE", "1000"))
+WEBHOOK_RETRY_AFTER_SECONDS = 5
+
+# Outbound WhatsApp sends are queued and paced to the phone number's Cloud
+# API throughput (80 msg/s by default); 429/5xx are retried with backoff
+WHATSAPP_SEND_RATE = float(os.getenv("WHATSAPP_SEND_RATE", "80"))
+WHATSAPP_SEND_CONCURRENCY = int(os.getenv("WHATSAPP_SEND_CONCURRENCY", "20"))
+WHATSAPP_SEND_QUEUE_SIZE = int(os.getenv("WHATSAPP_SEND_QUEUE_SIZE", "5000"))
+WHATSAPP_SEND_MAX_ATTEMPTS = int(os.getenv("WHATSAPP_SEND_MAX_ATTEMPTS", "5"))
+
+# Opt-in: append anonymized raw webhooks here for replay (unset = off);
+# see webhook_capture.py and benchmarks/replay_webhooks.py
+WEBHOOK_CAPTURE_DIR = os.getenv("WEBHOOK_CAPTURE_DIR", "")
+WEBHOOK_CAPTURE_MAX_MB = float(os.getenv("WEBHOOK_CAPTURE_MAX_MB", "50"))
+WEBHOOK_CAPTURE_MAX_FILES = int(os.getenv("WEBHOOK_CAPTURE_MAX_FILES", "20"))
+
+# Message-id deduplication for Meta's webhook redeliveries. Set
+# MESSAGE_DEDUP_PATH to also remember processed ids across restarts.
+MESSAGE_DEDUP_TTL_SECONDS = float(os.getenv("MESSAGE_DEDUP_TTL_SECONDS", "86400"))
+MESSAGE_DEDUP_MAX_SIZE = int(os.getenv("MESSAGE_DEDUP_MAX_SIZE", "50000"))
+MESSAGE_DEDUP_PATH = os.getenv("MESSAGE_DEDUP_PATH", "")
+
+# Write-behind for diagnoses/feedback: inserted in bulk every
+# WRITE_BEHIND_FLUSH_SECONDS or WRITE_BEHIND_BATCH_SIZE rows; spilled to a
+# local file while the database is unreachable
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "1"))
+WRITE_BEHIND_SPILL_PATH = os.getenv(
+    "WRITE_BEHIND_SPILL_PATH",
+    str(Path(__file__).resolve().parent / "data" / "write_behind_spill.jsonl")
+)
+
+# Weather caches: place name -> coordinates rarely changes, forecasts are
+# shared by everyone in the same ~0.1 degree grid cell for a short time
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "5000"))
+GEOCODE_CACHE_TTL_SECONDS = float(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(7 * 86400)))
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "2000"))
+FORECAST_CACHE_TTL_SECONDS = float(os.getenv("FORECAST_CACHE_TTL_SECONDS", "1800"))
+FORECAST_GRID_DEGREES = float(os.getenv("FORECAST_GRID_DEGREES", "0.1"))
+
+# AI diagnosis cache: reuse answers for the same crop/region/weather and
+# (near-)identical observations. Threshold 0 disables paraphrase matching.
+DIAGNOSIS_CACHE_SIZE = int(os.getenv("DIAGNOSIS_CACHE_SIZE", "2000"))
+DIAGNOSIS_CACHE_TTL_SECONDS = float(os.getenv("DIAGNOSIS_CACHE_TTL_SECONDS", str(6 * 3600)))
+DIAGNOSIS_SIMILARITY_THRESHOLD = float(os.getenv("DIAGNOSIS_SIMILARITY_THRESHOLD", "0.8"))
+
+# Groq free-tier limits (re-synced from response headers at runtime) and
+# the circuit breaker that fails over to rule-based diagnosis
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+GROQ_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("GROQ_MAX_QUEUE_WAIT_SECONDS", "5"))
+GROQ_BREAKER_FAILURES = int(os.getenv("GROQ_BREAKER_FAILURES", "5"))
+GROQ_BREAKER_RESET_SECONDS = float(os.getenv("GROQ_BREAKER_RESET_SECONDS", "30"))
+
+# Stream Groq completions: lets the farmer see the issue/risk early and stops
+# generation as soon as the diagnosis fields are complete
+GROQ_STREAMING = os.getenv("GROQ_STREAMING", "true").lower() == "true"
+
+# Groq models tried in order (comma-separated, cheapest first); the next one
+# is asked when an answer's confidence is below GROQ_ESCALATION_CONFIDENCE
+GROQ_MODEL_CASCADE = [
+    model.strip()
+    for model in os.getenv("GROQ_MODEL_CASCADE", "llama-3.1-8b-instant,llama-3.1-70b-versatile").split(",")
+    if model.strip()
+]
+GROQ_ESCALATION_CONFIDENCE = float(os.getenv("GROQ_ESCALATION_CONFIDENCE", "70"))
+
+# Hedged requests: start the next model when one is slower than its p90
+# latency (GROQ_HEDGE_DELAY_SECONDS until enough latencies are recorded)
+GROQ_HEDGING = os.getenv("GROQ_HEDGING", "false").lower() == "true"
+GROQ_HEDGE_DELAY_SECONDS = float(os.getenv("GROQ_HEDGE_DELAY_SECONDS", "2"))
+
+# Longer farmer messages are compacted to about this many tokens
+GROQ_MAX_OBSERVATION_TOKENS = int(os.getenv("GROQ_MAX_OBSERVATION_TOKENS", "300"))
+
+# Answer max_tokens per issue class, e.g. "default=250,unknown=320,tomato:multi=360"
+# (classes: unknown, multi, or the matching rule id; keys may be prefixed by crop)
+GROQ_MAX_TOKENS_BUDGETS = {
+    key.strip(): int(value)
+    for key, value in (
+        item.split("=", 1) for item in os.getenv("GROQ_MAX_TOKENS_BUDGETS", "").split(",") if "=" in item
+    )
+}
+
+# Offline diagnosis rule packs (default.json + <crop>.json), used whenever
+# Groq is unavailable. Edited packs are picked up without a restart.
+RULES_DIR = os.getenv("RULES_DIR", str(Path(__file__).resolve().parent / "rules"))
+RULE_PACKS_MAX_LOADED = int(os.getenv("RULE_PACKS_MAX_LOADED", "32"))
+RULE_PACKS_CHECK_SECONDS = float(os.getenv("RULE_PACKS_CHECK_SECONDS", "5"))
+
+# Per-sender conversation sessions (user record, weather, last diagnosis)
+SESSION_MAX_SIZE = int(os.getenv("SESSION_MAX_SIZE", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_WEATHER_TTL_SECONDS = float(os.getenv("SESSION_WEATHER_TTL_SECONDS", "900"))
+
+# User records by phone: known users are cached for USER_CACHE_TTL_SECONDS,
+# unknown numbers (mid-onboarding) for USER_CACHE_NEGATIVE_TTL_SECONDS
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "600"))
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+
+# Dashboard and /stats numbers come from maintained counters (see
+# get_platform_stats in database/schema.sql) and are cached this long
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", "30"))
+
+# Per-message traces are appended here as OTLP/JSON lines (unset = not exported)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+# Only export traces of messages that took at least this long
+TRACE_EXPORT_MIN_MS = float(os.getenv("TRACE_EXPORT_MIN_MS", "0"))
+
+_CACHE_MISS = object()
+
+# ============================================================================
+# METRICS (Prometheus text format on /metrics)
+# ============================================================================
+
+STAGE_SECONDS = metrics_registry.histogram(
+    "agriai_stage_duration_seconds",
+    "Time spent in each stage of handling a WhatsApp message",
+    ["stage"]
+)
+RULE_FALLBACKS = metrics_registry.counter(
+    "agriai_rule_based_fallbacks_total",
+    "Diagnoses answered by the rule-based engine instead of Groq",
+    ["reason"]
+)
+TIMEOUTS = metrics_registry.counter(
+    "agriai_timeouts_total",
+    "Operations that timed out",
+    ["stage"]
+)
+UPSTREAM_RESPONSES = metrics_registry.counter(
+    "agriai_upstream_responses_total",
+    "HTTP responses from upstream APIs by status code",
+    ["upstream", "status"]
+)
+
+OUTBOUND_DELIVERY_SECONDS = metrics_registry.histogram(
+    "agriai_outbound_delivery_seconds",
+    "Time from queueing a WhatsApp reply to the Graph API accepting it"
+)
+OUTBOUND_DROPPED = metrics_registry.counter(
+    "agriai_outbound_dropped_total",
+    "WhatsApp replies that were never delivered",
+    ["reason"]
+)
+
+http_clients.add_response_hook(
+    lambda upstream, status: UPSTREAM_RESPONSES.inc(upstream=upstream, status=str(status))
+)
+
+# One trace per WhatsApp message; log lines carry its trace_id / span_id
+tracer = Tracer(
+    exporter=OTLPFileExporter(Path(TRACE_EXPORT_PATH)) if TRACE_EXPORT_PATH else None,
+    min_duration_ms=TRACE_EXPORT_MIN_MS
+)
+add_record_filter(TraceLogFilter())
+
+@contextmanager
+def pipeline_stage(stage: str, **attributes):
+    """Time one pipeline stage: a trace span plus the stage latency histogram"""
+    with tracer.span(stage, **attributes), STAGE_SECONDS.time(stage=stage):
+        yield
+
 # Initialize Supabase client
 supabase: Optional[Client] = None
 if SUPABASE_URL and SUPABASE_KEY:
-    # Only initialize if URL looks valid (starts with https://)
-    if SUPABASE_URL.startswith("https://") and not SUPABASE_KEY.startswith("your-"):
+    # Only initialize if URL looks valid (http:// for a local Supabase/PostgREST)
+    if SUPABASE_URL.startswith(("https://", "http://")) and not SUPABASE_KEY.startswith("your-"):
         try:
             supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
             logger.info("✅ Supabase client initialized successfully")
         except Exception as e:
-            logger.error(f"❌ Failed to initialize Supabase: {e}")
+            logger.error("❌ Failed to initialize Supabase: %s", e)
             log_error(e, context="Supabase initialization")
     else:
         logger.warning("⚠️  Supabase credentials look invalid - using in-memory mode")
@@ -244,15 +456,60 @@ else:
 # DATABASE FUNCTIONS
 # ============================================================================
 
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="supabase")
+
+
+# Round trips to Supabase and inbound messages handled, for /health
+db_query_count = 0
+messages_handled = 0
+
+
+async def run_db(query):
+    """
+    Execute a Supabase query builder without blocking the event loop
+
+    The blocking `.execute()` round trip runs on `db_executor`, so at most
+    DB_MAX_WORKERS queries are in flight and other coroutines keep running.
+
+    Args:
+        query: Any Supabase/PostgREST request builder (anything with .execute())
+
+    Returns:
+        The APIResponse from `.execute()`
+    """
+    global db_query_count
+    db_query_count += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, query.execute)
+
+
+# Only the user columns message handlers read
+USER_COLUMNS = "id, phone, name, location, primary_crop, referral_code, latitude, longitude, location_geocoded"
+
+user_cache = TTLCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
 async def get_user_by_phone(phone: str) -> Optional[Dict]:
-    """Get user from database by phone number"""
+    """
+    Get user from database by phone number, cached for USER_CACHE_TTL_SECONDS
+    
+    Unknown numbers are cached as None for USER_CACHE_NEGATIVE_TTL_SECONDS;
+    create_user replaces that entry with the new record.
+    """
     if not supabase:
         return None
+    
+    user = user_cache.get(phone, _CACHE_MISS)
+    if user is not _CACHE_MISS:
+        return user
+    
     try:
-        result = supabase.table("users").select("*").eq("phone", phone).execute()
-        return result.data[0] if result.data else None
+        result = await run_db(supabase.table("users").select(USER_COLUMNS).eq("phone", phone))
+        user = result.data[0] if result.data else None
+        user_cache.set(phone, user, ttl=None if user else USER_CACHE_NEGATIVE_TTL_SECONDS)
+        return user
     except Exception as e:
-        print(f"Error getting user: {e}")
+        logger.error("Error getting user: %s", e)
         return None
 
 
@@ -265,62 +522,203 @@ async def create_user(phone: str, name: str = "Farmer") -> Dict:
         # Generate referral code
         referral_code = hashlib.md5(phone.encode()).hexdigest()[:8].upper()
         
-        result = supabase.table("users").insert({
+        result = await run_db(supabase.table("users").insert({
             "phone": phone,
             "name": name,
             "referral_code": referral_code,
             "referrals": 0,
             "created_at": datetime.utcnow().isoformat()
-        }).execute()
-        return result.data[0] if result.data else {}
+        }))
+        user = result.data[0] if result.data else {}
+        if user:
+            # Write through, replacing the negative entry from the lookup
+            user_cache.set(phone, user)
+        return user
     except Exception as e:
-        print(f"Error creating user: {e}")
+        logger.error("Error creating user: %s", e)
         return {"id": "temp", "phone": phone, "name": name}
 
 
-async def save_diagnosis(user_id: str, diagnosis: Dict) -> bool:
-    """Save diagnosis to database"""
+async def save_user_coordinates(user_id: str, location: str, coords: Optional[tuple]) -> bool:
+    """Store the geocoded coordinates for a user's location (None if unknown place)"""
     if not supabase:
         return False
     
     try:
-        supabase.table("diagnoses").insert({
-            "user_id": user_id,
-            "crop": diagnosis.get("crop", "unknown"),
-            "issue": diagnosis.get("issue", ""),
-            "confidence": diagnosis.get("confidence", 0),
-            "recommendation": diagnosis.get("recommendation", ""),
-            "method": diagnosis.get("method", "unknown"),
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        await run_db(supabase.table("users").update({
+            "latitude": coords[0] if coords else None,
+            "longitude": coords[1] if coords else None,
+            "location_geocoded": location
+        }).eq("id", user_id))
         return True
     except Exception as e:
-        print(f"Error saving diagnosis: {e}")
+        logger.error("Error saving user coordinates: %s", e)
+        return False
+
+
+async def bulk_insert(table: str, rows: List[Dict]):
+    """Insert a batch of rows; rows already present (same id) are skipped"""
+    await run_db(supabase.table(table).upsert(
+        rows, ignore_duplicates=True, returning=ReturnMethod.minimal
+    ))
+
+
+def is_rejected_write(error: Exception) -> bool:
+    """
+    True when PostgREST refused the rows themselves (bad data, constraint
+    violation, other 4xx), False for outages that should be spilled and
+    retried later. postgrest-py raises APIError for every non-2xx response,
+    including 5xx/503 from PostgREST or the Supabase gateway.
+    """
+    if not isinstance(error, APIError):
         return False
+    code = str(error.code or "")
+    if code.isdigit() and len(code) == 3:
+        # No JSON body: the code is the HTTP status
+        return code.startswith("4") and code not in ("408", "429")
+    # SQLSTATE 22xxx (data exception) / 23xxx (integrity constraint), and
+    # PostgREST's own request errors (PGRST1xx, answered with 4xx)
+    return code[:2] in ("22", "23") or code.startswith("PGRST1")
+
+
+# Diagnoses are flushed before the feedback rows that reference them
+write_buffer = WriteBehindBuffer(
+    bulk_insert,
+    tables=["diagnoses", "feedback"],
+    spill_path=Path(WRITE_BEHIND_SPILL_PATH),
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=WRITE_BEHIND_FLUSH_SECONDS,
+    is_rejection=is_rejected_write
+)
+
+
+async def save_diagnosis(user_id: str, diagnosis: Dict) -> Optional[str]:
+    """
+    Queue a diagnosis for saving; returns its id (None if there's no database)
+    
+    The id is generated here so it can be used (e.g. for feedback) before the
+    row is actually written by the write-behind buffer.
+    """
+    if not supabase:
+        return None
+    
+    diagnosis_id = str(uuid.uuid4())
+    write_buffer.add("diagnoses", {
+        "id": diagnosis_id,
+        "user_id": user_id,
+        "crop": diagnosis.get("crop", "unknown"),
+        "issue": diagnosis.get("issue", ""),
+        "confidence": diagnosis.get("confidence", 0),
+        "recommendation": diagnosis.get("recommendation", ""),
+        "method": diagnosis.get("method", "unknown"),
+        "created_at": datetime.utcnow().isoformat()
+    })
+    return diagnosis_id
 
 
 async def save_feedback(user_id: str, diagnosis_id: str, feedback_type: str, notes: str = "") -> bool:
-    """Save user feedback for RLHF"""
+    """Queue user feedback for RLHF (written by the write-behind buffer)"""
     if not supabase:
         return False
     
-    try:
-        supabase.table("feedback").insert({
-            "user_id": user_id,
-            "diagnosis_id": diagnosis_id,
-            "feedback_type": feedback_type,
-            "notes": notes,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
-        return True
-    except Exception as e:
-        print(f"Error saving feedback: {e}")
-        return False
+    write_buffer.add("feedback", {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "diagnosis_id": diagnosis_id,
+        "feedback_type": feedback_type,
+        "notes": notes,
+        "created_at": datetime.utcnow().isoformat()
+    })
+    return True
+
+# Dashboard / stats responses, so page refreshes don't each hit the database
+stats_cache = TTLCache(max_size=4, ttl=STATS_CACHE_TTL_SECONDS)
+stats_flights = SingleFlight()
+
+async def _fetch_platform_stats() -> Dict:
+    result = await run_db(supabase.rpc("get_platform_stats", {}))
+    row = (result.data or [{}])[0]
+    return {
+        "total_users": row.get("total_users") or 0,
+        "total_diagnoses": row.get("total_diagnoses") or 0,
+        "diagnoses_today": row.get("diagnoses_today") or 0,
+    }
+
+async def get_platform_stats() -> Dict:
+    """User / diagnosis totals from the trigger-maintained counters (cached)"""
+    stats = stats_cache.get("platform")
+    if stats is None:
+        stats = await stats_flights.do("platform", _fetch_platform_stats)
+        stats_cache.set("platform", stats)
+    return stats
+
+async def _fetch_recent_diagnoses() -> List[Dict]:
+    result = await run_db(
+        supabase.table("diagnoses")
+        .select("crop, issue, confidence")
+        .order("created_at", desc=True)
+        .limit(10)
+    )
+    return result.data or []
+
+async def get_recent_diagnoses() -> List[Dict]:
+    """Latest 10 diagnoses for the dashboard (cached)"""
+    recent = stats_cache.get("recent")
+    if recent is None:
+        recent = await stats_flights.do("recent", _fetch_recent_diagnoses)
+        stats_cache.set("recent", recent)
+    return recent
 
 # ============================================================================
 # AI ENGINE
 # ============================================================================
 
+rule_packs = RulePackRegistry(
+    Path(RULES_DIR),
+    max_loaded=RULE_PACKS_MAX_LOADED,
+    check_interval=RULE_PACKS_CHECK_SECONDS
+)
+
+diagnosis_cache = DiagnosisCache(
+    max_size=DIAGNOSIS_CACHE_SIZE,
+    ttl=DIAGNOSIS_CACHE_TTL_SECONDS,
+    similarity_threshold=DIAGNOSIS_SIMILARITY_THRESHOLD
+)
+
+# Fields a diagnosis must have before it can be sent to the farmer
+REQUIRED_DIAGNOSIS_FIELDS = ("issue", "risk", "confidence", "recommendation")
+
+# Identical diagnosis requests in flight at the same time share one Groq call
+groq_flights = SingleFlight()
+
+groq_limiter = GroqRateLimiter(
+    requests_per_minute=GROQ_REQUESTS_PER_MINUTE,
+    tokens_per_minute=GROQ_TOKENS_PER_MINUTE,
+    max_concurrency=GROQ_MAX_CONCURRENCY,
+    max_wait=GROQ_MAX_QUEUE_WAIT_SECONDS,
+    failure_threshold=GROQ_BREAKER_FAILURES,
+    reset_timeout=GROQ_BREAKER_RESET_SECONDS
+)
+
+prompt_builder = PromptBuilder(
+    max_observation_tokens=GROQ_MAX_OBSERVATION_TOKENS,
+    max_tokens_budgets=GROQ_MAX_TOKENS_BUDGETS
+)
+
+session_store = SessionStore(
+    max_size=SESSION_MAX_SIZE,
+    ttl=SESSION_TTL_SECONDS,
+    weather_ttl=SESSION_WEATHER_TTL_SECONDS
+)
+
+groq_cascade = ModelCascade(
+    GROQ_MODEL_CASCADE,
+    escalation_confidence=GROQ_ESCALATION_CONFIDENCE,
+    hedging=GROQ_HEDGING,
+    hedge_delay=GROQ_HEDGE_DELAY_SECONDS
+)
+
+
 class FreeAIEngine:
     """
     AI engine using free APIs
@@ -329,260 +727,449 @@ class FreeAIEngine:
     
     def __init__(self):
         self.groq_api_key = GROQ_API_KEY
-        self.groq_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.groq_url = f"{GROQ_API_BASE}/chat/completions"
+        # Groq tokens spent by the last diagnosis (all cascade tiers)
+        self.last_usage: Dict = {}
     
     async def diagnose_crop(
         self,
         crop: str,
         observations: str,
         location: str = "unknown",
-        weather: Optional[Dict] = None
+        weather: Optional[Dict] = None,
+        on_preview=None,
+        context: Optional[str] = None,
+        follow_up_of: Optional[str] = None
     ) -> Dict:
         """
         AI-powered crop diagnosis
+        
+        `context` summarises earlier messages from the same farmer and only
+        goes into the prompt. The cache and single-flight keys stay on
+        crop/region/weather/observation plus `follow_up_of` (the previous
+        issue, if any), so follow-ups from different farmers still share
+        answers instead of every session keying its own.
+        
+        With streaming enabled, `on_preview(fields)` is awaited as soon as the
+        model has produced "issue", "risk" and a confidence high enough that
+        the cascade won't escalate, before the full answer.
         """
         # Try AI first
+        fallback_reason = "no_api_key"
         if self.groq_api_key:
+            cache_text = self._cache_text(observations, follow_up_of)
+            cached = diagnosis_cache.get(crop, cache_text, location, weather)
+            if cached:
+                return cached
+            
             try:
-                ai_diagnosis = await self._call_groq_ai(crop, observations, location, weather)
+                # Runs as a shared task: callers that time out stop waiting,
+                # but the call finishes and fills the cache for the others
+                ai_diagnosis = await groq_flights.do(
+                    diagnosis_cache.key(crop, cache_text, location, weather),
+                    self._diagnose_with_groq,
+                    crop, observations, location, weather, on_preview, context, cache_text
+                )
                 if ai_diagnosis:
-                    return ai_diagnosis
+                    return dict(ai_diagnosis)
+                fallback_reason = "groq_no_answer"
             except Exception as e:
-                print(f"AI diagnosis failed: {e}")
+                logger.warning("AI diagnosis failed: %s", e)
+                fallback_reason = "groq_error"
         
         # Fallback to rule-based
+        RULE_FALLBACKS.inc(reason=fallback_reason)
         return self._rule_based_diagnosis(crop, observations)
     
-    async def _call_groq_ai(
+    async def _diagnose_with_groq(
         self,
         crop: str,
         observations: str,
         location: str,
-        weather: Optional[Dict]
+        weather: Optional[Dict],
+        on_preview=None,
+        context: Optional[str] = None,
+        cache_text: Optional[str] = None
     ) -> Optional[Dict]:
-        """Call Groq AI API (free tier)"""
+        """Run the Groq model cascade once and cache a successful answer"""
+        # One prompt for all tiers; the issue class sets the answer budget
+        issue_class = self._issue_class(crop, observations)
+        messages, prompt_tokens = prompt_builder.build(crop, observations, location, weather, context)
+        max_tokens = prompt_builder.max_tokens(crop, issue_class)
         
-        weather_info = ""
-        if weather and "current_weather" in weather:
-            cw = weather["current_weather"]
-            weather_info = f"\nCurrent weather: {cw.get('temperature', 'N/A')}°C, Wind: {cw.get('windspeed', 'N/A')} km/h"
+        async def call_model(model: str, tier_preview) -> tuple:
+            with tracer.span("groq", model=model, issue_class=issue_class, max_tokens=max_tokens) as span:
+                diagnosis, tokens = await self._call_groq_ai(
+                    crop, messages, prompt_tokens, max_tokens, issue_class, model, tier_preview
+                )
+                span.set(tokens=tokens, answered=diagnosis is not None)
+                return diagnosis, tokens
         
-        prompt = f"""You are an expert agricultural advisor. Analyze this farmer's situation and provide actionable advice.
-
-Crop: {crop}
-Location: {location}
-Farmer's observation: {observations}{weather_info}
-
-Provide a diagnosis in this exact JSON format:
-{{
-    "crop": "{crop}",
-    "issue": "brief description of the problem",
-    "confidence": 75,
-    "recommendation": "specific action to take",
-    "risk": "low/medium/high",
-    "method": "ai"
-}}
-
-Be specific and practical. Focus on low-cost solutions."""
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(
-                    self.groq_url,
-                    headers={
-                        "Authorization": f"Bearer {self.groq_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "llama-3.1-70b-versatile",
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": 0.3,
-                        "max_tokens": 500
-                    }
+        ai_diagnosis, tokens = await groq_cascade.run(call_model, on_preview)
+        self.last_usage = {"total_tokens": tokens}
+        if ai_diagnosis:
+            diagnosis_cache.set(crop, cache_text or observations, location, weather, ai_diagnosis, tokens=tokens)
+        return ai_diagnosis
+    
+    @staticmethod
+    def _cache_text(observations: str, follow_up_of: Optional[str]) -> str:
+        """Observation text used for the cache key: coarse, never the raw history"""
+        return f"{observations} [after: {follow_up_of}]" if follow_up_of else observations
+    
+    def _issue_class(self, crop: str, observations: str) -> str:
+        """Rough issue class from the offline rules (rule id, multi or unknown)"""
+        matches = rule_packs.get(crop).match(observations)
+        if not matches:
+            return "unknown"
+        if len(matches) > 1:
+            return "multi"
+        return matches[0].rule.id
+    
+    async def _call_groq_ai(
+        self,
+        crop: str,
+        messages: List[Dict],
+        prompt_tokens: int,
+        max_tokens: int,
+        issue_class: str,
+        model: str,
+        on_preview=None
+    ) -> tuple:
+        """Call Groq AI API (free tier); returns (diagnosis or None, tokens used)"""
+        client = http_clients.get("groq")
+        # Reserve the prompt plus the whole answer budget until Groq reports usage
+        estimated_tokens = prompt_tokens + max_tokens
+        headers = {
+            "Authorization": f"Bearer {self.groq_api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": 0.3,
+            "max_tokens": max_tokens
+        }
+        
+        try:
+            if GROQ_STREAMING:
+                return await self._stream_groq_ai(
+                    client, headers, payload, crop, estimated_tokens, prompt_tokens, issue_class, on_preview
                 )
+            
+            async with groq_limiter.request(estimated_tokens) as call:
+                response = await client.post(self.groq_url, headers=headers, json=payload)
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result["choices"][0]["message"]["content"]
-                    
-                    # Try to extract JSON
-                    start = content.find("{")
-                    end = content.rfind("}") + 1
-                    if start >= 0 and end > start:
-                        diagnosis = json.loads(content[start:end])
-                        return diagnosis
+                result = response.json() if response.status_code == 200 else {}
+                usage = result.get("usage") or {}
+                call.record_response(response.status_code, response.headers, usage.get("total_tokens"))
+            
+            if response.status_code == 200:
+                content = result["choices"][0]["message"]["content"]
+                tokens = usage.get("total_tokens", 0)
+                prompt_builder.record(
+                    issue_class,
+                    usage.get("prompt_tokens", prompt_tokens),
+                    usage.get("completion_tokens", 0)
+                )
                 
-            except Exception as e:
-                print(f"Groq API error: {e}")
+                # Try to extract JSON
+                start = content.find("{")
+                end = content.rfind("}") + 1
+                if start >= 0 and end > start:
+                    try:
+                        return json.loads(content[start:end]), tokens
+                    except json.JSONDecodeError as e:
+                        logger.warning("Groq %s returned invalid JSON: %s", model, e)
+                return None, tokens
+            
+        except GroqUnavailableError as e:
+            logger.warning("Groq skipped, using fallback: %s", e)
+        except httpx.TimeoutException as e:
+            TIMEOUTS.inc(stage="groq")
+            logger.warning("Groq API timeout (%s): %s", model, e)
+        except Exception as e:
+            logger.error("Groq API error (%s): %s", model, e)
         
-        return None
+        return None, 0
     
-    def _rule_based_diagnosis(self, crop: str, observations: str) -> Dict:
-        """
-        Simple rule-based diagnosis
-        Works without any AI API
+    async def _stream_groq_ai(
+        self,
+        client: httpx.AsyncClient,
+        headers: Dict,
+        payload: Dict,
+        crop: str,
+        estimated_tokens: int,
+        prompt_tokens: int,
+        issue_class: str,
+        on_preview=None
+    ) -> tuple:
         """
-        obs_lower = observations.lower()
-        
-        # Keyword matching for common issues
-        if any(word in obs_lower for word in ["yellow", "yellowing", "pale"]):
-            if "leaves" in obs_lower or "leaf" in obs_lower:
-                return {
-                    "crop": crop,
-                    "issue": "Nitrogen deficiency (yellowing leaves)",
-                    "confidence": 70,
-                    "recommendation": "Apply urea fertilizer (50kg per hectare) or compost. Water regularly.",
-                    "risk": "medium",
-                    "method": "rule-based"
-                }
-        
-        if any(word in obs_lower for word in ["spots", "brown spots", "black spots"]):
-            return {
-                "crop": crop,
-                "issue": "Fungal infection (leaf spots)",
-                "confidence": 65,
-                "recommendation": "Remove affected leaves. Apply fungicide or neem oil spray. Improve air circulation.",
-                "risk": "high",
-                "method": "rule-based"
-            }
+        Stream a Groq completion (OpenAI-compatible SSE) and parse it on the fly
         
-        if any(word in obs_lower for word in ["wilting", "drooping", "droopy"]):
-            return {
-                "crop": crop,
-                "issue": "Water stress or root damage",
-                "confidence": 75,
-                "recommendation": "Check soil moisture. Water deeply if dry. Check for root rot if soil is wet.",
-                "risk": "medium",
-                "method": "rule-based"
-            }
+        Fields are extracted as they complete; the stream is closed (stopping
+        generation) as soon as every required diagnosis field is present.
+        """
+        parser = JSONFieldStream()
+        streamed_chars = 0
+        preview_task = None
         
-        if any(word in obs_lower for word in ["holes", "eaten", "chewed"]):
-            return {
-                "crop": crop,
-                "issue": "Pest damage (likely caterpillars or beetles)",
-                "confidence": 70,
-                "recommendation": "Hand-pick pests if visible. Apply neem oil or soap spray. Use companion planting.",
-                "risk": "medium",
-                "method": "rule-based"
-            }
+        async with groq_limiter.request(estimated_tokens) as call:
+            async with client.stream(
+                "POST", self.groq_url, headers=headers, json={**payload, "stream": True}
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    call.record_response(response.status_code, response.headers)
+                    return None, 0
+                
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content") or ""
+                    streamed_chars += len(delta)
+                    parser.feed(delta)
+                    
+                    if on_preview and preview_task is None and all(
+                        field in parser.fields for field in ("issue", "risk", "confidence")
+                    ):
+                        # Send the preview without pausing the stream
+                        preview_task = asyncio.create_task(
+                            safe_async_call(on_preview, dict(parser.fields), context="Send diagnosis preview")
+                        )
+                    
+                    if parser.done or all(field in parser.fields for field in REQUIRED_DIAGNOSIS_FIELDS):
+                        break
+                
+                # Usage isn't reported when we stop early, so estimate it
+                used_tokens = prompt_tokens + streamed_chars // 4
+                call.record_response(response.status_code, response.headers, used_tokens)
+                prompt_builder.record(issue_class, prompt_tokens, streamed_chars // 4)
         
-        if any(word in obs_lower for word in ["stunted", "small", "not growing"]):
-            return {
-                "crop": crop,
-                "issue": "Nutrient deficiency or poor soil",
-                "confidence": 60,
-                "recommendation": "Add compost or balanced fertilizer. Check soil pH. Ensure adequate water.",
-                "risk": "medium",
-                "method": "rule-based"
-            }
+        if preview_task is not None:
+            # The preview must reach the farmer before the full answer
+            await preview_task
+        if not all(field in parser.fields for field in REQUIRED_DIAGNOSIS_FIELDS):
+            return None, used_tokens
         
-        # Default response
-        return {
-            "crop": crop,
-            "issue": "Unable to diagnose - need more information",
-            "confidence": 30,
-            "recommendation": "Please send a photo of your crop via WhatsApp for better diagnosis. Describe: leaf color, spots, wilting, pests visible.",
-            "risk": "unknown",
-            "method": "rule-based"
-        }
+        diagnosis = dict(parser.fields)
+        diagnosis.setdefault("crop", crop)
+        diagnosis.setdefault("method", "ai")
+        return diagnosis, used_tokens
+    
+    def _rule_based_diagnosis(self, crop: str, observations: str) -> Dict:
+        """
+        Simple rule-based diagnosis
+        Works without any AI API (uses the crop's rule pack from RULES_DIR)
+        """
+        return rule_packs.get(crop).diagnose(crop, observations)
 
 # ============================================================================
 # WEATHER API (Free)
 # ============================================================================
 
+geocode_cache = TTLCache(max_size=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL_SECONDS)
+forecast_cache = TTLCache(max_size=FORECAST_CACHE_SIZE, ttl=FORECAST_CACHE_TTL_SECONDS)
+weather_flights = SingleFlight()
+weather_upstream_calls = {"geocode": 0, "forecast": 0}
+
+# Locations the geocoder doesn't know are remembered for a shorter time
+GEOCODE_NEGATIVE_TTL_SECONDS = 3600
+
+
+async def _fetch_geocode(location: str) -> Optional[tuple]:
+    """Resolve a place name to (lat, lon) via Open-Meteo geocoding"""
+    weather_upstream_calls["geocode"] += 1
+    with tracer.span("geocode"):
+        geo_response = await http_clients.get("weather").get(
+            OPEN_METEO_GEOCODING_URL,
+            params={"name": location, "count": 1}
+        )
+    geo_response.raise_for_status()
+    
+    geo_data = geo_response.json()
+    if geo_data.get("results"):
+        return (geo_data["results"][0]["latitude"], geo_data["results"][0]["longitude"])
+    return None
+
+
+async def geocode_location(location: str) -> Optional[tuple]:
+    """
+    Get (lat, lon) for a free-text location, cached for GEOCODE_CACHE_TTL_SECONDS
+    
+    Returns None if the geocoder doesn't know the place.
+    """
+    key = location.strip().lower()
+    coords = geocode_cache.get(key, _CACHE_MISS)
+    if coords is not _CACHE_MISS:
+        return coords
+    
+    coords = await weather_flights.do(("geocode", key), _fetch_geocode, location.strip())
+    geocode_cache.set(key, coords, ttl=None if coords else GEOCODE_NEGATIVE_TTL_SECONDS)
+    return coords
+
+
+def forecast_cell(lat: float, lon: float) -> tuple:
+    """Snap coordinates to the forecast cache grid"""
+    return (round(lat / FORECAST_GRID_DEGREES), round(lon / FORECAST_GRID_DEGREES))
+
+
+async def _fetch_forecast(cell: tuple) -> Dict:
+    """Fetch the forecast for the centre of a grid cell"""
+    weather_upstream_calls["forecast"] += 1
+    lat = round(cell[0] * FORECAST_GRID_DEGREES, 4)
+    lon = round(cell[1] * FORECAST_GRID_DEGREES, 4)
+    
+    with tracer.span("forecast"):
+        weather_response = await http_clients.get("weather").get(
+            f"{OPEN_METEO_FORECAST_URL}?"
+            f"latitude={lat}&longitude={lon}"
+            f"&current_weather=true"
+            f"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum"
+            f"&timezone=auto"
+        )
+    weather_response.raise_for_status()
+    return weather_response.json()
+
+
+async def get_forecast(lat: float, lon: float) -> Dict:
+    """Get the forecast for coordinates, cached per grid cell"""
+    cell = forecast_cell(lat, lon)
+    weather = forecast_cache.get(cell)
+    if weather is not None:
+        return weather
+    
+    weather = await weather_flights.do(("forecast", cell), _fetch_forecast, cell)
+    forecast_cache.set(cell, weather)
+    return weather
+
+
 async def get_weather_free(location: str) -> Optional[Dict]:
     """
     Get weather data from Open-Meteo (free, no API key needed)
+    
+    Geocoding results and forecasts are cached separately, and concurrent
+    misses for the same place share a single upstream request.
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # Geocode location
-            geo_response = await client.get(
-                f"https://geocoding-api.open-meteo.com/v1/search?name={location}&count=1"
-            )
-            
-            if geo_response.status_code == 200:
-                geo_data = geo_response.json()
-                if geo_data.get("results"):
-                    lat = geo_data["results"][0]["latitude"]
-                    lon = geo_data["results"][0]["longitude"]
-                    
-                    # Get weather
-                    weather_response = await client.get(
-                        f"https://api.open-meteo.com/v1/forecast?"
-                        f"latitude={lat}&longitude={lon}"
-                        f"&current_weather=true"
-                        f"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum"
-                        f"&timezone=auto"
-                    )
-                    
-                    if weather_response.status_code == 200:
-                        return weather_response.json()
-        
+        coords = await geocode_location(location)
+        if not coords:
+            return None
+        return await get_forecast(*coords)
+    
+    except Exception as e:
+        logger.warning("Weather fetch failed: %s", e)
         return None
+
+
+async def get_weather_for_user(user: Dict) -> Optional[Dict]:
+    """
+    Get weather for a user, using the coordinates stored on their record
+    
+    The location is geocoded only once: the result is written back to the
+    user (see save_user_coordinates), so later messages go straight to the
+    forecast. Users with a place the geocoder doesn't know get no weather.
+    """
+    location = user.get("location")
+    if not location:
+        return None
+    
+    try:
+        if user.get("location_geocoded") == location:
+            if user.get("latitude") is None or user.get("longitude") is None:
+                return None
+            return await get_forecast(user["latitude"], user["longitude"])
+        
+        coords = await geocode_location(location)
+        
+        # Resolve once: remember the coordinates on the user record
+        if user.get("id") not in (None, "temp", "unknown"):
+            await save_user_coordinates(user["id"], location, coords)
+        user["latitude"], user["longitude"] = coords if coords else (None, None)
+        user["location_geocoded"] = location
+        
+        return await get_forecast(*coords) if coords else None
     
     except Exception as e:
-        print(f"Weather fetch failed: {e}")
+        logger.warning("Weather fetch failed: %s", e)
         return None
 
+
+def weather_cache_stats() -> Dict:
+    """Hit rates and upstream calls saved by the weather caches"""
+    return {
+        "geocode": geocode_cache.stats(),
+        "forecast": forecast_cache.stats(),
+        "single_flight": weather_flights.stats(),
+        "upstream_calls": dict(weather_upstream_calls),
+        "upstream_calls_saved": (
+            geocode_cache.hits + forecast_cache.hits + weather_flights.coalesced
+        )
+    }
+
 # ============================================================================
 # WHATSAPP FUNCTIONS
 # ============================================================================
 
-async def send_whatsapp_message(to: str, message: str) -> bool:
-    """Send WhatsApp message"""
-    if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_ID:
-        print(f"Would send to {to}: {message}")
-        return False
-    
+async def _post_whatsapp(payload: Dict) -> httpx.Response:
+    """POST one message to the Graph API (called by the outbound dispatcher)"""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                f"https://graph.facebook.com/v18.0/{WHATSAPP_PHONE_ID}/messages",
+        with STAGE_SECONDS.time(stage="outbound_send"):
+            return await http_clients.get("whatsapp").post(
+                f"{WHATSAPP_API_BASE}/{WHATSAPP_PHONE_ID}/messages",
                 headers={
                     "Authorization": f"Bearer {WHATSAPP_TOKEN}",
                     "Content-Type": "application/json"
                 },
-                json={
-                    "messaging_product": "whatsapp",
-                    "to": to,
-                    "type": "text",
-                    "text": {"body": message}
-                }
+                json=payload
             )
-            return response.status_code == 200
-    except Exception as e:
-        print(f"Failed to send WhatsApp message: {e}")
+    except httpx.TimeoutException:
+        TIMEOUTS.inc(stage="outbound_send")
+        raise
+
+
+outbound_dispatcher = OutboundDispatcher(
+    _post_whatsapp,
+    rate_per_second=WHATSAPP_SEND_RATE,
+    concurrency=WHATSAPP_SEND_CONCURRENCY,
+    max_queued=WHATSAPP_SEND_QUEUE_SIZE,
+    max_attempts=WHATSAPP_SEND_MAX_ATTEMPTS,
+    on_sent=OUTBOUND_DELIVERY_SECONDS.observe,
+    on_drop=lambda reason: OUTBOUND_DROPPED.inc(reason=reason)
+)
+
+
+async def send_whatsapp_message(to: str, message: str) -> bool:
+    """Queue a WhatsApp text message; False if it could not be queued"""
+    if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_ID:
+        logger.info("Would send to %s: %s", to, message)
         return False
+    
+    return outbound_dispatcher.enqueue(to, {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "text",
+        "text": {"body": message}
+    })
 
 
 async def send_whatsapp_image(to: str, image_url: str, caption: str) -> bool:
-    """Send WhatsApp image with caption"""
+    """Queue a WhatsApp image with caption"""
     if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_ID:
         return False
     
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                f"https://graph.facebook.com/v18.0/{WHATSAPP_PHONE_ID}/messages",
-                headers={
-                    "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "messaging_product": "whatsapp",
-                    "to": to,
-                    "type": "image",
-                    "image": {
-                        "link": image_url,
-                        "caption": caption
-                    }
-                }
-            )
-            return response.status_code == 200
-    except Exception as e:
-        print(f"Failed to send WhatsApp image: {e}")
-        return False
+    return outbound_dispatcher.enqueue(to, {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "image",
+        "image": {
+            "link": image_url,
+            "caption": caption
+        }
+    })
 
 # ============================================================================
 # MESSAGE HANDLERS
@@ -590,25 +1177,29 @@ async def send_whatsapp_image(to: str, image_url: str, caption: str) -> bool:
 
 async def handle_whatsapp_message(message: Dict):
     """Handle individual WhatsApp message with robust error handling"""
+    global messages_handled
     from_number = "unknown"
+    messages_handled += 1
     
     try:
         from_number = message.get("from", "unknown")
         message_type = message.get("type", "unknown")
         
-        logger.info(f"Received {message_type} message from {from_number}")
+        logger.info("Received %s message from %s", message_type, from_number)
         
-        # Get or create user with error handling
-        user = await safe_async_call(
-            get_user_by_phone,
-            from_number,
-            context=f"Get user by phone {from_number}",
-            fallback_value=None
-        )
+        # Get or create user with error handling (user_cache makes repeat
+        # lookups a dict hit, and honours USER_CACHE_TTL_SECONDS)
+        with pipeline_stage("user_lookup"):
+            user = await safe_async_call(
+                get_user_by_phone,
+                from_number,
+                context=f"Get user by phone {from_number}",
+                fallback_value=None
+            )
         
         if not user:
             # New user - send onboarding
-            logger.info(f"New user detected: {from_number}")
+            logger.info("New user detected: %s", from_number)
             
             user = await safe_async_call(
                 create_user,
@@ -635,7 +1226,7 @@ async def handle_whatsapp_message(message: Dict):
             if text:
                 await handle_text_message(user, text)
             else:
-                logger.warning(f"Empty text message from {from_number}")
+                logger.warning("Empty text message from %s", from_number)
         
         elif message_type == "image":
             image_id = message.get("image", {}).get("id", "")
@@ -649,7 +1240,7 @@ async def handle_whatsapp_message(message: Dict):
             )
         
         else:
-            logger.warning(f"Unsupported message type '{message_type}' from {from_number}")
+            logger.warning("Unsupported message type '%s' from %s", message_type, from_number)
             await send_whatsapp_message(
                 from_number,
                 "⚠️ 지원하지 않는 메시지 형식입니다.\n\n"
@@ -657,7 +1248,7 @@ async def handle_whatsapp_message(message: Dict):
             )
     
     except KeyError as e:
-        logger.error(f"Missing required field in message from {from_number}: {e}")
+        logger.error("Missing required field in message from %s: %s", from_number, e)
         log_error(e, context=f"Parse message from {from_number}")
         
         # Try to send error message
@@ -670,7 +1261,7 @@ async def handle_whatsapp_message(message: Dict):
             )
     
     except Exception as e:
-        logger.error(f"Unexpected error handling message from {from_number}: {e}")
+        logger.error("Unexpected error handling message from %s: %s", from_number, e)
         log_error(e, context=f"handle_whatsapp_message from {from_number}")
         
         # Try to send generic error message
@@ -690,7 +1281,7 @@ async def handle_text_message(user: Dict, text: str):
     user_id = user.get("id", "unknown")
     
     try:
-        logger.info(f"Processing text message from user {user_id}: {text[:50]}...")
+        logger.info("Processing text message from user %s: %s...", user_id, text[:50])
         
         # Check for special commands
         if text.upper().startswith("JOIN "):
@@ -701,6 +1292,14 @@ async def handle_text_message(user: Dict, text: str):
             await send_help_message(user_phone)
             return
         
+        session = session_store.get(user_phone)
+        
+        # YES/NO rates the previous diagnosis - no AI call needed
+        feedback_type = parse_feedback(text)
+        if feedback_type:
+            await handle_feedback_reply(user, session, feedback_type)
+            return
+        
         # Send immediate acknowledgment
         await send_whatsapp_message(
             user_phone,
@@ -711,31 +1310,60 @@ async def handle_text_message(user: Dict, text: str):
         ai = FreeAIEngine()
         
         # Get weather if user has location (with error handling)
-        weather = None
-        if user.get("location"):
-            weather = await safe_async_call(
-                get_weather_free,
-                user["location"],
-                context=f"Weather fetch for user {user_id}",
-                fallback_value=None
+        weather = session_store.cached_weather(session)
+        if weather is None and user.get("location"):
+            with pipeline_stage("weather"):
+                weather = await safe_async_call(
+                    get_weather_for_user,
+                    user,
+                    context=f"Weather fetch for user {user_id}",
+                    fallback_value=None
+                )
+            if weather:
+                session_store.set_weather(session, weather)
+        
+        preview_open = True
+        previewed_issue = None
+        
+        async def send_preview(fields: Dict):
+            # Streaming lets us tell the farmer the likely issue right away.
+            # The Groq call is shared and shielded, so it can outlive our
+            # wait_for: never preview after the timeout reply.
+            nonlocal previewed_issue
+            if not preview_open:
+                return
+            previewed_issue = fields["issue"]
+            await send_whatsapp_message(
+                user_phone,
+                f"🔍 *Likely issue (preliminary):* {fields['issue']}\n"
+                f"⚠️ *Risk Level:* {fields['risk']}\n\n"
+                "💡 Full diagnosis coming in a moment..."
             )
         
         # Run diagnosis with timeout
         try:
-            diagnosis = await asyncio.wait_for(
-                ai.diagnose_crop(
-                    crop=user.get("primary_crop", "unknown"),
-                    observations=text,
-                    location=user.get("location", "unknown"),
-                    weather=weather
-                ),
-                timeout=30.0  # 30 second timeout
-            )
+            with pipeline_stage("ai"):
+                try:
+                    diagnosis = await asyncio.wait_for(
+                        ai.diagnose_crop(
+                            crop=user.get("primary_crop", "unknown"),
+                            observations=text,
+                            location=user.get("location", "unknown"),
+                            weather=weather,
+                            on_preview=send_preview,
+                            context=session_store.context(session),
+                            follow_up_of=session_store.last_issue(session)
+                        ),
+                        timeout=30.0  # 30 second timeout
+                    )
+                finally:
+                    preview_open = False
             
-            logger.info(f"Diagnosis completed for user {user_id}: {diagnosis.get('issue', 'N/A')}")
+            logger.info("Diagnosis completed for user %s: %s", user_id, diagnosis.get('issue', 'N/A'))
             
         except asyncio.TimeoutError:
-            logger.warning(f"Diagnosis timeout for user {user_id}")
+            TIMEOUTS.inc(stage="ai")
+            logger.warning("Diagnosis timeout for user %s", user_id)
             await send_whatsapp_message(
                 user_phone,
                 "⏱️ AI 진단이 예상보다 오래 걸리고 있습니다.\n\n"
@@ -745,7 +1373,7 @@ async def handle_text_message(user: Dict, text: str):
             return
         
         except Exception as e:
-            logger.error(f"Diagnosis failed for user {user_id}: {e}")
+            logger.error("Diagnosis failed for user %s: %s", user_id, e)
             log_error(e, context=f"AI diagnosis for user {user_id}")
             
             await send_whatsapp_message(
@@ -755,19 +1383,33 @@ async def handle_text_message(user: Dict, text: str):
             return
         
         # Save to database (non-blocking, errors won't stop response)
-        save_success = await safe_async_call(
-            save_diagnosis,
-            user_id,
-            diagnosis,
-            context=f"Save diagnosis for user {user_id}",
-            fallback_value=False
-        )
+        with pipeline_stage("db_save"):
+            diagnosis_id = await safe_async_call(
+                save_diagnosis,
+                user_id,
+                diagnosis,
+                context=f"Save diagnosis for user {user_id}",
+                fallback_value=None
+            )
+        
+        if not diagnosis_id:
+            logger.warning("Failed to save diagnosis for user %s, but continuing...", user_id)
         
-        if not save_success:
-            logger.warning(f"Failed to save diagnosis for user {user_id}, but continuing...")
+        # Other likely issues from the rule engine, best first
+        also_possible = ""
+        if diagnosis.get("additional_issues"):
+            also_possible = "\n🔎 *Also possible:*\n" + "\n".join(
+                f"• {extra['issue']} ({extra['confidence']}%)"
+                for extra in diagnosis["additional_issues"]
+            ) + "\n"
+        
+        # The preview came from a partial answer that may not have won
+        updated_note = ""
+        if previewed_issue and previewed_issue != diagnosis.get("issue"):
+            updated_note = "🔄 *Updated:* this replaces the preliminary issue above.\n\n"
         
         # Format response
-        response = f"""🌾 *Diagnosis for {diagnosis['crop']}*
+        response = f"""{updated_note}🌾 *Diagnosis for {diagnosis['crop']}*
 
 🔍 *Issue:* {diagnosis['issue']}
 📊 *Confidence:* {diagnosis['confidence']}%
@@ -776,7 +1418,7 @@ async def handle_text_message(user: Dict, text: str):
 {diagnosis['recommendation']}
 
 ⚠️ *Risk Level:* {diagnosis['risk']}
-
+{also_possible}
 ---
 Was this helpful?
 Reply: YES or NO for feedback
@@ -793,13 +1435,16 @@ Need more help? Send a photo! 📸"""
         )
         
         if not send_success:
-            logger.error(f"Failed to send diagnosis response to user {user_id}")
+            logger.error("Failed to queue diagnosis response to user %s", user_id)
         else:
-            logger.info(f"Successfully sent diagnosis to user {user_id}")
+            logger.info("Queued diagnosis for user %s", user_id)
+            # Remembered for YES/NO feedback and follow-up questions - only
+            # once the full answer (not the preview) is on its way
+            session_store.record_diagnosis(session, text, diagnosis, diagnosis_id)
     
     except Exception as e:
         # Catch-all for any unexpected errors
-        logger.error(f"Unexpected error in handle_text_message for user {user_id}: {e}")
+        logger.error("Unexpected error in handle_text_message for user %s: %s", user_id, e)
         log_error(e, context=f"handle_text_message for user {user_id}")
         
         # Try to send error message to user
@@ -812,7 +1457,46 @@ Need more help? Send a photo! 📸"""
             )
         except:
             # If even error message fails, just log it
-            logger.critical(f"Failed to send error message to user {user_id}")
+            logger.critical("Failed to send error message to user %s", user_id)
+
+
+async def handle_feedback_reply(user: Dict, session: Session, feedback_type: str):
+    """Record a YES/NO reply against the sender's last diagnosis"""
+    user_phone = user.get("phone", "unknown")
+    
+    if session.feedback_given:
+        await send_whatsapp_message(user_phone, "✅ Your feedback is already recorded - thank you!")
+        return
+    
+    if session.last_diagnosis is None:
+        await send_whatsapp_message(
+            user_phone,
+            "🤔 There's no recent diagnosis to rate.\n\n"
+            "Describe your crop problem and I'll take a look!"
+        )
+        return
+    
+    session.feedback_given = True
+    session_store.feedback_routed += 1
+    if session.last_diagnosis_id:
+        await safe_async_call(
+            save_feedback,
+            user.get("id", "unknown"),
+            session.last_diagnosis_id,
+            feedback_type,
+            context=f"Save feedback for user {user.get('id', 'unknown')}",
+            fallback_value=False
+        )
+    
+    if feedback_type == "correct":
+        reply = "🙏 Thanks for the feedback! Glad it helped."
+    else:
+        reply = (
+            "🙏 Thanks for the feedback - it helps us improve.\n\n"
+            "Tell me more about what you see (leaf color, spots, pests) "
+            "or send a photo, and I'll try again."
+        )
+    await send_whatsapp_message(user_phone, reply)
 
 
 async def handle_image_message(user: Dict, image_id: str, caption: str):
@@ -836,37 +1520,36 @@ async def handle_referral(user: Dict, text: str):
     try:
         referral_code = text.split()[1].upper()
         
-        # Find referrer
+        # Find the referrer and count the referral atomically (see
+        # redeem_referral in database/schema.sql)
         if supabase:
-            result = supabase.table("users").select("*").eq("referral_code", referral_code).execute()
+            result = await run_db(supabase.rpc("redeem_referral", {
+                "code": referral_code,
+                "referred_phone": user["phone"]
+            }))
             
             if result.data:
                 referrer = result.data[0]
-                
-                # Update referrer's count
-                new_count = referrer.get("referrals", 0) + 1
-                supabase.table("users").update({
-                    "referrals": new_count
-                }).eq("id", referrer["id"]).execute()
+                new_count = referrer["referrals"]
                 
                 # Notify referrer
                 if new_count >= 3:
                     await send_whatsapp_message(
-                        referrer["phone"],
+                        referrer["referrer_phone"],
                         "🎉 *Congratulations!*\n\n"
                         f"You've referred {new_count} farmers!\n"
                         "Premium features unlocked! 🚀"
                     )
                 else:
                     await send_whatsapp_message(
-                        referrer["phone"],
+                        referrer["referrer_phone"],
                         f"✅ New referral! ({new_count}/3 for premium)"
                     )
                 
                 # Welcome new user
                 await send_whatsapp_message(
                     user["phone"],
-                    f"👋 Welcome! Referred by {referrer.get('name', 'a farmer')}.\n\n"
+                    f"👋 Welcome! Referred by {referrer.get('referrer_name', 'a farmer')}.\n\n"
                     "You both get bonus credits! 🎁"
                 )
             else:
@@ -876,7 +1559,7 @@ async def handle_referral(user: Dict, text: str):
                 )
     
     except Exception as e:
-        print(f"Referral error: {e}")
+        logger.error("Referral error: %s", e)
 
 
 async def send_help_message(phone: str):
@@ -909,12 +1592,12 @@ async def root():
     
     if supabase:
         try:
-            users = supabase.table("users").select("*", count="exact").execute()
-            user_count = users.count or 0
-            
-            diagnoses = supabase.table("diagnoses").select("*").order("created_at", desc=True).limit(10).execute()
-            diagnosis_count = len(diagnoses.data)
-            recent_diagnoses = diagnoses.data
+            stats, recent_diagnoses = await asyncio.gather(
+                get_platform_stats(),
+                get_recent_diagnoses()
+            )
+            user_count = stats["total_users"]
+            diagnosis_count = stats["diagnoses_today"]
         except:
             pass
     
@@ -1055,17 +1738,37 @@ async def health_check():
         db_status = "connected" if supabase else "not configured"
         wa_status = "configured" if WHATSAPP_TOKEN else "not configured"
         
-        logger.info(f"Health check: DB={db_status}, WhatsApp={wa_status}")
+        logger.info("Health check: DB=%s, WhatsApp=%s", db_status, wa_status)
         
         return {
             "status": "healthy",
             "timestamp": datetime.utcnow().isoformat(),
             "database": db_status,
             "whatsapp": wa_status,
+            "http_pools": http_clients.pool_stats(),
+            "logging": logging_stats(),
+            "tracing": tracer.stats(),
+            "webhook_capture": webhook_capture.stats() if webhook_capture else None,
+            "outbound": outbound_dispatcher.stats(),
+            "webhook_queue": webhook_queue.stats(),
+            "message_dispatcher": message_dispatcher.stats(),
+            "message_dedup": message_deduplicator.stats(),
+            "weather_cache": weather_cache_stats(),
+            "diagnosis_cache": diagnosis_cache.stats(),
+            "groq_single_flight": groq_flights.stats(),
+            "groq_limiter": groq_limiter.stats(),
+            "groq_cascade": groq_cascade.stats(),
+            "groq_prompt": prompt_builder.stats(tokens_per_minute=GROQ_TOKENS_PER_MINUTE),
+            "sessions": session_store.stats(),
+            "write_behind": write_buffer.stats(),
+            "user_cache": user_cache.stats(),
+            "db_queries": db_query_count,
+            "db_queries_per_message": round(db_query_count / messages_handled, 2) if messages_handled else None,
+            "rule_packs": rule_packs.stats(),
             "version": "2.0.0-stable"
         }
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
+        logger.error("Health check failed: %s", e)
         log_error(e, context="Health check")
         
         return JSONResponse(
@@ -1078,6 +1781,12 @@ async def health_check():
         )
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage latency histograms and counters (Prometheus text format)"""
+    return Response(content=metrics_registry.render(), media_type=metrics_registry.CONTENT_TYPE)
+
+
 @app.get("/webhook/whatsapp")
 async def whatsapp_webhook_verify(request: Request):
     """Verify WhatsApp webhook (GET request from Meta)"""
@@ -1086,77 +1795,135 @@ async def whatsapp_webhook_verify(request: Request):
         token = request.query_params.get("hub.verify_token")
         challenge = request.query_params.get("hub.challenge")
         
-        logger.info(f"Webhook verification attempt: mode={mode}, token_match={token == WEBHOOK_VERIFY_TOKEN}")
+        logger.info("Webhook verification attempt: mode=%s, token_match=%s", mode, token == WEBHOOK_VERIFY_TOKEN)
         
         if mode == "subscribe" and token == WEBHOOK_VERIFY_TOKEN:
             logger.info("✅ WhatsApp webhook verified successfully!")
             return int(challenge)
         
-        logger.warning(f"❌ Webhook verification failed: mode={mode}, token_valid={token == WEBHOOK_VERIFY_TOKEN}")
+        logger.warning("❌ Webhook verification failed: mode=%s, token_valid=%s", mode, token == WEBHOOK_VERIFY_TOKEN)
         return JSONResponse({"error": "Verification failed"}, status_code=403)
     
     except Exception as e:
-        logger.error(f"Webhook verification error: {e}")
+        logger.error("Webhook verification error: %s", e)
         log_error(e, context="Webhook verification")
         return JSONResponse({"error": "Internal error"}, status_code=500)
 
 
 @app.post("/webhook/whatsapp")
-async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks):
+async def whatsapp_webhook(request: Request):
     """Receive WhatsApp messages with robust error handling"""
     try:
         data = await request.json()
         
-        logger.info(f"Received webhook data: {len(data.get('entry', []))} entries")
+        logger.info("Received webhook data: %s entries", len(data.get('entry', [])))
         
-        # Process in background to respond quickly
-        background_tasks.add_task(process_whatsapp_webhook, data)
+        if webhook_capture:
+            webhook_capture.add(data)
+        
+        # Journal and queue for the worker pool to respond quickly
+        try:
+            await webhook_queue.enqueue(data)
+        except QueueFullError as e:
+            logger.warning("Rejecting webhook: %s", e)
+            return JSONResponse(
+                {"status": "busy", "message": "Queue full, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(WEBHOOK_RETRY_AFTER_SECONDS)}
+            )
         
         return {"status": "ok"}
     
     except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in webhook: {e}")
+        logger.error("Invalid JSON in webhook: %s", e)
         log_error(e, context="Webhook JSON parsing")
         return JSONResponse({"status": "error", "message": "Invalid JSON"}, status_code=400)
     
     except Exception as e:
-        logger.error(f"Webhook error: {e}")
+        logger.error("Webhook error: %s", e)
         log_error(e, context="Webhook processing")
         return JSONResponse({"status": "error", "message": "Internal error"}, status_code=500)
 
 
+message_dispatcher = OrderedDispatcher(max_concurrency=MESSAGE_CONCURRENCY)
+
+webhook_capture: Optional[WebhookCapture] = None
+if WEBHOOK_CAPTURE_DIR:
+    webhook_capture = WebhookCapture(
+        Path(WEBHOOK_CAPTURE_DIR),
+        anonymize_phone=hash_phone_number,
+        max_bytes=int(WEBHOOK_CAPTURE_MAX_MB * 1024 * 1024),
+        max_files=WEBHOOK_CAPTURE_MAX_FILES
+    )
+
+message_deduplicator = MessageDeduplicator(
+    max_size=MESSAGE_DEDUP_MAX_SIZE,
+    ttl=MESSAGE_DEDUP_TTL_SECONDS,
+    store=SQLiteSeenStore(Path(MESSAGE_DEDUP_PATH)) if MESSAGE_DEDUP_PATH else None
+)
+
+
+async def handle_webhook_message(message: Dict):
+    """Handle one webhook message and record its id as processed"""
+    message_id = message.get("id", "unknown")
+    
+    with tracer.span("whatsapp_message", message_id=message_id), STAGE_SECONDS.time(stage="end_to_end"):
+        await safe_async_call(
+            handle_whatsapp_message,
+            message,
+            context=f"Process webhook message {message_id}",
+            log_errors=True
+        )
+    
+    if message_id != "unknown":
+        await message_deduplicator.mark_processed(message_id)
+
+
 async def process_whatsapp_webhook(data: Dict):
     """Process WhatsApp webhook data in background with error handling"""
     try:
         if data.get("object") != "whatsapp_business_account":
-            logger.warning(f"Ignoring non-WhatsApp webhook: {data.get('object')}")
+            logger.warning("Ignoring non-WhatsApp webhook: %s", data.get('object'))
             return
         
-        message_count = 0
+        messages = []
         
         for entry in data.get("entry", []):
             for change in entry.get("changes", []):
                 value = change.get("value", {})
                 
-                if "messages" in value:
-                    for message in value.get("messages", []):
-                        message_count += 1
-                        
-                        # Process each message with error handling
-                        await safe_async_call(
-                            handle_whatsapp_message,
-                            message,
-                            context=f"Process webhook message {message.get('id', 'unknown')}",
-                            log_errors=True
-                        )
+                for message in value.get("messages", []):
+                    # Skip Meta redeliveries before any downstream I/O
+                    message_id = message.get("id")
+                    if message_id and message_deduplicator.is_duplicate(message_id):
+                        logger.info("Skipping duplicate message %s", message_id)
+                        continue
+                    messages.append(message)
         
-        logger.info(f"Processed {message_count} messages from webhook")
+        # Different senders run concurrently, same sender strictly in order
+        await asyncio.gather(*(
+            message_dispatcher.run(
+                message.get("from", "unknown"),
+                handle_webhook_message,
+                message
+            )
+            for message in messages
+        ))
+        
+        logger.info("Processed %s messages from webhook", len(messages))
     
     except Exception as e:
-        logger.error(f"Error processing webhook data: {e}")
+        logger.error("Error processing webhook data: %s", e)
         log_error(e, context="process_whatsapp_webhook")
 
 
+webhook_queue = DurableWorkQueue(
+    process_whatsapp_webhook,
+    journal_path=Path(WEBHOOK_QUEUE_PATH),
+    max_size=WEBHOOK_QUEUE_MAX_SIZE
+)
+
+
 @app.get("/stats")
 async def get_stats():
     """Get platform statistics"""
@@ -1164,12 +1931,10 @@ async def get_stats():
         return {"error": "Database not configured"}
     
     try:
-        users = supabase.table("users").select("*", count="exact").execute()
-        diagnoses = supabase.table("diagnoses").select("*", count="exact").execute()
+        stats = await get_platform_stats()
         
         return {
-            "total_users": users.count or 0,
-            "total_diagnoses": diagnoses.count or 0,
+            **stats,
             "timestamp": datetime.utcnow().isoformat()
         }
     except Exception as e:
@@ -1185,12 +1950,18 @@ async def startup_event():
     logger.info("=" * 60)
     logger.info("🚀 AgriAI - Zero Capital Edition Starting...")
     logger.info("=" * 60)
-    logger.info(f"📱 WhatsApp Phone ID: {WHATSAPP_PHONE_ID or 'Not configured'}")
-    logger.info(f"💾 Database: {SUPABASE_URL or 'Not configured'}")
-    logger.info(f"🤖 AI Engine: {'Groq (Free)' if GROQ_API_KEY else 'Rule-based only'}")
-    logger.info(f"🔒 CORS Origins: {', '.join(ALLOWED_ORIGINS)}")
+    logger.info("📱 WhatsApp Phone ID: %s", WHATSAPP_PHONE_ID or "Not configured")
+    logger.info("💾 Database: %s", SUPABASE_URL or "Not configured")
+    logger.info("🤖 AI Engine: %s", "Groq (Free)" if GROQ_API_KEY else "Rule-based only")
+    logger.info("🔒 CORS Origins: %s", ", ".join(ALLOWED_ORIGINS))
     logger.info("=" * 60)
     
+    await http_clients.start()
+    await message_deduplicator.start()
+    await write_buffer.start()
+    await outbound_dispatcher.start()
+    await webhook_queue.start()
+    
     # Configuration warnings
     warnings = []
     
@@ -1207,7 +1978,7 @@ async def startup_event():
         logger.warning("⚠️  Groq AI not configured. Using rule-based diagnosis only.")
     
     if warnings:
-        logger.warning(f"Total warnings: {len(warnings)}")
+        logger.warning("Total warnings: %s", len(warnings))
     else:
         logger.info("✅ All services configured!")
     
@@ -1215,6 +1986,20 @@ async def startup_event():
     logger.info("=" * 60)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources on shutdown"""
+    logger.info("🛑 AgriAI shutting down...")
+    await webhook_queue.stop()
+    if webhook_capture:
+        webhook_capture.stop()
+    await outbound_dispatcher.stop()
+    await write_buffer.stop()
+    await message_deduplicator.stop()
+    await http_clients.close()
+    db_executor.shutdown(wait=True)
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
@@ -0,0 +1,212 @@
+"""
+Multi-model cascade for AI diagnoses
+
+Tiers are tried cheapest first (e.g. a small 8B model, then the 70B model).
+A tier's answer is accepted when it parses and its reported confidence is at
+least `escalation_confidence`; otherwise the next tier is asked. The last
+tier's answer is always accepted, and if every tier fails the most confident
+answer seen so far is returned.
+
+With hedging enabled, a tier that hasn't answered within its own p90 latency
+(or `hedge_delay` until enough samples exist) gets the next tier started in
+parallel. Whichever acceptable answer arrives first wins and the other
+request is cancelled.
+
+Each tier keeps latency, token and outcome counters so the threshold and the
+tier order can be tuned from /health data.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("AgriAI.cascade")
+
+# call(model, on_preview) -> (diagnosis or None, tokens used)
+TierCall = Callable[[str, Optional[Callable]], Awaitable[Tuple[Optional[Dict], int]]]
+
+
+def diagnosis_confidence(diagnosis: Optional[Dict]) -> float:
+    """Reported confidence as a number ("75", "75%" and 75 all work)"""
+    if not diagnosis:
+        return -1.0
+    value = diagnosis.get("confidence")
+    try:
+        return float(str(value).strip().rstrip("%"))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ModelTier:
+    """One model in the cascade plus its counters"""
+
+    def __init__(self, model: str, max_samples: int = 200):
+        self.model = model
+        self._latencies: deque = deque(maxlen=max_samples)
+        self.calls = 0
+        self.accepted = 0
+        self.escalated = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.hedges_started = 0
+        self.tokens = 0
+
+    def record(self, latency: float, tokens: int):
+        self._latencies.append(latency)
+        self.tokens += tokens
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def stats(self) -> Dict:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "accepted": self.accepted,
+            "escalated": self.escalated,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "hedges_started": self.hedges_started,
+            "tokens": self.tokens,
+            "avg_tokens_per_call": round(self.tokens / self.calls) if self.calls else 0,
+            "latency_p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "latency_p90_ms": round(p90 * 1000) if p90 is not None else None,
+        }
+
+
+class ModelCascade:
+    """Escalating (and optionally hedged) sequence of models"""
+
+    def __init__(
+        self,
+        models: List[str],
+        escalation_confidence: float = 70.0,
+        hedging: bool = False,
+        hedge_delay: float = 2.0,
+        hedge_min_samples: int = 20,
+    ):
+        if not models:
+            raise ValueError("ModelCascade needs at least one model")
+        self.tiers = [ModelTier(model) for model in models]
+        self.escalation_confidence = escalation_confidence
+        self.hedging = hedging
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+
+    def _acceptable(self, diagnosis: Optional[Dict], index: int) -> bool:
+        if not diagnosis:
+            return False
+        if index == len(self.tiers) - 1:
+            return True
+        return diagnosis_confidence(diagnosis) >= self.escalation_confidence
+
+    def _hedge_after(self, tier: ModelTier) -> float:
+        if len(tier._latencies) >= self.hedge_min_samples:
+            return tier.percentile(0.9)
+        return self.hedge_delay
+
+    async def _run_tier(self, index: int, call: TierCall, on_preview) -> Tuple[Optional[Dict], int]:
+        tier = self.tiers[index]
+        tier.calls += 1
+        started = time.monotonic()
+        try:
+            diagnosis, tokens = await call(tier.model, on_preview)
+        except asyncio.CancelledError:
+            tier.cancelled += 1
+            raise
+        except Exception as e:
+            logger.warning("Model %s failed: %s", tier.model, e)
+            diagnosis, tokens = None, 0
+
+        tier.record(time.monotonic() - started, tokens)
+        if diagnosis is None:
+            tier.failed += 1
+        return diagnosis, tokens
+
+    async def run(self, call: TierCall, on_preview=None) -> Tuple[Optional[Dict], int]:
+        """
+        Run the cascade; returns (diagnosis or None, total tokens spent)
+
+        `on_preview(fields)` is passed on to the tiers, but only forwarded
+        once, only for a partial answer that would be accepted, and never
+        while a hedge race is on (the other tier might win with a different
+        answer). The tier can still fail afterwards, so callers should treat
+        the preview as provisional.
+        """
+        preview_sent = False
+        running: Dict[asyncio.Task, int] = {}
+        next_index = 0
+        total_tokens = 0
+        best: Optional[Dict] = None
+
+        def tier_preview(index: int):
+            if on_preview is None:
+                return None
+
+            async def preview(fields: Dict):
+                nonlocal preview_sent
+                if preview_sent or len(running) > 1 or not self._acceptable(fields, index):
+                    return
+                preview_sent = True
+                await on_preview(fields)
+            return preview
+
+        def start_next():
+            nonlocal next_index
+            index = next_index
+            next_index += 1
+            task = asyncio.ensure_future(self._run_tier(index, call, tier_preview(index)))
+            running[task] = index
+
+        start_next()
+        try:
+            while running:
+                timeout = None
+                if self.hedging and next_index < len(self.tiers):
+                    timeout = self._hedge_after(self.tiers[next_index - 1])
+
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Slowest expected answer is late: race the next model
+                    self.tiers[next_index - 1].hedges_started += 1
+                    start_next()
+                    continue
+
+                for task in done:
+                    index = running.pop(task)
+                    diagnosis, tokens = task.result()
+                    total_tokens += tokens
+
+                    if self._acceptable(diagnosis, index):
+                        self.tiers[index].accepted += 1
+                        diagnosis.setdefault("model", self.tiers[index].model)
+                        return diagnosis, total_tokens
+
+                    if diagnosis is not None:
+                        self.tiers[index].escalated += 1
+                        if diagnosis_confidence(diagnosis) > diagnosis_confidence(best):
+                            diagnosis.setdefault("model", self.tiers[index].model)
+                            best = diagnosis
+
+                if not running and next_index < len(self.tiers):
+                    start_next()
+        finally:
+            for task in running:
+                task.cancel()
+
+        return best, total_tokens
+
+    def stats(self) -> Dict:
+        return {
+            "escalation_confidence": self.escalation_confidence,
+            "hedging": self.hedging,
+            "tiers": [tier.stats() for tier in self.tiers],
+        }
@@ -0,0 +1,260 @@
+"""
+Outbound WhatsApp send queue
+
+Handlers call enqueue(to, payload) and return immediately; a pool of
+workers delivers the messages through the Graph API:
+
+- Per-recipient order: one message per recipient is in flight at a time,
+  so an ack always arrives before the diagnosis that follows it.
+- Pacing: sends for the business phone number share a token bucket of
+  `rate_per_second` (Cloud API throughput is per phone number; the
+  default tier is 80 messages/second).
+- Retries: 429s, 5xx responses and transport errors are retried with
+  full-jitter exponential backoff (or the Retry-After header). A 429 also
+  pauses every send until the backoff has passed, since Meta throttles the
+  phone number, not the recipient. Other 4xx responses are dropped.
+- Bounded: beyond `max_queued` messages enqueue() refuses (returns False)
+  and counts a drop instead of holding memory without limit.
+
+Each message is sent in the contextvars context it was enqueued from, so
+log lines about it keep the message's trace id.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import httpx
+
+from groq_limiter import parse_duration
+
+logger = logging.getLogger("AgriAI.outbound")
+
+# send(payload) -> the Graph API response
+SendFunc = Callable[[Dict], Awaitable[httpx.Response]]
+
+
+@dataclass
+class OutboundMessage:
+    to: str
+    payload: Dict
+    enqueued_at: float
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+    attempts: int = 0
+
+
+class OutboundDispatcher:
+    """Bounded, paced, per-recipient-ordered send queue with retries"""
+
+    def __init__(
+        self,
+        send: SendFunc,
+        rate_per_second: float = 80.0,
+        burst: Optional[float] = None,
+        concurrency: int = 20,
+        max_queued: int = 5000,
+        max_attempts: int = 5,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        on_sent: Optional[Callable[[float], None]] = None,
+        on_drop: Optional[Callable[[str], None]] = None,
+    ):
+        self.send = send
+        self.rate_per_second = rate_per_second
+        self.burst = burst if burst is not None else max(1.0, rate_per_second)
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        # Metric hooks: on_sent(seconds from enqueue to accepted), on_drop(reason)
+        self.on_sent = on_sent
+        self.on_drop = on_drop
+
+        self._queues: Dict[str, Deque[OutboundMessage]] = {}
+        # Recipients with queued messages (waiting in _ready, in flight or backing off)
+        self._active: Set[str] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._pace_lock: Optional[asyncio.Lock] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._queued = 0
+        self._in_flight = 0
+
+        self._tokens = self.burst
+        self._tokens_at = time.monotonic()
+        self._paused_until = 0.0
+
+        self.sent = 0
+        self.retries = 0
+        self.throttled = 0
+        self.dropped: Dict[str, int] = {}
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def enqueue(self, to: str, payload: Dict) -> bool:
+        """Queue a message for `to` (never blocks); False if the queue is full"""
+        if self._queued >= self.max_queued:
+            self._drop("queue_full")
+            logger.warning("Outbound queue full (%s), dropping message to %s", self._queued, to)
+            return False
+
+        self._queues.setdefault(to, deque()).append(OutboundMessage(to, payload, time.monotonic()))
+        self._queued += 1
+        if self._idle is not None:
+            self._idle.clear()
+        if to not in self._active:
+            self._active.add(to)
+            if self._ready is not None:
+                self._ready.put_nowait(to)
+        return True
+
+    async def start(self):
+        self._ready = asyncio.Queue()
+        self._pace_lock = asyncio.Lock()
+        self._idle = asyncio.Event()
+        if not self._queued:
+            self._idle.set()
+        # Messages queued before start (e.g. during startup)
+        for to in self._active:
+            self._ready.put_nowait(to)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Deliver what is queued (up to `timeout` seconds), then stop the workers"""
+        if self._idle is not None and self._queued:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Outbound queue stopped with %s message(s) unsent", self._queued)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for _ in range(self._queued):
+            self._drop("shutdown")
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    async def _pace(self):
+        """Wait for a send slot on the phone number's token bucket"""
+        async with self._pace_lock:
+            while True:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._tokens_at) * self.rate_per_second)
+                self._tokens_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate_per_second)
+
+    def _backoff(self, attempts: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1)))
+
+    async def _worker(self):
+        while True:
+            to = await self._ready.get()
+            message = self._queues[to][0]
+            await self._pace()
+
+            message.attempts += 1
+            self._in_flight += 1
+            retry_after = None
+            try:
+                # Run in the enqueuing context so logs keep its trace id
+                response = await asyncio.create_task(self.send(message.payload), context=message.context)
+                status = response.status_code
+                retryable = status == 429 or status >= 500
+                retry_after = parse_duration(response.headers.get("retry-after"))
+                outcome = "sent" if 200 <= status < 300 else f"http_{status}"
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                retryable = True
+                status = None
+                outcome = type(e).__name__
+            except Exception as e:
+                logger.error("Outbound send to %s failed: %s", to, e)
+                retryable = False
+                status = None
+                outcome = "error"
+            finally:
+                self._in_flight -= 1
+
+            if outcome != "sent" and retryable and message.attempts < self.max_attempts:
+                delay = self._backoff(message.attempts, retry_after)
+                self.retries += 1
+                if status == 429:
+                    # Meta throttles the phone number: hold every send
+                    self.throttled += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.info("Retrying message to %s in %.1fs (%s, attempt %s)", to, delay, outcome, message.attempts)
+                # The recipient stays active, so its later messages keep waiting
+                asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, to)
+                continue
+
+            self._finish(to)
+            if outcome == "sent":
+                self.sent += 1
+                latency = time.monotonic() - message.enqueued_at
+                self._latencies.append(latency)
+                if self.on_sent is not None:
+                    self.on_sent(latency)
+            else:
+                reason = "retries_exhausted" if retryable else "rejected"
+                self._drop(reason)
+                logger.warning("Dropping message to %s after %s attempt(s): %s", to, message.attempts, outcome)
+
+    def _finish(self, to: str):
+        """Remove the recipient's head message and hand on its next one"""
+        queue = self._queues[to]
+        queue.popleft()
+        self._queued -= 1
+        if queue:
+            self._ready.put_nowait(to)
+        else:
+            del self._queues[to]
+            self._active.discard(to)
+        if not self._queued:
+            self._idle.set()
+
+    def _drop(self, reason: str):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+        if self.on_drop is not None:
+            self.on_drop(reason)
+
+    def _percentile(self, fraction: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def stats(self) -> Dict:
+        p50, p95 = self._percentile(0.5), self._percentile(0.95)
+        return {
+            "queued": self._queued,
+            "in_flight": self._in_flight,
+            "recipients_waiting": len(self._active),
+            "max_queued": self.max_queued,
+            "rate_per_second": self.rate_per_second,
+            "sent": self.sent,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "paused": self._paused_until > time.monotonic(),
+            "dropped": dict(self.dropped),
+            "send_latency_p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "send_latency_p95_ms": round(p95 * 1000) if p95 is not None else None,
+        }
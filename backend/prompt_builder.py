@@ -0,0 +1,172 @@
+"""
+Prompt construction and token budgeting for Groq diagnoses
+
+The instructions and the JSON answer template never change, so they live in
+one static system prompt (identical bytes on every call, which keeps it
+eligible for provider-side prompt caching). The per-request user message only
+carries the crop, location, a compact weather line and the observation.
+
+Observations are compacted to `max_observation_tokens` (whitespace and
+repeated sentences removed, then head + tail kept), and `max_tokens` for the
+answer is budgeted per crop / issue class instead of a flat 500, so each call
+reserves less of the free-tier tokens-per-minute limit.
+
+PromptBuilder also records input/output tokens per diagnosis, reported under
+"groq_prompt" in /health.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+SYSTEM_PROMPT = """You are an expert agricultural advisor for smallholder farmers.
+Diagnose the farmer's crop problem and give one practical, low-cost action.
+Reply with only this JSON object, keys in this order, no other text:
+{"crop": "<crop>", "issue": "<brief problem>", "risk": "low|medium|high", "confidence": <0-100>, "recommendation": "<specific action>", "method": "ai"}"""
+
+# Fallback answer budgets; keys are "<crop>:<class>", "<class>", "<crop>" or "default"
+DEFAULT_MAX_TOKENS = {
+    "default": 250,
+    "unknown": 320,
+    "multi": 320,
+}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for budgeting"""
+    return (len(text or "") + 3) // 4
+
+
+def compact_observations(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    Shrink an observation to at most ~max_tokens
+
+    Returns (text, truncated). Repeated sentences are dropped first; if it is
+    still too long the beginning and end are kept, since farmers tend to
+    describe the crop first and ask their question last.
+    """
+    text = " ".join((text or "").split())
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+
+    seen = set()
+    sentences = []
+    for sentence in _SENTENCE_RE.split(text):
+        key = " ".join(_WORD_RE.findall(sentence.lower()))
+        if key and key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    text = " ".join(sentences)
+    if estimate_tokens(text) <= max_tokens:
+        return text, True
+
+    max_chars = max_tokens * 4
+    head = text[:max_chars * 2 // 3].rsplit(" ", 1)[0]
+    tail = text[-(max_chars // 3):].split(" ", 1)[-1]
+    return f"{head} ... {tail}", True
+
+
+def weather_line(weather: Optional[Dict]) -> str:
+    """One short line of current weather, or "" if unknown"""
+    if not weather or "current_weather" not in weather:
+        return ""
+    current = weather["current_weather"]
+    line = f"Weather: {current.get('temperature', 'N/A')}°C, wind {current.get('windspeed', 'N/A')} km/h"
+
+    rain = ((weather.get("daily") or {}).get("precipitation_sum") or [None])[0]
+    if isinstance(rain, (int, float)):
+        line += f", rain today {rain} mm"
+    return line
+
+
+class PromptBuilder:
+    """Builds Groq chat messages and tracks prompt token usage"""
+
+    def __init__(
+        self,
+        max_observation_tokens: int = 300,
+        max_tokens_budgets: Optional[Dict[str, int]] = None,
+    ):
+        self.max_observation_tokens = max_observation_tokens
+        self.budgets = dict(DEFAULT_MAX_TOKENS)
+        self.budgets.update(max_tokens_budgets or {})
+
+        self.system_tokens = estimate_tokens(SYSTEM_PROMPT)
+        self.truncated = 0
+        # issue class -> [diagnoses, input tokens, output tokens]
+        self._usage: Dict[str, List[int]] = {}
+
+    def max_tokens(self, crop: str, issue_class: str) -> int:
+        """Answer budget for a crop / issue class (most specific match wins)"""
+        crop = (crop or "unknown").strip().lower()
+        for key in (f"{crop}:{issue_class}", issue_class, crop, "default"):
+            if key in self.budgets:
+                return self.budgets[key]
+        return DEFAULT_MAX_TOKENS["default"]
+
+    def build(
+        self,
+        crop: str,
+        observations: str,
+        location: str,
+        weather: Optional[Dict],
+        context: Optional[str] = None,
+    ) -> Tuple[List[Dict], int]:
+        """
+        Chat messages for one diagnosis and their estimated token count
+
+        `context` is a short summary of earlier messages in the conversation.
+        """
+        observations, truncated = compact_observations(observations, self.max_observation_tokens)
+        if truncated:
+            self.truncated += 1
+
+        lines = [f"Crop: {crop}", f"Location: {location}"]
+        weather_info = weather_line(weather)
+        if weather_info:
+            lines.append(weather_info)
+        if context:
+            lines.append(f"Earlier in this chat: {context}")
+        lines.append(f"Observation: {observations}")
+        user_prompt = "\n".join(lines)
+
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ]
+        return messages, self.system_tokens + estimate_tokens(user_prompt)
+
+    def record(self, issue_class: str, input_tokens: int, output_tokens: int):
+        """Account one completed Groq call"""
+        usage = self._usage.setdefault(issue_class, [0, 0, 0])
+        usage[0] += 1
+        usage[1] += input_tokens or 0
+        usage[2] += output_tokens or 0
+
+    def stats(self, tokens_per_minute: Optional[int] = None) -> Dict:
+        calls = sum(usage[0] for usage in self._usage.values())
+        input_tokens = sum(usage[1] for usage in self._usage.values())
+        output_tokens = sum(usage[2] for usage in self._usage.values())
+        avg_total = (input_tokens + output_tokens) / calls if calls else 0
+
+        stats = {
+            "calls": calls,
+            "system_prompt_tokens": self.system_tokens,
+            "avg_input_tokens": round(input_tokens / calls, 1) if calls else 0,
+            "avg_output_tokens": round(output_tokens / calls, 1) if calls else 0,
+            "observations_truncated": self.truncated,
+            "by_issue_class": {
+                issue_class: {
+                    "calls": usage[0],
+                    "avg_input_tokens": round(usage[1] / usage[0], 1),
+                    "avg_output_tokens": round(usage[2] / usage[0], 1),
+                    "max_tokens": self.budgets.get(issue_class, self.budgets["default"]),
+                }
+                for issue_class, usage in self._usage.items()
+            },
+        }
+        if tokens_per_minute and avg_total:
+            stats["calls_per_minute_at_tpm"] = round(tokens_per_minute / avg_total, 1)
+        return stats
@@ -0,0 +1,303 @@
+"""
+Data-driven rule engine for the offline (no-AI) diagnosis fallback
+
+Rules are loaded from JSON rule packs (rules/default.json plus optional
+per-crop packs next to it). Each rule has one or more keyword groups in
+"require"; the rule matches when every group has at least one keyword in
+the farmer's text. Keywords may be phrases
+("brown spots", "not growing") and match whole words only, so "small" no
+longer fires inside "smallholder".
+
+All keywords of all rules are compiled into a single word-level trie. One
+pass over the text finds every keyword occurrence, and only the rules those
+keywords point to are scored - cost grows with the text, not with the
+number of rules. Matches are ranked by confidence (ties keep file order),
+so a text describing several problems gets a ranked multi-issue answer.
+"""
+
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("AgriAI.rules")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+DEFAULT_FALLBACK = {
+    "issue": "Unable to diagnose - need more information",
+    "confidence": 30,
+    "recommendation": "Please send a photo of your crop via WhatsApp for better diagnosis. "
+                      "Describe: leaf color, spots, wilting, pests visible.",
+    "risk": "unknown",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall((text or "").lower())
+
+
+@dataclass
+class Rule:
+    id: str
+    issue: str
+    confidence: int
+    recommendation: str
+    risk: str
+    require: List[List[str]]
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Rule":
+        require = data.get("require") or []
+        if not require or not all(require):
+            raise ValueError(f"Rule '{data.get('id')}' needs at least one non-empty keyword group")
+        return cls(
+            id=data["id"],
+            issue=data["issue"],
+            confidence=int(data.get("confidence", 50)),
+            recommendation=data["recommendation"],
+            risk=data.get("risk", "medium"),
+            require=[[str(keyword) for keyword in group] for group in require],
+        )
+
+
+@dataclass
+class RuleMatch:
+    rule: Rule
+    keywords: List[str] = field(default_factory=list)
+
+    @property
+    def score(self) -> int:
+        return self.rule.confidence
+
+
+class RuleEngine:
+    """Compiled keyword matcher over a list of rules"""
+
+    # Trie nodes are dicts keyed by word; this key holds (rule, group) hits
+    _HITS = "\0hits"
+
+    def __init__(self, rules: List[Rule], fallback: Optional[Dict] = None, name: str = "rules"):
+        self.name = name
+        self.rules = rules
+        self.fallback = dict(fallback or DEFAULT_FALLBACK)
+        self._full_masks = [(1 << len(rule.require)) - 1 for rule in rules]
+        self._trie: Dict = {}
+        self.max_phrase_words = 0
+
+        for rule_index, rule in enumerate(rules):
+            for group_index, group in enumerate(rule.require):
+                for keyword in group:
+                    words = tokenize(keyword)
+                    if not words:
+                        continue
+                    node = self._trie
+                    for word in words:
+                        node = node.setdefault(word, {})
+                    node.setdefault(self._HITS, []).append((rule_index, group_index, keyword))
+                    self.max_phrase_words = max(self.max_phrase_words, len(words))
+
+    @classmethod
+    def from_file(cls, path: Path) -> "RuleEngine":
+        """Load and compile a rule file ({"fallback": {...}, "rules": [...]})"""
+        path = Path(path)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rules = [Rule.from_dict(rule) for rule in data.get("rules", [])]
+        return cls(rules, fallback=data.get("fallback"), name=path.stem)
+
+    def match(self, text: str) -> List[RuleMatch]:
+        """All rules satisfied by `text`, best first"""
+        words = tokenize(text)
+        matched_groups: Dict[int, int] = {}
+        keywords: Dict[int, List[str]] = {}
+
+        # Single pass: walk the trie from every word position
+        for start in range(len(words)):
+            node = self._trie
+            for word in words[start:start + self.max_phrase_words]:
+                node = node.get(word)
+                if node is None:
+                    break
+                for rule_index, group_index, keyword in node.get(self._HITS, ()):
+                    matched_groups[rule_index] = matched_groups.get(rule_index, 0) | (1 << group_index)
+                    keywords.setdefault(rule_index, []).append(keyword)
+
+        matches: List[Tuple[int, RuleMatch]] = [
+            (rule_index, RuleMatch(self.rules[rule_index], keywords[rule_index]))
+            for rule_index, mask in matched_groups.items()
+            if mask == self._full_masks[rule_index]
+        ]
+        matches.sort(key=lambda item: (-item[1].score, item[0]))
+        return [match for _, match in matches]
+
+    def diagnose(self, crop: str, observations: str, max_issues: int = 3) -> Dict:
+        """Diagnosis dict for the best match, with other ranked matches attached"""
+        matches = self.match(observations)
+
+        if not matches:
+            return {
+                "crop": crop,
+                **self.fallback,
+                "method": "rule-based",
+            }
+
+        best = matches[0].rule
+        diagnosis = {
+            "crop": crop,
+            "issue": best.issue,
+            "confidence": best.confidence,
+            "recommendation": best.recommendation,
+            "risk": best.risk,
+            "method": "rule-based",
+        }
+        if len(matches) > 1 and max_issues > 1:
+            diagnosis["additional_issues"] = [
+                {
+                    "issue": match.rule.issue,
+                    "confidence": match.rule.confidence,
+                    "risk": match.rule.risk,
+                    "recommendation": match.rule.recommendation,
+                }
+                for match in matches[1:max_issues]
+            ]
+        return diagnosis
+
+
+class RulePackRegistry:
+    """
+    Per-crop rule packs, compiled lazily and hot-reloaded
+
+    A pack is `<directory>/<crop>.json` (e.g. rules/tomato.json) in the same
+    format as the default pack. A crop's engine combines its own rules with
+    the default pack's general rules; crops without a pack use the default
+    pack alone.
+
+    Compiled engines are kept in an LRU of at most `max_loaded` crops. A
+    cached engine re-checks its files' modification times at most every
+    `check_interval` seconds and recompiles when they change, so new or
+    edited packs are picked up without restarting the server. A pack that
+    fails to load keeps serving its previous version.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        default_pack: str = "default",
+        max_loaded: int = 32,
+        check_interval: float = 5.0,
+    ):
+        self.directory = Path(directory)
+        self.default_pack = default_pack
+        self.max_loaded = max_loaded
+        self.check_interval = check_interval
+        # crop slug -> (engine, file mtimes it was built from, last checked)
+        self._loaded: "OrderedDict[str, Tuple[RuleEngine, Tuple, float]]" = OrderedDict()
+
+        self.loads = 0
+        self.reloads = 0
+        self.load_errors = 0
+        self.evictions = 0
+
+    @staticmethod
+    def crop_slug(crop: Optional[str]) -> str:
+        return "_".join(tokenize(crop or "")) or "unknown"
+
+    def _pack_path(self, name: str) -> Path:
+        return self.directory / f"{name}.json"
+
+    def _crop_pack_path(self, slug: str) -> Optional[Path]:
+        # Accept simple plurals: "tomatoes" -> tomato.json, "beans" -> bean.json
+        for name in (slug, slug[:-2] if slug.endswith("es") else None, slug[:-1] if slug.endswith("s") else None):
+            if name and name != self.default_pack:
+                path = self._pack_path(name)
+                if path.is_file():
+                    return path
+        return None
+
+    @staticmethod
+    def _mtime(path: Optional[Path]) -> Optional[float]:
+        try:
+            return path.stat().st_mtime if path else None
+        except OSError:
+            return None
+
+    def _source_files(self, slug: str) -> Tuple:
+        crop_path = self._crop_pack_path(slug)
+        default_path = self._pack_path(self.default_pack)
+        return (
+            (crop_path, self._mtime(crop_path)),
+            (default_path, self._mtime(default_path)),
+        )
+
+    def _compile(self, slug: str, sources: Tuple) -> RuleEngine:
+        (crop_path, _), (default_path, _) = sources
+        default = RuleEngine.from_file(default_path) if default_path.is_file() else RuleEngine([])
+        if crop_path is None:
+            return RuleEngine(default.rules, fallback=default.fallback, name=self.default_pack)
+
+        with open(crop_path, encoding="utf-8") as f:
+            data = json.load(f)
+        rules = [Rule.from_dict(rule) for rule in data.get("rules", [])]
+        return RuleEngine(
+            rules + default.rules,
+            fallback=data.get("fallback") or default.fallback,
+            name=crop_path.stem,
+        )
+
+    def get(self, crop: Optional[str]) -> RuleEngine:
+        """Compiled engine for a crop (loading or reloading it if needed)"""
+        slug = self.crop_slug(crop)
+        now = time.monotonic()
+        cached = self._loaded.get(slug)
+
+        if cached is not None:
+            engine, sources, checked_at = cached
+            self._loaded.move_to_end(slug)
+            if now - checked_at < self.check_interval:
+                return engine
+            current = self._source_files(slug)
+            if current == sources:
+                self._loaded[slug] = (engine, sources, now)
+                return engine
+        else:
+            engine, current = None, self._source_files(slug)
+
+        try:
+            new_engine = self._compile(slug, current)
+        except Exception as e:
+            self.load_errors += 1
+            logger.error("Failed to load rule pack for '%s': %s", slug, e)
+            if engine is None:
+                new_engine = RuleEngine([])
+            else:
+                # Keep serving the last good version, retry after check_interval
+                self._loaded[slug] = (engine, cached[1], now)
+                return engine
+
+        if engine is None:
+            self.loads += 1
+        else:
+            self.reloads += 1
+            logger.info("Reloaded rule pack '%s' for crop '%s'", new_engine.name, slug)
+
+        self._loaded[slug] = (new_engine, current, now)
+        self._loaded.move_to_end(slug)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+            self.evictions += 1
+        return new_engine
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": len(self._loaded),
+            "max_loaded": self.max_loaded,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "load_errors": self.load_errors,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,137 @@
+"""
+Short-lived per-sender conversation state
+
+A farmer's messages usually come in bursts: a question, a follow-up, then
+"YES"/"NO" feedback. SessionStore keeps what the previous message already
+looked up so the next one doesn't have to:
+
+- the weather (refetched only after `weather_ttl`)
+- the last diagnosis and its database id, so feedback replies go straight to
+  save_feedback and follow-ups get a one-line summary of the conversation
+
+The user record is deliberately not kept here: a session lives as long as
+the farmer keeps talking, while user_cache re-reads it after its own TTL.
+
+Sessions live in a bounded LRU (TTLCache) and expire after `ttl` seconds of
+inactivity. Like the other caches this is per process and event-loop only.
+"""
+
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+
+from cache import TTLCache
+
+# Replies that rate the previous diagnosis -> feedback.feedback_type.
+# Not "ok": that is what farmers answer to the ack and the preview.
+FEEDBACK_REPLIES = {
+    "yes": "correct",
+    "y": "correct",
+    "yeah": "correct",
+    "yep": "correct",
+    "👍": "correct",
+    "네": "correct",
+    "예": "correct",
+    "no": "incorrect",
+    "n": "incorrect",
+    "nope": "incorrect",
+    "👎": "incorrect",
+    "아니요": "incorrect",
+    "아니오": "incorrect",
+}
+
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s.!?,]+$")
+
+
+def parse_feedback(text: str) -> Optional[str]:
+    """Feedback type for a YES/NO style reply, or None for anything else"""
+    reply = _TRAILING_PUNCTUATION_RE.sub("", (text or "").strip().lower())
+    return FEEDBACK_REPLIES.get(reply)
+
+
+@dataclass
+class Session:
+    phone: str
+    weather: Optional[Dict] = None
+    weather_at: float = 0.0
+    last_diagnosis: Optional[Dict] = None
+    last_diagnosis_id: Optional[str] = None
+    feedback_given: bool = False
+    # Recent (observation, issue) pairs, oldest first
+    history: Deque[Tuple[str, str]] = field(default_factory=lambda: deque(maxlen=3))
+
+
+class SessionStore:
+    """Bounded, expiring map of phone number -> Session"""
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 1800,
+        weather_ttl: float = 900,
+        clock=time.monotonic,
+    ):
+        self.weather_ttl = weather_ttl
+        self.clock = clock
+        self._sessions = TTLCache(max_size=max_size, ttl=ttl, clock=clock)
+
+        self.weather_fetches_saved = 0
+        self.feedback_routed = 0
+
+    def get(self, phone: str) -> Session:
+        """The sender's session (a fresh one if none or expired)"""
+        session = self._sessions.get(phone)
+        if session is None:
+            session = Session(phone=phone)
+        # Re-setting refreshes the inactivity TTL
+        self._sessions.set(phone, session)
+        return session
+
+    def drop(self, phone: str):
+        self._sessions.pop(phone)
+
+    def clear(self):
+        self._sessions.clear()
+
+    def cached_weather(self, session: Session) -> Optional[Dict]:
+        if session.weather is not None and self.clock() - session.weather_at < self.weather_ttl:
+            self.weather_fetches_saved += 1
+            return session.weather
+        return None
+
+    def set_weather(self, session: Session, weather: Optional[Dict]):
+        session.weather = weather
+        session.weather_at = self.clock()
+
+    def record_diagnosis(
+        self,
+        session: Session,
+        observations: str,
+        diagnosis: Dict,
+        diagnosis_id: Optional[str],
+    ):
+        session.last_diagnosis = diagnosis
+        session.last_diagnosis_id = diagnosis_id
+        session.feedback_given = False
+        session.history.append((observations, diagnosis.get("issue", "")))
+
+    def last_issue(self, session: Session) -> Optional[str]:
+        """Issue of the previous diagnosis (a coarse key for follow-ups)"""
+        return (session.history[-1][1] or None) if session.history else None
+
+    def context(self, session: Session, max_chars: int = 300) -> Optional[str]:
+        """One compact line summarising the conversation so far, for follow-ups"""
+        if not session.history:
+            return None
+        parts = [f'"{observation[:80]}" -> {issue}' for observation, issue in session.history]
+        return "; ".join(parts)[-max_chars:]
+
+    def stats(self) -> Dict:
+        return {
+            "active": len(self._sessions),
+            "max_size": self._sessions.max_size,
+            "weather_fetches_saved": self.weather_fetches_saved,
+            "feedback_routed": self.feedback_routed,
+        }
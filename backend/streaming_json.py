@@ -0,0 +1,147 @@
+"""
+Incremental parser for a streamed JSON object
+
+The model streams its diagnosis as text, a few characters at a time.
+JSONFieldStream is fed those chunks and reports each top-level field of the
+first JSON object as soon as its value is complete, so callers can act on
+"issue" and "risk" before the rest of the answer has been generated.
+Text before the opening brace (e.g. "Here is the diagnosis:") is ignored.
+"""
+
+import json
+from typing import Any, Dict, List, Tuple
+
+# Parser states
+_BEFORE_OBJECT = 0
+_EXPECT_KEY = 1
+_IN_KEY = 2
+_EXPECT_COLON = 3
+_EXPECT_VALUE = 4
+_IN_STRING = 5
+_IN_NESTED = 6
+_IN_SCALAR = 7
+_DONE = 8
+
+_WHITESPACE = " \t\r\n"
+
+
+class JSONFieldStream:
+    """Feed text chunks, get back top-level (key, value) pairs as they complete"""
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._state = _BEFORE_OBJECT
+        self._key = ""
+        self._raw = ""
+        self._escaped = False
+        self._depth = 0
+        self._nested_in_string = False
+
+    @property
+    def done(self) -> bool:
+        """True once the closing brace of the object has been seen"""
+        return self._state == _DONE
+
+    def _complete(self, value: Any, completed: List[Tuple[str, Any]]):
+        self.fields[self._key] = value
+        completed.append((self._key, value))
+        self._raw = ""
+        self._state = _EXPECT_KEY
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk; return the fields completed by it (in order)"""
+        completed: List[Tuple[str, Any]] = []
+
+        for char in chunk:
+            state = self._state
+
+            if state == _BEFORE_OBJECT:
+                if char == "{":
+                    self._state = _EXPECT_KEY
+
+            elif state == _EXPECT_KEY:
+                if char == '"':
+                    self._raw = ""
+                    self._state = _IN_KEY
+                elif char == "}":
+                    self._state = _DONE
+
+            elif state in (_IN_KEY, _IN_STRING):
+                if self._escaped:
+                    self._raw += char
+                    self._escaped = False
+                elif char == "\\":
+                    self._raw += char
+                    self._escaped = True
+                elif char == '"':
+                    try:
+                        text = json.loads(f'"{self._raw}"')
+                    except ValueError:
+                        text = self._raw
+                    if state == _IN_KEY:
+                        self._key = text
+                        self._raw = ""
+                        self._state = _EXPECT_COLON
+                    else:
+                        self._complete(text, completed)
+                else:
+                    self._raw += char
+
+            elif state == _EXPECT_COLON:
+                if char == ":":
+                    self._state = _EXPECT_VALUE
+
+            elif state == _EXPECT_VALUE:
+                if char in _WHITESPACE:
+                    continue
+                if char == '"':
+                    self._raw = ""
+                    self._state = _IN_STRING
+                elif char in "{[":
+                    self._raw = char
+                    self._depth = 1
+                    self._nested_in_string = False
+                    self._state = _IN_NESTED
+                else:
+                    self._raw = char
+                    self._state = _IN_SCALAR
+
+            elif state == _IN_NESTED:
+                self._raw += char
+                if self._nested_in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._nested_in_string = False
+                elif char == '"':
+                    self._nested_in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        try:
+                            value = json.loads(self._raw)
+                        except ValueError:
+                            value = self._raw
+                        self._complete(value, completed)
+
+            elif state == _IN_SCALAR:
+                if char in ",}" or char in _WHITESPACE:
+                    raw = self._raw.strip()
+                    try:
+                        value = json.loads(raw)
+                    except ValueError:
+                        value = raw
+                    self._complete(value, completed)
+                    if char == "}":
+                        self._state = _DONE
+                else:
+                    self._raw += char
+
+            elif state == _DONE:
+                break
+
+        return completed
@@ -0,0 +1,100 @@
+"""
+redeem_referral counts every redemption exactly once under concurrency
+
+Loads database/schema.sql into a throwaway Postgres schema and calls
+redeem_referral from many connections at once. Needs a Postgres server and
+psycopg; skipped unless TEST_DATABASE_URL is set:
+
+    pip install pytest "psycopg[binary]"
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest backend/tests
+"""
+
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+SCHEMA_SQL = Path(__file__).resolve().parents[2] / "database" / "schema.sql"
+REDEMPTIONS = 50
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+
+@pytest.fixture
+def schema():
+    """A fresh schema with database/schema.sql applied; dropped afterwards"""
+    name = f"agriai_test_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {name}")
+        conn.execute(f"SET search_path TO {name}, public")
+        conn.execute(SCHEMA_SQL.read_text())
+        try:
+            yield name
+        finally:
+            conn.execute(f"DROP SCHEMA {name} CASCADE")
+
+
+def connect(schema: str):
+    return psycopg.connect(DATABASE_URL, autocommit=True, options=f"-c search_path={schema},public")
+
+
+def create_referrer(schema: str, phone: str, code: str) -> str:
+    with connect(schema) as conn:
+        return conn.execute(
+            "INSERT INTO users (phone, name, referral_code) VALUES (%s, 'Referrer', %s) RETURNING id",
+            (phone, code),
+        ).fetchone()[0]
+
+
+def referral_count(schema: str, user_id) -> int:
+    with connect(schema) as conn:
+        return conn.execute("SELECT referrals FROM users WHERE id = %s", (user_id,)).fetchone()[0]
+
+
+def test_concurrent_redemptions_are_counted_exactly(schema):
+    user_id = create_referrer(schema, "+254700000001", "REFTEST1")
+    # Open every connection first so the calls really overlap
+    connections = [connect(schema) for _ in range(REDEMPTIONS)]
+    start = threading.Barrier(REDEMPTIONS)
+
+    def redeem(index: int):
+        start.wait()
+        return connections[index].execute(
+            "SELECT * FROM redeem_referral(%s, %s)", ("reftest1", f"+2547100{index:05d}")
+        ).fetchall()
+
+    try:
+        with ThreadPoolExecutor(max_workers=REDEMPTIONS) as pool:
+            results = list(pool.map(redeem, range(REDEMPTIONS)))
+    finally:
+        for conn in connections:
+            conn.close()
+
+    assert all(len(rows) == 1 for rows in results)
+    # Each caller saw a distinct post-increment count
+    assert sorted(rows[0][3] for rows in results) == list(range(1, REDEMPTIONS + 1))
+    assert referral_count(schema, user_id) == REDEMPTIONS
+
+
+def test_self_referral_is_rejected(schema):
+    user_id = create_referrer(schema, "+254700000002", "REFTEST2")
+    with connect(schema) as conn:
+        rows = conn.execute("SELECT * FROM redeem_referral(%s, %s)", ("REFTEST2", "+254700000002")).fetchall()
+
+    assert rows == []
+    assert referral_count(schema, user_id) == 0
+
+
+def test_unknown_code_changes_nothing(schema):
+    user_id = create_referrer(schema, "+254700000003", "REFTEST3")
+    with connect(schema) as conn:
+        rows = conn.execute("SELECT * FROM redeem_referral(%s, %s)", ("NOSUCHCODE", "+254700000004")).fetchall()
+
+    assert rows == []
+    assert referral_count(schema, user_id) == 0
@@ -0,0 +1,223 @@
+"""
+Lightweight request tracing with contextvars
+
+Every inbound message gets a trace: `tracer.span(name)` opens a span as a
+child of the current one (or starts a new trace when there is none), and
+the current span travels with the asyncio context, so tasks created inside
+it (cascade tiers, single-flight calls) are attributed to the same trace.
+
+Spans record wall-clock start/end and attributes; a failed or cancelled
+span keeps the exception type as its status. When a trace's root span ends
+the whole trace can be exported as one OTLP/JSON line (the format of the
+OpenTelemetry collector's file exporter) so a slow message's critical path
+can be reconstructed afterwards. Without an exporter only trace/span ids
+are kept, for log correlation (TraceLogFilter).
+
+Usage:
+    with tracer.span("weather", location=location):
+        weather = await get_weather_for_user(user)
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger("AgriAI.tracing")
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes",
+                 "start_ns", "end_ns", "status", "_trace")
+
+    def __init__(self, name: str, trace: "_Trace", parent: Optional["Span"], attributes: Dict):
+        self.trace_id = trace.trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status: Optional[str] = None  # exception type name if it failed
+        self._trace = trace
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans", "exported")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.exported = False
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("agriai_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPFileExporter:
+    """
+    Appends finished traces to a file, one OTLP/JSON request per line
+
+    Writes happen on a daemon thread; if it falls behind, traces beyond
+    `max_pending` are dropped and counted.
+    """
+
+    def __init__(self, path: Path, service_name: str = "agri-ai", max_pending: int = 1000):
+        self.path = Path(path)
+        self.service_name = service_name
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+
+    def export(self, spans: List[Span]):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _encode(self, spans: List[Span]) -> str:
+        return json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": self.service_name}}
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "agriai.tracing"},
+                "spans": [
+                    {
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_id or "",
+                        "name": span.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [
+                            {"key": key, "value": _otlp_value(value)}
+                            for key, value in span.attributes.items()
+                        ],
+                        # 1 = OK, 2 = ERROR
+                        "status": {"code": 2, "message": span.status} if span.status else {"code": 1},
+                    }
+                    for span in spans
+                ],
+            }],
+        }]}, ensure_ascii=False)
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(self._encode(spans) + "\n")
+                self.exported += 1
+            except Exception as e:
+                logger.warning("Failed to export trace: %s", e)
+
+
+class Tracer:
+    """Creates spans and hands finished traces to the exporter"""
+
+    def __init__(self, exporter: Optional[OTLPFileExporter] = None, min_duration_ms: float = 0.0):
+        self.exporter = exporter
+        # Only traces at least this slow are exported
+        self.min_duration_ms = min_duration_ms
+        self.traces_started = 0
+        self.traces_exported = 0
+        # Spans that ended after their trace was exported (e.g. a shielded,
+        # shared Groq call that outlived the handler) - counted, not exported
+        self.late_spans = 0
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time a block as a child of the current span (or as a new trace)"""
+        parent = _current_span.get()
+        if parent is None or parent._trace.exported:
+            trace = _Trace(os.urandom(16).hex())
+            parent = None
+            self.traces_started += 1
+        else:
+            trace = parent._trace
+
+        span = Span(name, trace, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            # Includes CancelledError, e.g. the losing request of a hedge
+            span.status = type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            if trace.exported:
+                self.late_spans += 1
+            else:
+                trace.spans.append(span)
+                if parent is None:
+                    self._finish(trace, span)
+
+    def _finish(self, trace: _Trace, root: Span):
+        trace.exported = True
+        if self.exporter is not None and root.duration_ms >= self.min_duration_ms:
+            # A snapshot: the exporter thread must not see later appends
+            self.exporter.export(list(trace.spans))
+            self.traces_exported += 1
+
+    def stats(self) -> Dict:
+        stats = {
+            "traces_started": self.traces_started,
+            "traces_exported": self.traces_exported,
+            "late_spans": self.late_spans,
+            "export_path": str(self.exporter.path) if self.exporter else None,
+            "min_duration_ms": self.min_duration_ms,
+        }
+        if self.exporter is not None:
+            stats["export_dropped"] = self.exporter.dropped
+        return stats
+
+
+class TraceLogFilter(logging.Filter):
+    """Adds trace_id / span_id of the current span to log records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = _current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
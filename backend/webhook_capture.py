@@ -0,0 +1,163 @@
+"""
+Opt-in capture of inbound webhooks for later replay
+
+Every payload posted to /webhook/whatsapp is appended, with its arrival
+time, to gzip-compressed JSON-lines files in `directory`:
+
+    {"ts": 1760781234.123, "payload": {...}}
+
+Phone numbers (message senders, contact wa_ids, status recipients) are
+replaced with `anonymize_phone(number)` before anything is written, and
+contact profile names are dropped. The same number always maps to the same
+value, so per-farmer ordering and bursts survive.
+
+A file is rotated once `max_bytes` of (uncompressed) JSON has been written
+to it, and only the newest `max_files` files are kept. Compression and disk
+writes run on a background thread; if it falls behind, payloads beyond
+`max_pending` are dropped and counted rather than slowing the webhook down.
+
+Replay with benchmarks/replay_webhooks.py.
+"""
+
+import copy
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("AgriAI.capture")
+
+FILE_PREFIX = "webhooks-"
+FILE_SUFFIX = ".jsonl.gz"
+
+_STOP = object()
+
+
+def anonymize_payload(payload: Dict, anonymize_phone: Callable[[str], str]) -> Dict:
+    """Copy of a webhook payload with phone numbers hashed and names removed"""
+    payload = copy.deepcopy(payload)
+    for entry in payload.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            value = change.get("value") or {}
+            for contact in value.get("contacts", []) or []:
+                if contact.get("wa_id"):
+                    contact["wa_id"] = anonymize_phone(contact["wa_id"])
+                contact.pop("profile", None)
+            for message in value.get("messages", []) or []:
+                if message.get("from"):
+                    message["from"] = anonymize_phone(message["from"])
+            for status in value.get("statuses", []) or []:
+                if status.get("recipient_id"):
+                    status["recipient_id"] = anonymize_phone(status["recipient_id"])
+    return payload
+
+
+class WebhookCapture:
+    """Appends anonymized webhook payloads to rotating gzip files"""
+
+    def __init__(
+        self,
+        directory: Path,
+        anonymize_phone: Callable[[str], str],
+        max_bytes: int = 50 * 1024 * 1024,
+        max_files: int = 20,
+        max_pending: int = 10000,
+        clock=time.time,
+    ):
+        self.directory = Path(directory)
+        self.anonymize_phone = anonymize_phone
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.clock = clock
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+
+        self._file = None
+        self._file_bytes = 0
+        self.captured = 0
+        self.dropped = 0
+        self.files_rotated = 0
+
+    def add(self, payload: Dict):
+        """Queue one payload (never blocks; anonymized on the writer thread)"""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait((self.clock(), payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="webhook-capture", daemon=True)
+            self._thread.start()
+            logger.info("Capturing webhooks to %s", self.directory)
+
+    def stop(self):
+        """Write everything queued and close the current file"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            received_at, payload = item
+            try:
+                line = json.dumps(
+                    {"ts": received_at, "payload": anonymize_payload(payload, self.anonymize_phone)},
+                    ensure_ascii=False, separators=(",", ":")
+                ) + "\n"
+                self._write(line.encode("utf-8"))
+                self.captured += 1
+                if self._queue.empty():
+                    # Idle: make what we have readable even if the process dies
+                    self._file.flush()
+            except Exception as e:
+                logger.warning("Failed to capture webhook: %s", e)
+        self._close()
+
+    def _write(self, data: bytes):
+        if self._file is None or self._file_bytes >= self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file_bytes += len(data)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._close()
+            self.files_rotated += 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{FILE_PREFIX}{time.strftime('%Y%m%d-%H%M%S', time.gmtime(self.clock()))}"
+        path = self.directory / f"{name}{FILE_SUFFIX}"
+        counter = 1
+        while path.exists():
+            path = self.directory / f"{name}-{counter}{FILE_SUFFIX}"
+            counter += 1
+        self._file = gzip.open(path, "ab")
+        self._file_bytes = 0
+
+        files = sorted(self.directory.glob(f"{FILE_PREFIX}*{FILE_SUFFIX}"), key=lambda file: file.stat().st_mtime)
+        for old in files[:-self.max_files] if self.max_files > 0 else []:
+            old.unlink(missing_ok=True)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict:
+        return {
+            "directory": str(self.directory),
+            "captured": self.captured,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "files_rotated": self.files_rotated,
+        }
@@ -0,0 +1,191 @@
+"""
+Durable in-process work queue for webhook processing
+
+Webhook payloads are journaled to a local SQLite file before the HTTP
+request is acknowledged, then each one is handed to its own task. Jobs
+don't wait for a worker slot: the handler's own limits (the per-sender
+message dispatcher) decide how much runs at once. A journal row is only
+deleted after its job has finished, so anything unfinished when the process
+stops is replayed on next startup.
+
+The queue is bounded by the number of unfinished jobs: at max_size,
+enqueue() raises QueueFullError and the caller should answer 503 +
+Retry-After so Meta redelivers later.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("AgriAI.queue")
+
+
+class QueueFullError(Exception):
+    """Raised when the work queue is at capacity"""
+
+
+class DurableWorkQueue:
+    """Bounded asyncio work queue with a SQLite journal, one task per job"""
+
+    def __init__(
+        self,
+        handler: Callable[[Dict], Awaitable],
+        journal_path: Path,
+        max_size: int = 1000,
+    ):
+        self.handler = handler
+        self.journal_path = Path(journal_path)
+        self.max_size = max_size
+
+        self._jobs: Set[asyncio.Task] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        # All journal I/O runs on one dedicated thread, off the event loop
+        self._io: Optional[ThreadPoolExecutor] = None
+        self._accepting = False
+
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.recovered = 0
+
+    # ------------------------------------------------------------------
+    # Journal (runs on the journal thread)
+    # ------------------------------------------------------------------
+
+    def _open_journal(self) -> List[Tuple[int, str]]:
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.journal_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "payload TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        return self._db.execute("SELECT id, payload FROM jobs ORDER BY id").fetchall()
+
+    def _journal_insert(self, payload: str) -> int:
+        cursor = self._db.execute(
+            "INSERT INTO jobs (payload, enqueued_at) VALUES (?, ?)",
+            (payload, time.time()),
+        )
+        self._db.commit()
+        return cursor.lastrowid
+
+    def _journal_delete(self, job_id: int):
+        self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self._db.commit()
+
+    def _close_journal(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def _run_io(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, func, *args)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """Open the journal and restart unfinished jobs"""
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queue-journal")
+        pending = await self._run_io(self._open_journal)
+
+        for job_id, payload in pending:
+            # Recovered jobs are always accepted, even beyond max_size
+            self._spawn(job_id, json.loads(payload))
+        self.recovered = len(pending)
+        if pending:
+            logger.warning("Recovered %s unprocessed webhook(s) from journal", len(pending))
+
+        self._accepting = True
+        logger.info("Webhook queue started: max size %s, journal %s", self.max_size, self.journal_path)
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Stop accepting work, give running jobs `timeout` seconds to finish,
+        then cancel the rest. Anything left stays in the journal.
+        """
+        self._accepting = False
+        if self._jobs:
+            await asyncio.wait(set(self._jobs), timeout=timeout)
+        if self._jobs:
+            logger.warning(
+                "Webhook queue not drained on shutdown; %s job(s) kept in journal for next start",
+                len(self._jobs)
+            )
+            jobs = list(self._jobs)
+            for task in jobs:
+                task.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+
+        await self._run_io(self._close_journal)
+        self._io.shutdown(wait=True)
+
+    # ------------------------------------------------------------------
+    # Producer / consumer
+    # ------------------------------------------------------------------
+
+    async def enqueue(self, payload: Dict) -> int:
+        """
+        Journal a payload and start processing it
+
+        Raises:
+            QueueFullError: the queue is at max_size (or shutting down)
+        """
+        if not self._accepting or self.depth >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(f"Work queue full ({self.depth}/{self.max_size})")
+
+        job_id = await self._run_io(self._journal_insert, json.dumps(payload))
+        self._spawn(job_id, payload)
+        return job_id
+
+    def _spawn(self, job_id: int, payload: Dict):
+        task = asyncio.create_task(self._run_job(job_id, payload), name=f"webhook-job-{job_id}")
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+
+    async def _run_job(self, job_id: int, payload: Dict):
+        try:
+            await self.handler(payload)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error("Webhook job %s failed: %s", job_id, e)
+
+        # Only forget the job once it has actually run. If it is cancelled
+        # mid-job (shutdown) the row survives and is replayed on restart.
+        try:
+            await self._run_io(self._journal_delete, job_id)
+        except Exception as e:
+            logger.error("Failed to remove job %s from journal: %s", job_id, e)
+
+    # ------------------------------------------------------------------
+    # Introspection
+    # ------------------------------------------------------------------
+
+    @property
+    def depth(self) -> int:
+        """Jobs journaled and not yet finished"""
+        return len(self._jobs)
+
+    def stats(self) -> Dict:
+        return {
+            "depth": self.depth,
+            "max_size": self.max_size,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "recovered": self.recovered,
+        }
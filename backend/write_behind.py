@@ -0,0 +1,296 @@
+"""
+Write-behind buffer for append-only inserts (diagnoses, feedback)
+
+Handlers call add(table, row) and move on; rows are written in bulk by a
+background task when `batch_size` rows are buffered or every
+`flush_interval` seconds, whichever comes first. Tables are always flushed
+in the order given (diagnoses before the feedback rows that reference them).
+
+Rows carry client-generated ids and are written with an idempotent insert,
+so a batch can safely be retried. When the database is unreachable a batch
+is appended to a local JSON-lines spill file instead of being dropped, and
+the spill file is replayed on the next successful flush (and at startup).
+A batch rejected by the database itself (`is_rejection(error)`, e.g. a bad
+foreign key) is retried row by row so a single bad row doesn't block the
+others; any other error, even halfway through that retry, spills the rows
+not yet written. Rows beyond `max_buffered` (flushes not keeping up) are
+spilled straight away rather than held in memory.
+
+Everything still buffered is flushed on stop().
+"""
+
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("AgriAI.writes")
+
+# insert(table, rows) performs one bulk insert
+InsertFunc = Callable[[str, List[Dict]], Awaitable]
+
+
+class WriteBehindBuffer:
+    """Batches inserts per table; spills to disk when the database is down"""
+
+    def __init__(
+        self,
+        insert: InsertFunc,
+        tables: Sequence[str],
+        spill_path: Path,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_buffered: int = 10000,
+        is_rejection: Callable[[Exception], bool] = lambda error: False,
+    ):
+        self.insert = insert
+        self.tables = list(tables)
+        self.spill_path = Path(spill_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        # True for errors meaning "the database rejected these rows", as
+        # opposed to "the database is unreachable or failing"
+        self.is_rejection = is_rejection
+
+        self._buffers: Dict[str, List[Dict]] = {table: [] for table in self.tables}
+        self._buffered = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Spill file I/O runs on one dedicated thread, off the event loop
+        self._io: Optional[ThreadPoolExecutor] = None
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.batches_failed = 0
+        self.rows_rejected = 0
+        self.rows_spilled = 0
+        self.rows_replayed = 0
+
+    # ------------------------------------------------------------------
+    # Spill file (runs on the spill thread)
+    # ------------------------------------------------------------------
+
+    def _append_spill(self, table: str, rows: List[Dict]):
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({"table": table, "row": row}, default=str) + "\n")
+
+    def _read_spill(self) -> Tuple[Dict[str, List[Dict]], int]:
+        """Spilled rows by table, plus the file size they were read from"""
+        spilled: Dict[str, List[Dict]] = {}
+        try:
+            with open(self.spill_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return spilled, 0
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash mid-write
+                continue
+            spilled.setdefault(entry["table"], []).append(entry["row"])
+        return spilled, len(data)
+
+    def _rewrite_spill(self, spilled: Dict[str, List[Dict]], read_size: int):
+        """Replace the first `read_size` bytes of the spill file with `spilled`"""
+        # Rows spilled by add() since the file was read are kept
+        try:
+            with open(self.spill_path, "rb") as f:
+                f.seek(read_size)
+                appended = f.read()
+        except FileNotFoundError:
+            appended = b""
+        if not any(spilled.values()) and not appended:
+            self.spill_path.unlink(missing_ok=True)
+            return
+        temp_path = self.spill_path.with_suffix(".tmp")
+        with open(temp_path, "wb") as f:
+            for table, rows in spilled.items():
+                for row in rows:
+                    f.write((json.dumps({"table": table, "row": row}, default=str) + "\n").encode("utf-8"))
+            f.write(appended)
+        temp_path.replace(self.spill_path)
+
+    async def _run_io(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, func, *args)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def add(self, table: str, row: Dict):
+        """Queue one row for insertion (never blocks)"""
+        self._buffers.setdefault(table, []).append(row)
+        if table not in self.tables:
+            self.tables.append(table)
+        self._buffered += 1
+
+        if self._buffered >= self.max_buffered and self._io is not None:
+            # Flushes aren't keeping up (e.g. a hanging insert): park on disk
+            self._spill_buffers()
+        elif self._wakeup is not None and self._buffered >= self.batch_size:
+            self._wakeup.set()
+
+    def _spill_buffers(self):
+        for table in self.tables:
+            rows = self._buffers.get(table)
+            if rows:
+                self._buffers[table] = []
+                # Queued on the spill thread, so it is ordered with flush()'s I/O
+                self._io.submit(self._append_spill, table, rows).add_done_callback(self._spill_done)
+                self.rows_spilled += len(rows)
+        logger.warning("Write-behind buffer full (%s rows), spilled to %s", self._buffered, self.spill_path)
+        self._buffered = 0
+
+    @staticmethod
+    def _spill_done(future):
+        if future.exception() is not None:
+            logger.error("Failed to spill rows: %s", future.exception())
+
+    async def start(self):
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write-behind")
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+        spilled, _ = await self._run_io(self._read_spill)
+        count = sum(len(rows) for rows in spilled.values())
+        if count:
+            logger.info("Replaying %s spilled row(s) from %s", count, self.spill_path)
+            await self.flush()
+
+    async def stop(self):
+        """Flush everything still buffered, then stop the background task"""
+        if self._task is not None:
+            # Let the loop finish its current flush rather than cancelling
+            # it halfway (rows being written would be lost)
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        if self._flush_lock is not None:
+            await self.flush()
+        if self._io is not None:
+            self._io.shutdown(wait=True)
+            self._io = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Write-behind flush failed: %s", e)
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    async def flush(self):
+        """Write buffered rows (and any spilled rows) to the database now"""
+        async with self._flush_lock:
+            pending = {table: self._buffers[table] for table in self.tables if self._buffers.get(table)}
+            for table in pending:
+                self._buffers[table] = []
+            self._buffered = 0
+
+            # Older spilled rows go first: new feedback may reference them
+            spilled, read_size = await self._run_io(self._read_spill)
+            reachable = await self._replay(spilled, read_size) if read_size else True
+
+            for table in self.tables:
+                rows = pending.get(table)
+                if not rows:
+                    continue
+                unwritten = await self._write(table, rows) if reachable else rows
+                if unwritten:
+                    reachable = False
+                    await self._run_io(self._append_spill, table, unwritten)
+                    self.rows_spilled += len(unwritten)
+                    logger.warning("Spilled %s %s row(s) to %s", len(unwritten), table, self.spill_path)
+
+    async def _replay(self, spilled: Dict[str, List[Dict]], read_size: int) -> bool:
+        """Write spilled rows in table order; False if the database is still down"""
+        remaining: Dict[str, List[Dict]] = {}
+        tables = self.tables + [table for table in spilled if table not in self.tables]
+        for index, table in enumerate(tables):
+            rows = spilled.get(table, [])
+            unwritten = await self._write(table, rows) if rows else []
+            self.rows_replayed += len(rows) - len(unwritten)
+            if unwritten:
+                # Keep table order: nothing after this is replayed yet
+                remaining[table] = unwritten
+                for later in tables[index + 1:]:
+                    if spilled.get(later):
+                        remaining[later] = spilled[later]
+                await self._run_io(self._rewrite_spill, remaining, read_size)
+                return False
+
+        await self._run_io(self._rewrite_spill, {}, read_size)
+        return True
+
+    async def _write(self, table: str, rows: List[Dict]) -> List[Dict]:
+        """Insert rows in batches; returns the rows left unwritten because the database failed"""
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                await self.insert(table, batch)
+                self.rows_written += len(batch)
+                self.batches_written += 1
+                continue
+            except Exception as e:
+                if not self.is_rejection(e):
+                    self.batches_failed += 1
+                    logger.warning("Bulk insert into %s failed: %s", table, e)
+                    return rows[start:]
+                # The database is up but refused the batch: isolate the bad rows
+                logger.warning("Bulk insert into %s rejected (%s), retrying row by row", table, e)
+
+            unwritten = await self._write_rows(table, batch)
+            if unwritten:
+                return unwritten + rows[start + self.batch_size:]
+        return []
+
+    async def _write_rows(self, table: str, rows: List[Dict]) -> List[Dict]:
+        """Insert rows one at a time, dropping rejected ones; returns the unwritten rest on failure"""
+        for index, row in enumerate(rows):
+            try:
+                await self.insert(table, [row])
+                self.rows_written += 1
+            except Exception as e:
+                if not self.is_rejection(e):
+                    self.batches_failed += 1
+                    logger.warning("Row-by-row insert into %s failed: %s", table, e)
+                    return rows[index:]
+                self.rows_rejected += 1
+                logger.error("Dropping %s row %s: %s", table, row.get("id"), e)
+        return []
+
+    def stats(self) -> Dict:
+        return {
+            "buffered": self._buffered,
+            "max_buffered": self.max_buffered,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "avg_batch_size": round(self.rows_written / self.batches_written, 1) if self.batches_written else 0,
+            "batches_failed": self.batches_failed,
+            "rows_rejected": self.rows_rejected,
+            "rows_spilled": self.rows_spilled,
+            "rows_replayed": self.rows_replayed,
+        }
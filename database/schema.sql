@@ -107,6 +107,161 @@ $$ language 'plpgsql';
 CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Precomputed coordinates for users.location
+-- Filled by the backend the first time a location is used, or in bulk by
+-- backend/backfill_coordinates.py. location_geocoded records which location
+-- string the coordinates were resolved from (coordinates stay NULL if the
+-- geocoder didn't know the place).
+ALTER TABLE users ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS location_geocoded TEXT;
+
+-- Users whose location still needs geocoding (used by the backfill job)
+CREATE INDEX IF NOT EXISTS idx_users_location_pending ON users(id)
+    WHERE location IS NOT NULL AND location_geocoded IS NULL;
+
+-- Clear stale coordinates whenever the location text changes
+CREATE OR REPLACE FUNCTION reset_user_coordinates()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.location IS DISTINCT FROM OLD.location
+       AND NEW.location_geocoded IS NOT DISTINCT FROM OLD.location_geocoded THEN
+        NEW.latitude = NULL;
+        NEW.longitude = NULL;
+        NEW.location_geocoded = NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS reset_users_coordinates ON users;
+CREATE TRIGGER reset_users_coordinates BEFORE UPDATE OF location ON users
+    FOR EACH ROW EXECUTE FUNCTION reset_user_coordinates();
+
+-- Redeem a referral code in one round trip
+-- A single UPDATE takes the referrer's row lock, so concurrent redemptions
+-- of the same code are serialized and every one is counted (no lost update
+-- from read-then-write). Returns no row for an unknown code or self-referral.
+CREATE OR REPLACE FUNCTION redeem_referral(code TEXT, referred_phone TEXT)
+RETURNS TABLE (referrer_id UUID, referrer_phone TEXT, referrer_name TEXT, referrals INTEGER)
+AS $$
+    UPDATE users
+    SET referrals = COALESCE(users.referrals, 0) + 1
+    WHERE users.referral_code = UPPER(code)
+      AND users.phone IS DISTINCT FROM referred_phone
+    RETURNING users.id, users.phone, users.name, users.referrals;
+$$ LANGUAGE sql;
+
+-- Maintained counters for the dashboard and /stats
+-- Row counts are kept up to date by statement-level triggers (one counter
+-- update per INSERT/DELETE statement, so bulk inserts from the write-behind
+-- buffer cost a single update), and read in O(1) by get_platform_stats().
+CREATE TABLE IF NOT EXISTS platform_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS daily_diagnosis_counts (
+    day DATE PRIMARY KEY,
+    count BIGINT NOT NULL DEFAULT 0
+);
+
+ALTER TABLE platform_counters ENABLE ROW LEVEL SECURITY;
+ALTER TABLE daily_diagnosis_counts ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all for service role - platform_counters" ON platform_counters
+    FOR ALL USING (true);
+
+CREATE POLICY "Allow all for service role - daily_diagnosis_counts" ON daily_diagnosis_counts
+    FOR ALL USING (true);
+
+CREATE OR REPLACE FUNCTION count_users_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    delta BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO delta FROM inserted_rows;
+    ELSE
+        SELECT -COUNT(*) INTO delta FROM deleted_rows;
+    END IF;
+
+    IF delta <> 0 THEN
+        INSERT INTO platform_counters (name, value) VALUES ('users', delta)
+        ON CONFLICT (name) DO UPDATE SET value = platform_counters.value + EXCLUDED.value;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION count_diagnoses_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO platform_counters (name, value)
+        SELECT 'diagnoses', COUNT(*) FROM inserted_rows HAVING COUNT(*) > 0
+        ON CONFLICT (name) DO UPDATE SET value = platform_counters.value + EXCLUDED.value;
+
+        INSERT INTO daily_diagnosis_counts (day, count)
+        SELECT COALESCE(created_at, NOW())::date, COUNT(*) FROM inserted_rows GROUP BY 1
+        ON CONFLICT (day) DO UPDATE SET count = daily_diagnosis_counts.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO platform_counters (name, value)
+        SELECT 'diagnoses', -COUNT(*) FROM deleted_rows HAVING COUNT(*) > 0
+        ON CONFLICT (name) DO UPDATE SET value = platform_counters.value + EXCLUDED.value;
+
+        UPDATE daily_diagnosis_counts AS daily
+        SET count = daily.count - removed.count
+        FROM (
+            SELECT COALESCE(created_at, NOW())::date AS day, COUNT(*) AS count
+            FROM deleted_rows GROUP BY 1
+        ) AS removed
+        WHERE daily.day = removed.day;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS count_users_insert ON users;
+CREATE TRIGGER count_users_insert AFTER INSERT ON users
+    REFERENCING NEW TABLE AS inserted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_users_changes();
+
+DROP TRIGGER IF EXISTS count_users_delete ON users;
+CREATE TRIGGER count_users_delete AFTER DELETE ON users
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_users_changes();
+
+DROP TRIGGER IF EXISTS count_diagnoses_insert ON diagnoses;
+CREATE TRIGGER count_diagnoses_insert AFTER INSERT ON diagnoses
+    REFERENCING NEW TABLE AS inserted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_diagnoses_changes();
+
+DROP TRIGGER IF EXISTS count_diagnoses_delete ON diagnoses;
+CREATE TRIGGER count_diagnoses_delete AFTER DELETE ON diagnoses
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_diagnoses_changes();
+
+-- Seed the counters from existing rows (re-running recomputes them)
+INSERT INTO platform_counters (name, value)
+VALUES ('users', (SELECT COUNT(*) FROM users)), ('diagnoses', (SELECT COUNT(*) FROM diagnoses))
+ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value;
+
+INSERT INTO daily_diagnosis_counts (day, count)
+SELECT created_at::date, COUNT(*) FROM diagnoses WHERE created_at IS NOT NULL GROUP BY 1
+ON CONFLICT (day) DO UPDATE SET count = EXCLUDED.count;
+
+-- Dashboard numbers in one O(1) call (days are UTC, like created_at)
+CREATE OR REPLACE FUNCTION get_platform_stats()
+RETURNS TABLE (total_users BIGINT, total_diagnoses BIGINT, diagnoses_today BIGINT)
+AS $$
+    SELECT
+        COALESCE((SELECT value FROM platform_counters WHERE name = 'users'), 0),
+        COALESCE((SELECT value FROM platform_counters WHERE name = 'diagnoses'), 0),
+        COALESCE((SELECT count FROM daily_diagnosis_counts
+                  WHERE day = (NOW() AT TIME ZONE 'UTC')::date), 0);
+$$ LANGUAGE sql STABLE;
+
 -- Insert sample data for testing (optional)
 -- Uncomment to add test data
 